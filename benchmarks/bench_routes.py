@@ -0,0 +1,358 @@
+"""Route-level benchmarks over synthetic arcadia_sales.db-shaped databases.
+
+    python benchmarks/bench_routes.py                      # 10k and 100k rows
+    python benchmarks/bench_routes.py --rows 1000000 -n 5
+    python benchmarks/bench_routes.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_routes.py --compare benchmarks/baseline.json
+
+Each database is generated once per size (deterministic seed) and cached in
+--workdir; every run works on a fresh copy of it. Each size is measured in
+its own subprocess, with ARCADIA_DB_PATH pointing the web app at that copy,
+so module-level caches and peak memory don't leak between sizes.
+
+For every route it reports p50/p95 latency, SQL statements per request
+(counted with sqlite3's trace callback on every pooled connection) and the
+peak Python allocation of a single request (tracemalloc, measured in a
+separate pass so it doesn't distort the timings).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBAPP = os.path.join(ROOT, 'webapp')
+sys.path[:0] = [ROOT, WEBAPP]
+
+from create_sales_database import CREATE_TABLE_SQL, COLUMNS, INSERT_SQL  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), 'arcadia_bench')
+SEED = 20240601
+
+# Same shapes as the tables webapp/app.py creates at startup
+PAYMENTS_SQL = """
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sale_rowid INTEGER NOT NULL,
+    paid_date DATE NOT NULL,
+    amount REAL NOT NULL,
+    note TEXT
+)
+"""
+SALES_PEOPLE_SQL = """
+CREATE TABLE IF NOT EXISTS sales_people (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    phone TEXT,
+    email TEXT,
+    address TEXT,
+    title TEXT CHECK(title IN ('Junior Sales Person','Senior Sales Person')),
+    photo_path TEXT,
+    owner_username TEXT
+)
+"""
+
+# 'vasu' is the seeded CRM login, so crm_list and the CRM writes have data
+CRMS = ['vasu'] + [f'crm{i:02d}' for i in range(1, 40)]
+SALE_PEOPLE = [f'Sales Person {i:02d}' for i in range(1, 51)]
+PROJECTS = [f'Project {name}' for name in ('Aster', 'Banyan', 'Cedar', 'Deodar', 'Elm', 'Fig', 'Gulmohar', 'Hibiscus')]
+FACINGS = ['East', 'West', 'North', 'South', 'North-East', 'South-West']
+FIRST = ['Ravi', 'Sita', 'Kiran', 'Anil', 'Priya', 'Suresh', 'Lakshmi', 'Ramesh', 'Divya', 'Prakash', 'Meena', 'Arjun']
+LAST = ['Reddy', 'Rao', 'Sharma', 'Naidu', 'Varma', 'Kumar', 'Gupta', 'Iyer', 'Patel', 'Chowdary']
+NOTES = [None, None, 'Collected by cheque', 'Transferred to escrow', 'Loan sanction pending',
+         'Registration scheduled', 'Corner plot premium', 'Paid in two instalments']
+
+
+def sale_rows(n, rng):
+    start = date.today() - timedelta(days=3 * 365)
+    for s_no in range(1, n + 1):
+        land = rng.randint(120, 600)
+        base = rng.choice((4500, 5200, 5800, 6400, 7000))
+        prem = rng.choice((0, 0, 150000, 300000))
+        tos = 'OTP' if rng.random() < 0.6 else 'R'
+        total = (base + prem) * land
+        received = round(total * rng.uniform(0.05, 0.6), 2)
+        balance = total - received
+        yield dict(
+            s_no=s_no, booking_date=(start + timedelta(days=rng.randrange(3 * 365))).isoformat(),
+            project=rng.choice(PROJECTS), spg_praneeth=rng.choice(('SPG', 'Praneeth')), token=rng.randint(1, 400),
+            buyer_name=f"{rng.choice(FIRST)} {rng.choice(LAST)}", sol=f"SOL-{rng.randint(1, 9999):04d}",
+            type_of_sale=tos, land_sqyards=land, sbua_sqft=land * 13.5, facing=rng.choice(FACINGS),
+            base_sqft_price=base, amenties_and_premiums=prem, total_sale_price=total, amount_received=received,
+            balance_amount=balance,
+            balance_tobe_received_by_plan_approval=balance if tos == 'OTP' else total * 0.20 - balance,
+            notes=rng.choice(NOTES), balance_tobe_received_during_exec=0,
+            sale_person_name=rng.choice(SALE_PEOPLE), crm_name=rng.choice(CRMS),
+        )
+
+
+def build_database(path, rows, chunk_size=20_000):
+    """Generate a sales database with `rows` sales, ~1 payment per sale and 50 sales people per CRM."""
+    rng = random.Random(SEED + rows)
+    tmp = path + '.building'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp, isolation_level=None)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("BEGIN")
+    conn.execute(CREATE_TABLE_SQL)
+    conn.execute(PAYMENTS_SQL)
+    conn.execute(SALES_PEOPLE_SQL)
+    batch, payments = [], []
+    for i, sale in enumerate(sale_rows(rows, rng), start=1):
+        batch.append(tuple(sale[c] for c in COLUMNS))
+        for _ in range(rng.choice((0, 0, 1, 1, 2, 3))):
+            paid = date.fromisoformat(sale['booking_date']) + timedelta(days=rng.randint(1, 180))
+            payments.append((i, paid.isoformat(), float(rng.choice((25000, 50000, 100000, 250000))), None))
+        if len(batch) >= chunk_size:
+            conn.executemany(INSERT_SQL, batch)
+            conn.executemany("INSERT INTO payments(sale_rowid, paid_date, amount, note) VALUES (?,?,?,?)", payments)
+            batch, payments = [], []
+    conn.executemany(INSERT_SQL, batch)
+    conn.executemany("INSERT INTO payments(sale_rowid, paid_date, amount, note) VALUES (?,?,?,?)", payments)
+    conn.executemany(
+        "INSERT INTO sales_people(full_name, phone, title, owner_username) VALUES (?,?,?,?)",
+        [(name, f"98{rng.randint(10000000, 99999999)}", rng.choice(('Junior Sales Person', 'Senior Sales Person')), crm)
+         for crm in CRMS for name in SALE_PEOPLE]
+    )
+    conn.execute("COMMIT")
+    conn.close()
+    # Let the app build its indexes, rollups and search index once, up front
+    run_child(['--prime'], tmp)
+    os.replace(tmp, path)
+
+
+def ensure_database(workdir, rows, rebuild=False):
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, f'sales_{rows}.db')
+    if rebuild or not os.path.exists(path):
+        started = time.perf_counter()
+        print(f"Building {rows:,}-row database at {path} ...", flush=True)
+        build_database(path, rows)
+        print(f"  built in {time.perf_counter() - started:.1f}s", flush=True)
+    return path
+
+
+def run_child(args, db_path):
+    env = dict(os.environ, ARCADIA_DB_PATH=db_path)
+    subprocess.run([sys.executable, os.path.abspath(__file__), *args], env=env, cwd=WEBAPP, check=True)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# --- in the child process -------------------------------------------------
+
+def scenarios(app_module):
+    """(name, role, request-builder) triples; builders return (method, url, form)."""
+    year = str(date.today().year)
+    month = str(date.today().month)
+    rng = random.Random(SEED)
+    vasu_rows = []
+    conn = sqlite3.connect(app_module.DB_PATH)
+    try:
+        vasu_rows = [r[0] for r in conn.execute(
+            "SELECT rowid FROM sale_details WHERE crm_name = 'vasu' ORDER BY rowid LIMIT 500")]
+    finally:
+        conn.close()
+
+    def get(url):
+        return lambda: ('GET', url, None)
+
+    dash = '/admin/dashboard'
+    out = [
+        ('dashboard', 'ADMIN', get(dash)),
+        ('dashboard year+month', 'ADMIN', get(f'{dash}?year={year}&month={month}')),
+        ('dashboard month only', 'ADMIN', get(f'{dash}?year=&month={month}')),
+        ('dashboard crm', 'ADMIN', get(f'{dash}?crm_name=crm03')),
+        ('dashboard sale person', 'ADMIN', get(f'{dash}?sale_person_name=Sales+Person+07')),
+        ('dashboard spg', 'ADMIN', get(f'{dash}?spg_praneeth=Praneeth')),
+        ('dashboard type', 'ADMIN', get(f'{dash}?type_of_sale=R')),
+        ('dashboard search', 'ADMIN', get(f'{dash}?q=lakshmi+iy')),
+        ('dashboard 50 rows', 'ADMIN', get(f'{dash}?limit=50')),
+    ]
+    for col in ('s_no', 'buyer_name', 'project', 'total_sale_price', 'balance_amount', 'crm_name', 'notes'):
+        out.append((f'dashboard sort {col}', 'ADMIN', get(f'{dash}?sort_by={col}&sort_dir=asc')))
+    out += [
+        ('crm_list', 'CRM', get('/crm/list')),
+        ('crm_list sort total', 'CRM', get('/crm/list?sort_by=total_sale_price&sort_dir=desc')),
+        ('crm_list search', 'CRM', get('/crm/list?q=prak')),
+        ('admin_export year', 'ADMIN', get(f'/admin/export?year={year}')),
+        ('admin_export crm', 'ADMIN', get('/admin/export?crm_name=crm03')),
+        ('crm_new POST', 'CRM', lambda: ('POST', '/crm/new', {
+            'booking_date': date.today().isoformat(), 'project': rng.choice(PROJECTS), 'spg_praneeth': 'SPG',
+            'type_of_sale': 'OTP', 'buyer_name': f"{rng.choice(FIRST)} {rng.choice(LAST)}",
+            'land_sqyards': str(rng.randint(120, 600)), 'base_sqft_price': '5800',
+            'sale_person_name': rng.choice(SALE_PEOPLE)})),
+        ('crm_add_payment', 'CRM', lambda: ('POST', f'/crm/edit/{rng.choice(vasu_rows)}/add_payment', {
+            'amount': '1000', 'paid_date': date.today().isoformat()})),
+    ]
+    return out
+
+
+def measure(iterations, result_path):
+    import app as A
+
+    statements = [0]
+
+    def install_counter(dbapi_conn, _):
+        dbapi_conn.set_trace_callback(lambda _sql: statements.__setitem__(0, statements[0] + 1))
+
+    A.event.listen(A.engine, 'connect', install_counter)
+    A.engine.dispose()  # new pooled connections pick up the counter
+
+    clients = {}
+    for role, (user, password) in {'ADMIN': ('admin', 'admin'), 'CRM': ('vasu', 'kaka')}.items():
+        client = A.app.test_client()
+        r = client.post('/login', data={'username': user, 'password': password})
+        assert r.status_code == 302, f"login failed for {user}"
+        clients[role] = client
+
+    def call(client, method, url, form):
+        if method == 'GET':
+            r = client.get(url)
+        else:
+            r = client.post(url, data=form)
+        r.get_data()
+        r.close()
+        assert r.status_code in (200, 302), f"{method} {url} -> {r.status_code}"
+
+    with sqlite3.connect(A.DB_PATH) as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM sale_details").fetchone()[0]
+    results = {}
+    for name, role, build in scenarios(A):
+        client = clients[role]
+        call(client, *build())  # warm-up
+        timings, counts = [], []
+        for _ in range(iterations):
+            req = build()
+            statements[0] = 0
+            started = time.perf_counter()
+            call(client, *req)
+            timings.append((time.perf_counter() - started) * 1000)
+            counts.append(statements[0])
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        call(client, *build())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            'n': iterations,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'sql_per_request': round(statistics.mean(counts), 1),
+            'peak_kb': round(peak / 1024, 1),
+        }
+        r = results[name]
+        print(f"  {name:<32} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+              f"sql {r['sql_per_request']:>6.1f}  peak {r['peak_kb']:>9.1f} KB", flush=True)
+    try:
+        import resource
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        max_rss_kb = None
+    with open(result_path, 'w') as fh:
+        json.dump({'rows': rows, 'max_rss_kb': max_rss_kb, 'routes': results}, fh)
+
+
+def prime():
+    import app  # noqa: F401  (startup builds indexes, rollups, search index)
+
+
+# --- reporting --------------------------------------------------------------
+
+def compare(current, baseline, threshold):
+    """Return a list of regression messages (p95 over threshold x baseline, or more SQL per request)."""
+    problems = []
+    for size, result in current['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if not base:
+            continue
+        for route, now in result['routes'].items():
+            was = base['routes'].get(route)
+            if not was:
+                continue
+            if now['p95_ms'] > was['p95_ms'] * threshold and now['p95_ms'] - was['p95_ms'] > 1.0:
+                problems.append(f"{size} rows, {route}: p95 {was['p95_ms']} -> {now['p95_ms']} ms")
+            # FTS5 runs its own statements, so search routes wobble by a fraction
+            if now['sql_per_request'] - was['sql_per_request'] >= 1:
+                problems.append(f"{size} rows, {route}: SQL/request {was['sql_per_request']} -> {now['sql_per_request']}")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the web app's routes over synthetic databases.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="sale_details sizes to benchmark (default: %(default)s)")
+    parser.add_argument('-n', '--iterations', type=int, default=20, help="timed requests per route (default: %(default)s)")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help="where generated databases are kept (default: %(default)s)")
+    parser.add_argument('--rebuild', action='store_true', help="regenerate the databases even if cached")
+    parser.add_argument('--save-baseline', metavar='PATH', help="write the results to PATH as the new baseline")
+    parser.add_argument('--compare', metavar='PATH', help="compare against a saved baseline; exit 1 on regressions")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="p95 ratio over baseline that counts as a regression (default: %(default)s)")
+    parser.add_argument('--prime', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--measure', metavar='RESULT', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.prime:
+        return prime()
+    if args.measure:
+        return measure(args.iterations, args.measure)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(), 'iterations': args.iterations, 'sizes': {},
+    }
+    for rows in args.rows:
+        pristine = ensure_database(args.workdir, rows, args.rebuild)
+        work = os.path.join(args.workdir, f'run_{rows}.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(work + suffix):
+                os.remove(work + suffix)
+        shutil.copyfile(pristine, work)
+        result_path = os.path.join(args.workdir, f'result_{rows}.json')
+        print(f"{rows:,} rows ({args.iterations} requests per route)", flush=True)
+        run_child(['--measure', result_path, '-n', str(args.iterations)], work)
+        with open(result_path) as fh:
+            report['sizes'][str(rows)] = json.load(fh)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as fh:
+            problems = compare(report, json.load(fh), args.threshold)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Concurrent load test against a locally started web app.
+
+    python benchmarks/load_test.py                                  # 30 CRMs, 3 admins, 20 req/s, 60s
+    python benchmarks/load_test.py --rows 100000 --rate 50 --duration 120
+    python benchmarks/load_test.py --mix crm_new=5,add_payment=3,admin_dashboard=2
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --db arcadia_sales.db \
+        --crm-users vasu --admin-users admin    # an instance you started
+
+Unless --url is given, a copy of the generated benchmark database (see
+bench_routes.py) is made, CRM and ADMIN users are added to it, and
+webapp/app.py is started on it in a threaded server. Every virtual user
+logs in with its own session and issues requests from the operations in
+--mix that its role may perform, on an open-loop schedule (exponential
+gaps) so that together they aim at --rate requests per second. A user that
+falls behind its schedule sends the next request straight away; those
+requests are counted as late.
+
+Reported: throughput, latency percentiles per operation, HTTP errors,
+client timeouts, "database is locked" errors from the server log, and
+duplicate s_no values (handed out twice by crm_new, or present twice in
+sale_details after the run).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import date
+
+from bench_routes import (CRMS, DEFAULT_WORKDIR, FIRST, LAST, PROJECTS, SALE_PEOPLE, SEED, WEBAPP,
+                          ensure_database, percentile)
+
+LOAD_PASSWORD = 'load-test'
+DEFAULT_MIX = 'crm_new=30,crm_edit=20,add_payment=20,admin_dashboard=25,admin_export=5'
+OPERATION_ROLES = {
+    'crm_new': 'CRM', 'crm_edit': 'CRM', 'add_payment': 'CRM',
+    'admin_dashboard': 'ADMIN', 'admin_export': 'ADMIN',
+}
+# Started in place of `python app.py` so the server is threaded and has no reloader
+SERVER_BOOT = (
+    "import sys, app; from werkzeug.serving import run_simple; "
+    "run_simple(sys.argv[1], int(sys.argv[2]), app.app, threaded=True)"
+)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATION_ROLES:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r} (choose from {', '.join(OPERATION_ROLES)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight for {name}: {weight!r}")
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+# --- setup ------------------------------------------------------------------
+
+def prepare_database(args):
+    """Copy the pristine benchmark database and add the load-test users; returns (path, crms, admins)."""
+    pristine = ensure_database(args.workdir, args.rows)
+    path = os.path.join(args.workdir, f'load_{args.rows}.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(pristine, path)
+
+    from werkzeug.security import generate_password_hash
+    password_hash = generate_password_hash(LOAD_PASSWORD, os.environ.get('PASSWORD_HASH_METHOD', 'scrypt'))
+    conn = sqlite3.connect(path)
+    try:
+        # CRM users are the CRMs that own sales in the generated data, so edits have rows to work on
+        crms = [r[0] for r in conn.execute(
+            "SELECT DISTINCT crm_name FROM sale_details ORDER BY crm_name LIMIT ?", (args.crms,))]
+        if len(crms) < args.crms:
+            print(f"Only {len(crms)} CRMs own sales in this database; using {len(crms)} CRM users", flush=True)
+        admins = [f'loadadmin{i:02d}' for i in range(1, args.admins + 1)]
+        conn.executemany(
+            "INSERT INTO users(username, password_hash, role) VALUES (?,?,?) "
+            "ON CONFLICT(username) DO UPDATE SET password_hash = excluded.password_hash, role = excluded.role",
+            [(u, password_hash, 'CRM') for u in crms] + [(u, password_hash, 'ADMIN') for u in admins]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return path, crms, admins
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, log_path):
+    port = free_port()
+    env = dict(os.environ, ARCADIA_DB_PATH=db_path)
+    log = open(log_path, 'w')
+    proc = subprocess.Popen([sys.executable, '-c', SERVER_BOOT, '127.0.0.1', str(port)],
+                            cwd=WEBAPP, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120  # startup may rebuild indexes on a large database
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited during startup; see {log_path}")
+        try:
+            urllib.request.urlopen(url + '/login', timeout=2).close()
+            return proc, url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit(f"Server did not come up within 120s; see {log_path}")
+
+
+def owned_rows(db_path, crms):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        rows = defaultdict(list)
+        for crm in crms:
+            rows[crm] = [r[0] for r in conn.execute(
+                "SELECT rowid FROM sale_details WHERE crm_name = ? ORDER BY rowid LIMIT 200", (crm,))]
+        return rows
+    finally:
+        conn.close()
+
+
+# --- virtual users ----------------------------------------------------------
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.timeouts = Counter()
+        self.late = 0
+        self.s_nos = []
+
+    def record(self, op, status, ms):
+        with self.lock:
+            self.statuses[op][status] += 1
+            if status < 400:
+                self.latencies[op].append(ms)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, username, role, mix, rate, stop_at, stats, rows, timeout, seed):
+        super().__init__(daemon=True, name=f'vu-{username}')
+        self.base_url = base_url
+        self.username = username
+        self.role = role
+        self.ops = [op for op in mix if OPERATION_ROLES[op] == role]
+        self.weights = [mix[op] for op in self.ops]
+        self.rate = rate
+        self.stop_at = stop_at
+        self.stats = stats
+        self.rows = rows
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+        self.login_error = None
+
+    def request(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                while resp.read(65536):
+                    pass
+                return resp.status, None
+        except urllib.error.HTTPError as exc:
+            body = exc.read()
+            exc.close()
+            return exc.code, body
+
+    def login(self):
+        status, _ = self.request('POST', '/login', {'username': self.username, 'password': LOAD_PASSWORD})
+        if status != 302:
+            self.login_error = f"login for {self.username} returned {status}"
+        return status == 302
+
+    def op_crm_new(self):
+        form = {
+            'booking_date': date.today().isoformat(), 'project': self.rng.choice(PROJECTS),
+            'spg_praneeth': self.rng.choice(('SPG', 'Praneeth')), 'type_of_sale': self.rng.choice(('OTP', 'R')),
+            'buyer_name': f"{self.rng.choice(FIRST)} {self.rng.choice(LAST)}",
+            'land_sqyards': str(self.rng.randint(120, 600)), 'base_sqft_price': str(self.rng.choice((5200, 5800, 6400))),
+            'amount_received': str(self.rng.choice((0, 100000, 250000))), 'sale_person_name': self.rng.choice(SALE_PEOPLE),
+        }
+        data = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + '/crm/new', data=data, method='POST')
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                body = json.loads(resp.read() or b'{}')
+                if body.get('ok'):
+                    with self.stats.lock:
+                        self.stats.s_nos.append(body['s_no'])
+                return resp.status
+        except urllib.error.HTTPError as exc:
+            exc.close()
+            return exc.code
+
+    def op_crm_edit(self):
+        if not self.rows:
+            return self.op_crm_new()
+        rowid = self.rng.choice(self.rows)
+        land = self.rng.randint(120, 600)
+        return self.request('POST', f'/crm/edit/{rowid}', {
+            'land_sqyards': str(land), 'base_sqft_price': str(self.rng.choice((5200, 5800, 6400))),
+            'amenties_and_premiums': '0', 'amount_received': str(self.rng.choice((0, 100000))),
+            'type_of_sale': self.rng.choice(('OTP', 'R')), 'notes': 'load test edit',
+        })[0]
+
+    def op_add_payment(self):
+        if not self.rows:
+            return self.op_crm_new()
+        return self.request('POST', f'/crm/edit/{self.rng.choice(self.rows)}/add_payment', {
+            'amount': str(self.rng.choice((10000, 25000, 50000))), 'paid_date': date.today().isoformat(),
+            'note': 'load test'})[0]
+
+    def op_admin_dashboard(self):
+        year = date.today().year - self.rng.randrange(3)
+        params = self.rng.choice(({}, {'year': year}, {'year': year, 'month': self.rng.randint(1, 12)},
+                                  {'crm_name': self.rng.choice(CRMS)},
+                                  {'sort_by': 'total_sale_price', 'sort_dir': 'desc'}))
+        return self.request('GET', '/admin/dashboard?' + urllib.parse.urlencode(params))[0]
+
+    def op_admin_export(self):
+        year = date.today().year - self.rng.randrange(3)
+        return self.request('GET', f'/admin/export?year={year}&month={self.rng.randint(1, 12)}')[0]
+
+    def run(self):
+        if not self.ops or self.rate <= 0:
+            return
+        next_at = time.monotonic() + self.rng.expovariate(self.rate)
+        while True:
+            now = time.monotonic()
+            if next_at >= self.stop_at:
+                return
+            if next_at > now:
+                time.sleep(next_at - now)
+            elif now - next_at > 0.1:
+                with self.stats.lock:
+                    self.stats.late += 1
+            op = self.rng.choices(self.ops, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(self, 'op_' + op)()
+            except (socket.timeout, TimeoutError):
+                with self.stats.lock:
+                    self.stats.timeouts[op] += 1
+                status = None
+            except urllib.error.URLError as exc:
+                if isinstance(exc.reason, (socket.timeout, TimeoutError)):
+                    with self.stats.lock:
+                        self.stats.timeouts[op] += 1
+                    status = None
+                else:
+                    status = 599
+            if status is not None:
+                self.stats.record(op, status, (time.perf_counter() - started) * 1000)
+            next_at = max(next_at + self.rng.expovariate(self.rate), time.monotonic() - 0.1)
+
+
+# --- reporting --------------------------------------------------------------
+
+def duplicate_s_nos(db_path):
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        return conn.execute(
+            "SELECT s_no, COUNT(*) FROM sale_details WHERE s_no IS NOT NULL GROUP BY s_no HAVING COUNT(*) > 1"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def report(stats, elapsed, target_rate, log_path, db_path):
+    total = sum(sum(c.values()) for c in stats.statuses.values())
+    ok = sum(n for c in stats.statuses.values() for status, n in c.items() if status < 400)
+    print(f"\n{total} requests in {elapsed:.1f}s: {total / elapsed:.1f} req/s "
+          f"(target {target_rate:g}), {ok / elapsed:.1f} successful req/s, {stats.late} sent late")
+    print(f"{'operation':<16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}  errors")
+    for op in OPERATION_ROLES:
+        if op not in stats.statuses and op not in stats.timeouts:
+            continue
+        lat = stats.latencies[op]
+        errors = {s: n for s, n in stats.statuses[op].items() if s >= 400}
+        if stats.timeouts[op]:
+            errors['timeout'] = stats.timeouts[op]
+        print(f"{op:<16} {sum(stats.statuses[op].values()):>7} {percentile(lat, 50):>9.1f} {percentile(lat, 95):>9.1f} "
+              f"{percentile(lat, 99):>9.1f} {max(lat, default=0):>9.1f}  {errors or '-'}")
+
+    timeouts = sum(stats.timeouts.values())
+    locked = 0
+    if log_path and os.path.exists(log_path):
+        with open(log_path, errors='replace') as fh:
+            locked = sum(line.count('database is locked') for line in fh)
+    print(f"client timeouts: {timeouts}; 'database is locked' in server log: {locked}")
+
+    handed_out = [s for s, n in Counter(stats.s_nos).items() if n > 1]
+    stored = duplicate_s_nos(db_path) if db_path else []
+    print(f"duplicate s_no: {len(handed_out)} returned twice by crm_new, {len(stored)} duplicated in sale_details")
+    for s_no, n in stored[:10]:
+        print(f"  s_no {s_no} stored {n} times")
+    return 1 if (handed_out or stored or locked or timeouts) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a CRM/ADMIN traffic mix against the web app.")
+    parser.add_argument('--rows', type=int, default=10_000, help="size of the generated database (default: %(default)s)")
+    parser.add_argument('--crms', type=int, default=30, help="CRM virtual users (default: %(default)s)")
+    parser.add_argument('--admins', type=int, default=3, help="ADMIN virtual users (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=20.0, help="target requests per second overall (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of load (default: %(default)s)")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help="operation weights, e.g. %(default)s".replace('%(default)s', DEFAULT_MIX))
+    parser.add_argument('--timeout', type=float, default=30.0, help="per-request client timeout (default: %(default)s)")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help="where databases and the server log go (default: %(default)s)")
+    parser.add_argument('--url', help="test an already running instance instead of starting one")
+    parser.add_argument('--db', help="with --url: that instance's database, for the duplicate s_no check")
+    parser.add_argument('--crm-users', help="with --url: comma-separated CRM logins (password via LOAD_TEST_PASSWORD)")
+    parser.add_argument('--admin-users', help="with --url: comma-separated ADMIN logins")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global LOAD_PASSWORD
+    args = parse_args(argv)
+    proc = log_path = None
+    if args.url:
+        LOAD_PASSWORD = os.environ.get('LOAD_TEST_PASSWORD', LOAD_PASSWORD)
+        url, db_path = args.url.rstrip('/'), args.db
+        crms = [u for u in (args.crm_users or '').split(',') if u]
+        admins = [u for u in (args.admin_users or '').split(',') if u]
+    else:
+        db_path, crms, admins = prepare_database(args)
+        log_path = os.path.join(args.workdir, 'load_server.log')
+        print(f"Starting the app on {db_path} (log: {log_path})", flush=True)
+        proc, url = start_server(db_path, log_path)
+    try:
+        rows = owned_rows(db_path, crms) if db_path else defaultdict(list)
+        weights = {role: sum(w for op, w in args.mix.items() if OPERATION_ROLES[op] == role) for role in ('CRM', 'ADMIN')}
+        total_weight = sum(weights.values()) or 1
+        users = []
+        stats = Stats()
+        for role, names in (('CRM', crms), ('ADMIN', admins)):
+            if not names:
+                continue
+            per_user = args.rate * weights[role] / total_weight / len(names)
+            for name in names:
+                users.append(VirtualUser(url, name, role, args.mix, per_user, 0, stats, rows[name],
+                                         args.timeout, SEED + len(users)))
+        print(f"Logging in {len(crms)} CRM and {len(admins)} ADMIN users", flush=True)
+        for user in users:
+            if not user.login():
+                raise SystemExit(user.login_error)
+        stop_at = time.monotonic() + args.duration
+        for user in users:
+            user.stop_at = stop_at
+        print(f"Running {args.duration:g}s at {args.rate:g} req/s: "
+              + ", ".join(f"{op}={w:g}" for op, w in args.mix.items()), flush=True)
+        started = time.monotonic()
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        return report(stats, time.monotonic() - started, args.rate, log_path, db_path)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,171 +1,481 @@
 import pandas as pd
+import numpy as np
+from openpyxl import load_workbook
 import sqlite3
-from datetime import datetime
+import argparse
+import hashlib
+import json
+import time
 import os
 
-def create_sqlite_database():
-    # File paths
-    excel_file = r'C:\Users\adina\OneDrive\DevSecOps\ArcadiaSales\files\Template.xlsx'
-    db_file = r'C:\Users\adina\OneDrive\DevSecOps\ArcadiaSales\files\arcadia_sales.db'
-    
-    # Read Excel file
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXCEL = os.path.join(BASE_DIR, 'Template.xlsx')
+DEFAULT_DB = os.path.join(BASE_DIR, 'arcadia_sales.db')
+DEFAULT_CHUNK_SIZE = 5000
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS sale_details (
+    s_no INTEGER,
+    booking_date DATE,
+    project TEXT,
+    spg_praneeth TEXT CHECK (spg_praneeth IN ('SPG','Praneeth')),
+    token INTEGER,
+    buyer_name TEXT,
+    sol TEXT,
+    type_of_sale TEXT CHECK (type_of_sale IN ('OTP','R')),
+    land_sqyards INTEGER,
+    sbua_sqft REAL,
+    facing TEXT,
+    base_sqft_price REAL,
+    amenties_and_premiums REAL,
+    total_sale_price REAL,
+    amount_received REAL,
+    balance_amount REAL,
+    balance_tobe_received_by_plan_approval REAL,
+    notes TEXT,
+    balance_tobe_received_during_exec REAL,
+    sale_person_name TEXT,
+    crm_name TEXT
+);
+"""
+
+# Column order of the INSERT below
+COLUMNS = [
+    's_no', 'booking_date', 'project', 'spg_praneeth', 'token', 'buyer_name', 'sol', 'type_of_sale',
+    'land_sqyards', 'sbua_sqft', 'facing', 'base_sqft_price', 'amenties_and_premiums',
+    'total_sale_price', 'amount_received', 'balance_amount',
+    'balance_tobe_received_by_plan_approval', 'notes', 'balance_tobe_received_during_exec',
+    'sale_person_name', 'crm_name'
+]
+INTEGER_COLUMNS = ['token', 'land_sqyards']
+NUMERIC_COLUMNS = ['token', 'land_sqyards', 'sbua_sqft', 'base_sqft_price',
+                   'amenties_and_premiums', 'amount_received',
+                   'balance_tobe_received_during_exec']
+
+INSERT_SQL = f"""
+INSERT INTO sale_details ({', '.join(COLUMNS)})
+VALUES ({','.join('?' * len(COLUMNS))})
+"""
+
+SPG_ALIASES = {
+    'spg': 'SPG', 'SPG': 'SPG', 'Spg': 'SPG',
+    'praneeth': 'Praneeth', 'Praneeth': 'Praneeth', 'PRANEETH': 'Praneeth'
+}
+
+# Per-row import state: the hash of the workbook row last written for each
+# s_no, and the sale_details rowid it was written to. A row listed here is
+# owned by the workbook; every other row was entered through the web app and
+# is never touched by --sync.
+CREATE_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS sale_import_state (
+    s_no INTEGER PRIMARY KEY,
+    row_hash TEXT NOT NULL,
+    sale_rowid INTEGER NOT NULL
+);
+"""
+
+# Balances also count the payments recorded in the web app, so --sync never
+# copies them from the workbook; they are recomputed after the update.
+BALANCE_COLUMNS = ['balance_amount', 'balance_tobe_received_by_plan_approval']
+SYNCED_COLUMNS = [c for c in COLUMNS if c not in BALANCE_COLUMNS]
+UPDATE_SQL = (f"UPDATE sale_details SET {', '.join(c + '=?' for c in SYNCED_COLUMNS)} "
+              "WHERE rowid = ? AND s_no = ?")
+PAID_SQL = "COALESCE((SELECT total FROM payment_totals WHERE sale_rowid = sale_details.rowid), 0)"
+BALANCE_SQL = """
+UPDATE sale_details SET
+    balance_amount = COALESCE(total_sale_price, 0) - (COALESCE(amount_received, 0) + {paid}),
+    balance_tobe_received_by_plan_approval = CASE type_of_sale
+        WHEN 'OTP' THEN COALESCE(total_sale_price, 0) - (COALESCE(amount_received, 0) + {paid})
+        WHEN 'R' THEN COALESCE(total_sale_price, 0) * 0.20
+                      - (COALESCE(total_sale_price, 0) - (COALESCE(amount_received, 0) + {paid}))
+    END
+WHERE rowid = ?
+"""
+
+# Normalized workbook rows, staged in the temp schema before they are applied,
+# with the hash --sync diffs against. Untyped columns keep the Python values
+# exactly as normalized.
+STAGING_SQL = f"CREATE TEMP TABLE sale_staging ({', '.join(COLUMNS)}, row_hash)"
+STAGE_SQL = (f"INSERT INTO temp.sale_staging ({', '.join(COLUMNS)}, row_hash) "
+             f"VALUES ({','.join('?' * (len(COLUMNS) + 1))})")
+
+# Bulk-load settings for the loader's own connection only
+# s_no lookups for rows the import state doesn't track; the same
+# definition the web app manages, so it is not rebuilt there
+S_NO_INDEX_SQL = "CREATE INDEX IF NOT EXISTS ix_sale_details_s_no ON sale_details (s_no)"
+
+LOAD_PRAGMAS = {
+    'synchronous': 'OFF',
+    # staged rows spill to a temp file instead of growing the heap
+    'temp_store': 'FILE',
+    'cache_size': -200000,
+}
+
+
+def normalize_sale_details(df):
+    """Column-wise cleanup and calculated fields for a raw sale_details sheet.
+
+    Returns a new DataFrame with exactly COLUMNS, in insert order.
+    """
+    df = df.copy()
+
+    # Convert date columns to ISO strings (what sqlite3 stores for a date)
+    if 'booking_date' in df.columns:
+        dates = pd.to_datetime(df['booking_date'], errors='coerce')
+        df['booking_date'] = dates.dt.strftime('%Y-%m-%d').where(dates.notna(), None)
+
+    # Normalize allowed-list fields
+    if 'spg_praneeth' in df.columns:
+        df['spg_praneeth'] = df['spg_praneeth'].astype(str).str.strip().replace(SPG_ALIASES)
+    if 'type_of_sale' in df.columns:
+        df['type_of_sale'] = df['type_of_sale'].astype(str).str.strip().str.upper()
+
+    # Ensure buyer_name column exists (map from legacy 'name' if needed)
+    if 'buyer_name' not in df.columns and 'name' in df.columns:
+        df['buyer_name'] = df['name']
+
+    # Ensure every inserted column exists
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+
+    # A blank or non-numeric s_no stays NULL (the loaders report those rows)
+    df['s_no'] = np.trunc(pd.to_numeric(df['s_no'], errors='coerce')).astype('Int64')
+
+    # Convert numeric columns to appropriate types
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    for col in INTEGER_COLUMNS:
+        df[col] = df[col].astype('int64')
+
+    # Calculate fields
+    df['total_sale_price'] = (df['base_sqft_price'] + df['amenties_and_premiums']) * df['land_sqyards']
+    df['balance_amount'] = df['total_sale_price'] - df['amount_received']
+    tos = df['type_of_sale']
+    df['balance_tobe_received_by_plan_approval'] = np.select(
+        [tos == 'OTP', tos == 'R'],
+        [df['balance_amount'], df['total_sale_price'] * 0.20 - df['balance_amount']],
+        default=np.nan
+    )
+    return df[COLUMNS]
+
+
+def frame_rows(df):
+    """Yield insert tuples of plain Python values, with NaN/NaT mapped to None."""
+    values = df.astype(object).where(df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def canonical(row):
+    """Row values as SQLite compares them (5800 == 5800.0), for hashing and diffing."""
+    return tuple(float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else v for v in row)
+
+
+def row_hash(row):
+    return hashlib.sha1(json.dumps(canonical(row), default=str).encode('utf-8')).hexdigest()
+
+
+def table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+
+def bump_import_version(cursor):
+    """Tell a running web app that sale_details changed underneath it."""
+    if table_exists(cursor, 'sequences'):
+        cursor.execute("INSERT OR IGNORE INTO sequences(name, value) VALUES ('import_version', 0)")
+        cursor.execute("UPDATE sequences SET value = value + 1 WHERE name = 'import_version'")
+    if table_exists(cursor, 'data_versions'):
+        # new ETags for pages showing sales, in every worker at once
+        cursor.execute("UPDATE data_versions SET version = version + 1, changed_at = ? WHERE scope = 'sales'", (time.time(),))
+
+
+def open_for_load(db_file):
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    for name, value in LOAD_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def iter_sheet_frames(excel_file, chunk_size=DEFAULT_CHUNK_SIZE, sheet_name='sale_details'):
+    """Yield the sheet as DataFrames of at most chunk_size rows.
+
+    The workbook is opened read-only, so openpyxl parses rows as they are
+    iterated instead of building the whole sheet; peak memory depends on
+    chunk_size, not on the size of the workbook. Blank rows are skipped.
+    """
+    wb = load_workbook(excel_file, read_only=True, data_only=True)
     try:
-        df = pd.read_excel(excel_file, sheet_name='sale_details')
-        print(f"Successfully read Excel file: {excel_file}")
-    except Exception as e:
-        print(f"Error reading Excel file: {e}")
-        return
-
-    # Create SQLite connection
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        # Same names pandas.read_excel would give the header cells
+        names = [str(h).strip() if h is not None else f'Unnamed: {i}' for i, h in enumerate(header)]
+        width = len(names)
+        values = (row[:width] for row in rows if any(v is not None for v in row))
+        for chunk in chunked(values, chunk_size):
+            frame = pd.DataFrame.from_records(chunk, columns=names)
+            # empty cells as NaN, matching read_excel
+            yield frame.where(frame.notna(), np.nan)
+    finally:
+        wb.close()
+
+
+def stage_workbook(conn, excel_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Normalize the workbook batch by batch into temp.sale_staging; returns the row count.
 
-    # Drop and recreate table with constraints to enforce validations
-    drop_table_sql = """
-    DROP TABLE IF EXISTS sale_details;
+    Staging touches only the temp schema (spilled to disk, see LOAD_PRAGMAS),
+    so the slow part of a load runs without holding the database write lock.
     """
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS sale_details (
-        s_no INTEGER,
-        booking_date DATE,
-        project TEXT,
-        spg_praneeth TEXT CHECK (spg_praneeth IN ('SPG','Praneeth')),
-        token INTEGER,
-        buyer_name TEXT,
-        sol TEXT,
-        type_of_sale TEXT CHECK (type_of_sale IN ('OTP','R')),
-        land_sqyards INTEGER,
-        sbua_sqft REAL,
-        facing TEXT,
-        base_sqft_price REAL,
-        amenties_and_premiums REAL,
-        total_sale_price REAL,
-        amount_received REAL,
-        balance_amount REAL,
-        balance_tobe_received_by_plan_approval REAL,
-        notes TEXT,
-        balance_tobe_received_during_exec REAL,
-        sale_person_name TEXT,
-        crm_name TEXT
-    );
+    conn.execute("DROP TABLE IF EXISTS temp.sale_staging")
+    conn.execute(STAGING_SQL)
+    staged = 0
+    conn.execute("BEGIN")
+    try:
+        for frame in iter_sheet_frames(excel_file, chunk_size):
+            rows = [row + (row_hash(row),) for row in frame_rows(normalize_sale_details(frame))]
+            conn.executemany(STAGE_SQL, rows)
+            staged += len(rows)
+        conn.execute("CREATE INDEX temp.ix_sale_staging_s_no ON sale_staging (s_no)")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return staged
+
+
+def report_missing_s_no(conn, limit=20):
+    """Print the staged rows that have no s_no; returns how many there are.
+
+    Rows are numbered as in the sheet (the header is row 1), counting only
+    non-blank rows.
     """
-    
+    cur = conn.execute("SELECT rowid + 1 FROM temp.sale_staging WHERE s_no IS NULL ORDER BY rowid")
+    rows = [r[0] for r in cur.fetchall()]
+    if rows:
+        shown = ', '.join(str(r) for r in rows[:limit]) + (', ...' if len(rows) > limit else '')
+        print(f"Error: {len(rows)} workbook row(s) have no s_no: {shown}")
+    return len(rows)
+
+
+def create_sqlite_database(excel_file=DEFAULT_EXCEL, db_file=DEFAULT_DB, chunk_size=DEFAULT_CHUNK_SIZE):
+    conn = open_for_load(db_file)
+    cursor = conn.cursor()
     try:
-        cursor.execute(drop_table_sql)
-        cursor.execute(create_table_sql)
-        print("Created table 'sale_details'")
-    except Exception as e:
-        print(f"Error creating table: {e}")
+        # Read and normalize the workbook, streaming it in chunk_size batches
+        started = time.perf_counter()
+        try:
+            staged = stage_workbook(conn, excel_file, chunk_size)
+            print(f"Successfully read Excel file: {excel_file} ({staged} rows in {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(f"Error reading Excel file: {e}")
+            return
+        # loaded all the same, with a NULL s_no, so nothing is lost
+        report_missing_s_no(conn)
+
+        # Everything below runs in one transaction
+        load_started = time.perf_counter()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Drop and recreate table with constraints to enforce validations
+            cursor.execute("DROP TABLE IF EXISTS sale_details")
+            cursor.execute(CREATE_TABLE_SQL)
+            print("Created table 'sale_details'")
+            # staging rowids are kept, so the import state below can point at them
+            cursor.execute(f"INSERT INTO sale_details (rowid, {', '.join(COLUMNS)}) "
+                           f"SELECT rowid, {', '.join(COLUMNS)} FROM temp.sale_staging ORDER BY rowid")
+            loaded = cursor.rowcount
+            # built here so the first --sync after a load has nothing to write
+            cursor.execute(S_NO_INDEX_SQL)
+            # every row just loaded belongs to the workbook; a later --sync
+            # starts from here
+            cursor.execute("DROP TABLE IF EXISTS sale_import_state")
+            cursor.execute(CREATE_STATE_SQL)
+            cursor.execute(
+                "INSERT INTO sale_import_state(s_no, row_hash, sale_rowid) "
+                "SELECT s_no, row_hash, rowid FROM temp.sale_staging WHERE rowid IN "
+                "(SELECT MIN(rowid) FROM temp.sale_staging WHERE s_no IS NOT NULL GROUP BY s_no)"
+            )
+            bump_import_version(cursor)
+            cursor.execute("COMMIT")
+            elapsed = time.perf_counter() - load_started
+            rate = loaded / elapsed if elapsed else float(loaded)
+            print(f"Successfully loaded {loaded} rows into 'sale_details' table in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+            # Verify data was inserted
+            cursor.execute("SELECT COUNT(*) FROM sale_details")
+            count = cursor.fetchone()[0]
+            print(f"Verified {count} records in the database")
+        except Exception as e:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            print(f"Error loading data: {e}")
+            return
+    finally:
         conn.close()
-        return
+    print(f"Database created successfully at: {db_file}")
+
+
+def sync_sqlite_database(excel_file=DEFAULT_EXCEL, db_file=DEFAULT_DB, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply only the workbook rows that changed since the last load or sync, keyed by s_no.
 
-    # Insert data into SQLite table
+    Only rows the workbook owns (see CREATE_STATE_SQL) are updated or
+    deleted. They are updated in place so their rowid, the payments linked
+    to it and the balances those payments went into survive. A workbook
+    s_no that clashes with a row entered through the web app is reported
+    and skipped, as are rows without an s_no. An unchanged workbook results
+    in no writes at all.
+    """
+    conn = open_for_load(db_file)
+    cursor = conn.cursor()
     try:
-        # Convert date columns to proper format
-        if 'booking_date' in df.columns:
-            df['booking_date'] = pd.to_datetime(df['booking_date'], errors='coerce').apply(
-                lambda d: d.date() if pd.notnull(d) else None
-            )
-        
-        # Normalize allowed-list fields
-        if 'spg_praneeth' in df.columns:
-            df['spg_praneeth'] = df['spg_praneeth'].astype(str).str.strip().replace({
-                'spg': 'SPG', 'SPG': 'SPG', 'Spg': 'SPG',
-                'praneeth': 'Praneeth', 'Praneeth': 'Praneeth', 'PRANEETH': 'Praneeth'
-            })
-        if 'type_of_sale' in df.columns:
-            df['type_of_sale'] = df['type_of_sale'].astype(str).str.strip().str.upper()
-
-        # Ensure buyer_name column exists (map from legacy 'name' if needed)
-        if 'buyer_name' not in df.columns and 'name' in df.columns:
-            df['buyer_name'] = df['name']
-        if 'buyer_name' not in df.columns:
-            df['buyer_name'] = None
-
-        # Ensure optional new columns exist
-        for opt_col in ['sale_person_name', 'crm_name']:
-            if opt_col not in df.columns:
-                df[opt_col] = None
-
-        # Convert numeric columns to appropriate types
-        numeric_columns = ['s_no', 'token', 'land_sqyards', 'sbua_sqft', 'base_sqft_price',
-                          'amenties_and_premiums', 'amount_received',
-                          'balance_tobe_received_during_exec']
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-        # Calculate fields
-        base = df['base_sqft_price'] if 'base_sqft_price' in df.columns else 0
-        prem = df['amenties_and_premiums'] if 'amenties_and_premiums' in df.columns else 0
-        sbua = df['sbua_sqft'] if 'sbua_sqft' in df.columns else 0
-        land = df['land_sqyards'] if 'land_sqyards' in df.columns else 0
-        amt_received = df['amount_received'] if 'amount_received' in df.columns else 0
-
-        df['total_sale_price'] = (base + prem) * land
-        df['balance_amount'] = df['total_sale_price'] - amt_received
-
-        def compute_plan_approval(row):
-            tos = row.get('type_of_sale', '')
-            if tos == 'OTP':
-                return row['balance_amount']
-            elif tos == 'R':
-                return (row['total_sale_price'] * 0.20) - row['balance_amount']
-            return None
-
-        df['balance_tobe_received_by_plan_approval'] = df.apply(compute_plan_approval, axis=1)
-
-        # Prepare insert
-        insert_sql = """
-        INSERT INTO sale_details (
-            s_no, booking_date, project, spg_praneeth, token, buyer_name, sol, type_of_sale,
-            land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums,
-            total_sale_price, amount_received, balance_amount,
-            balance_tobe_received_by_plan_approval, notes, balance_tobe_received_during_exec,
-            sale_person_name, crm_name
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """
-
-        rows = []
-        for _, r in df.iterrows():
-            rows.append((
-                int(r['s_no']) if not pd.isna(r.get('s_no')) else None,
-                r.get('booking_date'),
-                r.get('project'),
-                r.get('spg_praneeth'),
-                int(r['token']) if not pd.isna(r.get('token')) else None,
-                r.get('buyer_name'),
-                r.get('sol'),
-                r.get('type_of_sale'),
-                int(r['land_sqyards']) if not pd.isna(r.get('land_sqyards')) else None,
-                float(r['sbua_sqft']) if not pd.isna(r.get('sbua_sqft')) else None,
-                r.get('facing'),
-                float(r['base_sqft_price']) if not pd.isna(r.get('base_sqft_price')) else None,
-                float(r['amenties_and_premiums']) if not pd.isna(r.get('amenties_and_premiums')) else None,
-                float(r['total_sale_price']) if not pd.isna(r.get('total_sale_price')) else None,
-                float(r['amount_received']) if not pd.isna(r.get('amount_received')) else None,
-                float(r['balance_amount']) if not pd.isna(r.get('balance_amount')) else None,
-                float(r['balance_tobe_received_by_plan_approval']) if not pd.isna(r.get('balance_tobe_received_by_plan_approval')) else None,
-                r.get('notes'),
-                float(r['balance_tobe_received_during_exec']) if not pd.isna(r.get('balance_tobe_received_during_exec')) else None,
-                r.get('sale_person_name'),
-                r.get('crm_name')
-            ))
-
-        cursor.executemany(insert_sql, rows)
-        print(f"Successfully loaded {len(rows)} rows into 'sale_details' table")
-        
-        # Verify data was inserted
-        cursor.execute("SELECT COUNT(*) FROM sale_details")
-        count = cursor.fetchone()[0]
-        print(f"Verified {count} records in the database")
-        
-    except Exception as e:
-        print(f"Error inserting data: {e}")
+        started = time.perf_counter()
+        try:
+            staged = stage_workbook(conn, excel_file, chunk_size)
+            print(f"Successfully read Excel file: {excel_file} ({staged} rows in {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(f"Error reading Excel file: {e}")
+            return
+
+        sync_started = time.perf_counter()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(CREATE_TABLE_SQL)
+            cursor.execute(CREATE_STATE_SQL)
+            cursor.execute(S_NO_INDEX_SQL)
+            counts = sync_rows(conn, chunk_size)
+            counts['missing'] = report_missing_s_no(conn)
+            if counts['inserted'] or counts['updated'] or counts['deleted']:
+                bump_import_version(cursor)
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            print(f"Error syncing data: {e}")
+            return
     finally:
-        conn.commit()
         conn.close()
-        print(f"Database created successfully at: {db_file}")
+    elapsed = time.perf_counter() - sync_started
+    print(f"Synced 'sale_details' in {elapsed:.2f}s: {counts['inserted']} inserted, {counts['updated']} updated, "
+          f"{counts['deleted']} deleted, {counts['unchanged']} unchanged, {counts['duplicates']} duplicate s_no skipped, "
+          f"{counts['conflicts']} s_no already used by web app rows skipped, {counts['missing']} rows without s_no skipped")
+
+
+def staged_rows(conn, chunk_size=DEFAULT_CHUNK_SIZE):
+    """First staged row for each s_no as (row, row_hash), in workbook order."""
+    cur = conn.execute(
+        f"SELECT {', '.join(COLUMNS)}, row_hash FROM temp.sale_staging WHERE rowid IN "
+        "(SELECT MIN(rowid) FROM temp.sale_staging WHERE s_no IS NOT NULL GROUP BY s_no) ORDER BY rowid"
+    )
+    while True:
+        batch = cur.fetchmany(chunk_size)
+        if not batch:
+            return
+        for staged in batch:
+            yield staged[:-1], staged[-1]
+
+
+def sync_rows(conn, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Diff the staged workbook against sale_import_state and write the changes.
+
+    Works one row at a time against the state table's primary key and
+    flushes writes every chunk_size rows, so memory stays flat however
+    large the workbook is.
+    """
+    cursor = conn.cursor()
+    counts = dict(inserted=0, updated=0, deleted=0, unchanged=0, duplicates=0, conflicts=0)
+    cursor.execute("SELECT COUNT(s_no) - COUNT(DISTINCT s_no) FROM temp.sale_staging")
+    counts['duplicates'] = cursor.fetchone()[0]
+
+    payment_tables = [t for t in ('payments', 'payment_totals') if table_exists(cursor, t)]
+    balance_sql = BALANCE_SQL.format(paid=PAID_SQL if table_exists(cursor, 'payment_totals') else '0')
+    select_state = "SELECT row_hash, sale_rowid FROM sale_import_state WHERE s_no = ?"
+    select_other = "SELECT 1 FROM sale_details WHERE s_no = ? LIMIT 1"
+    synced = [COLUMNS.index(c) for c in SYNCED_COLUMNS]
+    updates, new_state, conflicts = [], [], []
+
+    def flush():
+        cursor.executemany(UPDATE_SQL, updates)
+        cursor.executemany(balance_sql, [(u[-2],) for u in updates])
+        cursor.executemany("INSERT OR REPLACE INTO sale_import_state(s_no, row_hash, sale_rowid) VALUES (?,?,?)", new_state)
+        counts['updated'] += len(updates)
+        updates.clear()
+        new_state.clear()
+
+    for row, h in staged_rows(conn, chunk_size):
+        s_no = row[0]
+        cursor.execute(select_state, (s_no,))
+        known = cursor.fetchone()
+        if known is not None:
+            if known[0] == h:
+                counts['unchanged'] += 1
+            else:
+                updates.append(tuple(row[i] for i in synced) + (known[1], s_no))
+                new_state.append((s_no, h, known[1]))
+        else:
+            # s_no the workbook never wrote: insert, unless a web app row has it
+            cursor.execute(select_other, (s_no,))
+            if cursor.fetchone() is None:
+                cursor.execute(INSERT_SQL, row)
+                new_state.append((s_no, h, cursor.lastrowid))
+                counts['inserted'] += 1
+            else:
+                counts['conflicts'] += 1
+                if len(conflicts) < 20:
+                    conflicts.append(s_no)
+        if len(new_state) >= chunk_size:
+            flush()
+    flush()
+    if conflicts:
+        shown = ', '.join(str(s) for s in conflicts) + (', ...' if counts['conflicts'] > len(conflicts) else '')
+        print(f"Error: {counts['conflicts']} workbook s_no value(s) are already used by rows entered in the web app: {shown}")
+
+    # Workbook rows whose s_no has left the workbook, with their payments
+    while True:
+        cursor.execute(
+            "SELECT s_no, sale_rowid FROM sale_import_state "
+            "WHERE s_no NOT IN (SELECT s_no FROM temp.sale_staging WHERE s_no IS NOT NULL) LIMIT ?", (chunk_size,)
+        )
+        gone = cursor.fetchall()
+        if not gone:
+            break
+        owned = [(rowid, rowid, s_no) for s_no, rowid in gone]
+        # only where the sale row is still the one the workbook wrote
+        for table in payment_tables:
+            cursor.executemany(f"DELETE FROM {table} WHERE sale_rowid = ? AND EXISTS "
+                               "(SELECT 1 FROM sale_details WHERE rowid = ? AND s_no = ?)", owned)
+        cursor.executemany("DELETE FROM sale_details WHERE rowid = ? AND s_no = ?", [(rowid, s_no) for s_no, rowid in gone])
+        cursor.executemany("DELETE FROM sale_import_state WHERE s_no = ?", [(s_no,) for s_no, _ in gone])
+        counts['deleted'] += len(gone)
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load the sale_details sheet of an Excel workbook into SQLite.")
+    parser.add_argument('excel', nargs='?', default=DEFAULT_EXCEL, help="workbook path (default: %(default)s)")
+    parser.add_argument('db', nargs='?', default=DEFAULT_DB, help="SQLite database path (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows per read and write batch (default: %(default)s)")
+    parser.add_argument('--sync', action='store_true',
+                        help="apply only changed rows (keyed by s_no) instead of dropping and reloading the table")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    create_sqlite_database()
+    args = parse_args()
+    if args.sync:
+        sync_sqlite_database(args.excel, args.db, args.chunk_size)
+    else:
+        create_sqlite_database(args.excel, args.db, args.chunk_size)
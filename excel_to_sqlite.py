@@ -1,68 +1,25 @@
-import sqlite3
-import pandas as pd
+import argparse
 from pathlib import Path
 
-def create_sqlite_database(excel_path, db_path):
-    # Read the Excel file
-    try:
-        df = pd.read_excel(excel_path, sheet_name='sale_details')
-        print(f"Successfully read Excel file: {excel_path}")
-    except Exception as e:
-        print(f"Error reading Excel file: {e}")
-        return
+from create_sales_database import DEFAULT_CHUNK_SIZE, sync_sqlite_database
 
-    # Create SQLite database and connect
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+BASE_DIR = Path(__file__).resolve().parent
 
-    # Create table with specified schema
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS sale_details (
-        s_no INTEGER,
-        booking_date DATE,
-        project TEXT,
-        spg_praneeth TEXT,
-        token INTEGER,
-        name TEXT,
-        sol TEXT,
-        type_of_sale TEXT,
-        land_sqyards INTEGER,
-        sbua_sqft REAL,
-        facing TEXT,
-        base_sqft_price REAL,
-        amenties_and_premiums REAL,
-        total_sale_price REAL,
-        amount_received REAL,
-        balance_amount REAL,
-        balance_tobe_received_by_plan_approval REAL,
-        notes TEXT,
-        balance_tobe_received_during_exec REAL
-    )
-    """
 
-    try:
-        cursor.execute(create_table_sql)
-        print("Created 'sale_details' table in SQLite database")
-    except Exception as e:
-        print(f"Error creating table: {e}")
-        conn.close()
-        return
+def create_sqlite_database(excel_path, db_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Incremental sync keyed by s_no: only changed rows are written, and rows
+    # entered through the web app (and their payments) are left alone.
+    # Legacy workbooks with a 'name' column are mapped to buyer_name.
+    sync_sqlite_database(str(excel_path), str(db_path), chunk_size)
 
-    # Write the data to SQLite
-    try:
-        df.to_sql('sale_details', conn, if_exists='replace', index=False)
-        print(f"Successfully loaded {len(df)} rows into SQLite database")
-    except Exception as e:
-        print(f"Error writing to database: {e}")
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
-    # Define paths
-    base_dir = Path(r"C:\Users\adina\OneDrive\DevSecOps\ArcadiaSales\files")
-    excel_file = base_dir / "Template.xlsx"
-    db_file = base_dir / "arcadia_sales.db"
-    
-    print(f"Starting conversion from {excel_file} to {db_file}")
-    create_sqlite_database(excel_file, db_file)
+    parser = argparse.ArgumentParser(description="Sync the sale_details sheet of an Excel workbook into SQLite.")
+    parser.add_argument('excel', nargs='?', default=BASE_DIR / "Template.xlsx", type=Path)
+    parser.add_argument('db', nargs='?', default=BASE_DIR / "arcadia_sales.db", type=Path)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    print(f"Starting conversion from {args.excel} to {args.db}")
+    create_sqlite_database(args.excel, args.db, args.chunk_size)
     print("Conversion completed successfully!")
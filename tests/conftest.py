@@ -0,0 +1,54 @@
+import importlib
+import os
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBAPP = os.path.join(ROOT, 'webapp')
+sys.path[:0] = [ROOT]
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """webapp/app.py imported once against a fresh database loaded from Template.xlsx."""
+    import create_sales_database as loader
+    tmp = tmp_path_factory.mktemp('app')
+    db = str(tmp / 'arcadia_sales.db')
+    loader.create_sqlite_database(os.path.join(ROOT, 'Template.xlsx'), db)
+    os.environ.update({
+        'ARCADIA_DB_PATH': db,
+        'SNAPSHOT_DIR': str(tmp / 'snapshots'),
+        'EXPORT_JOB_DIR': str(tmp / 'exports'),
+        'SLOW_QUERY_LOG': str(tmp / 'slow_queries.log'),
+        'IMPORT_CHECK_INTERVAL': '0',
+    })
+    sys.path.insert(0, WEBAPP)
+    module = importlib.import_module('app')
+    module.app.config['TESTING'] = True
+    return module
+
+
+@pytest.fixture
+def db(app_module):
+    conn = sqlite3.connect(app_module.DB_PATH, isolation_level=None)
+    yield conn
+    conn.close()
+
+
+def login(client, username, password):
+    client.get('/logout')
+    resp = client.post('/login', data={'username': username, 'password': password})
+    assert resp.status_code == 302
+    return client
+
+
+@pytest.fixture
+def crm(app_module):
+    return login(app_module.app.test_client(), 'vasu', 'kaka')
+
+
+@pytest.fixture
+def admin(app_module):
+    return login(app_module.app.test_client(), 'admin', 'admin')
@@ -0,0 +1,55 @@
+"""Negotiated gzip in compress_response."""
+import gzip
+import zlib
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_gzip_only_when_accepted(crm):
+    plain = crm.get('/crm/list', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    packed = crm.get('/crm/list', headers=GZIP)
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert gzip.decompress(packed.get_data()) == plain.get_data()
+
+
+def test_gzipped_etag_is_weak(crm):
+    plain = crm.get('/crm/list', headers={'Accept-Encoding': 'identity'})
+    packed = crm.get('/crm/list', headers=GZIP)
+    assert not plain.headers['ETag'].startswith('W/')
+    assert packed.headers['ETag'] == 'W/' + plain.headers['ETag']
+
+
+def test_small_bodies_are_left_alone(app_module, crm, monkeypatch):
+    monkeypatch.setattr(app_module, 'COMPRESS_MIN_SIZE', 10 ** 9)
+    resp = crm.get('/crm/list', headers=GZIP)
+    assert 'Content-Encoding' not in resp.headers
+    assert b'</html>' in resp.get_data()
+
+
+def test_xlsx_is_left_alone(crm):
+    resp = crm.get('/crm/export?format=xlsx', headers=GZIP)
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_data()[:2] == b'PK'
+    resp.close()
+
+
+def test_streamed_export_decompresses_to_the_same_bytes(crm):
+    plain = crm.get('/crm/export', headers={'Accept-Encoding': 'identity'})
+    packed = crm.get('/crm/export', headers=GZIP)
+    assert packed.is_streamed and packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in packed.headers
+    assert gzip.decompress(packed.get_data()) == plain.get_data()
+    plain.close()
+    packed.close()
+
+
+def test_each_streamed_chunk_is_flushed(app_module):
+    out = app_module.gzip_stream(None, [b'first batch\n', b'second batch\n'])
+    z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # the first chunk decodes completely before the next one is produced
+    assert z.decompress(next(out)) == b'first batch\n'
+    assert z.decompress(next(out)) == b'second batch\n'
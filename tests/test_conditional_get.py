@@ -0,0 +1,49 @@
+"""ETag / Last-Modified on the listing pages, driven by data_versions."""
+from test_sequences import NEW_SALE
+
+
+def revalidate(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+    return etag, client.get(url, headers={'If-None-Match': etag})
+
+
+def test_unchanged_page_is_not_modified(crm):
+    etag, again = revalidate(crm, '/crm/list')
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert again.get_data() == b''
+
+
+def test_etag_depends_on_query_and_user(crm, admin):
+    assert crm.get('/crm/list').headers['ETag'] != crm.get('/crm/list?sort_by=s_no').headers['ETag']
+    assert admin.get('/admin/entries').headers['ETag'] != crm.get('/crm/list').headers['ETag']
+
+
+def test_app_write_changes_etag(crm):
+    etag, _ = revalidate(crm, '/crm/list')
+    crm.post('/crm/new', data=NEW_SALE)
+    resp = crm.get('/crm/list', headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_other_worker_write_changes_etag(crm, db):
+    etag, _ = revalidate(crm, '/crm/list')
+    # what another process's write route (or an import) commits
+    db.execute("UPDATE data_versions SET version = version + 1, changed_at = changed_at + 1 WHERE scope = 'sales'")
+    assert crm.get('/crm/list', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_options_change_only_bumps_options(admin, db):
+    before = dict(db.execute("SELECT scope, version FROM data_versions"))
+    admin.post('/admin/options', data={'kind': 'spg', 'value': 'Test option', 'action': 'add'})
+    after = dict(db.execute("SELECT scope, version FROM data_versions"))
+    assert after['options'] == before['options'] + 1
+    assert after['sales'] == before['sales']
+
+
+def test_no_per_row_change_triggers(app_module, db):
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_change_%'").fetchone()[0] == 0
@@ -0,0 +1,22 @@
+"""Deleting a sale takes its payments with it."""
+from test_sequences import NEW_SALE
+
+
+def test_delete_removes_payments(crm, db):
+    s_no = crm.post('/crm/new', data=NEW_SALE).get_json()['s_no']
+    rowid = db.execute("SELECT rowid FROM sale_details WHERE s_no = ?", (s_no,)).fetchone()[0]
+    crm.post(f'/crm/edit/{rowid}/add_payment', data={'amount': '250', 'paid_date': '2025-11-01'})
+    assert db.execute("SELECT total FROM payment_totals WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 250
+
+    crm.post(f'/crm/delete/{rowid}')
+    assert db.execute("SELECT COUNT(*) FROM sale_details WHERE rowid = ?", (rowid,)).fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM payments WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM payment_totals WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 0
+
+
+def test_delete_of_someone_elses_sale_keeps_payments(crm, db):
+    db.execute("INSERT INTO sale_details(s_no, crm_name, total_sale_price) VALUES (9100, 'someone', 1000)")
+    rowid = db.execute("SELECT rowid FROM sale_details WHERE s_no = 9100").fetchone()[0]
+    db.execute("INSERT INTO payments(sale_rowid, paid_date, amount) VALUES (?, '2025-11-01', 10)", (rowid,))
+    crm.post(f'/crm/delete/{rowid}')
+    assert db.execute("SELECT COUNT(*) FROM payments WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 1
@@ -0,0 +1,79 @@
+"""Background export jobs: submit, poll, download, share and expire."""
+import io
+import json
+import os
+import time
+import zipfile
+
+
+def wait_done(client, status_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(status_url).get_json()
+        if status['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_lifecycle(admin, app_module):
+    resp = admin.post('/admin/export/jobs?format=csv&year=2025')
+    assert resp.status_code == 202
+    job = resp.get_json()
+    assert job['status'] in ('queued', 'running', 'done')
+
+    status = wait_done(admin, job['status_url'])
+    assert status['status'] == 'done' and status['progress'] == 1.0
+    assert status['rows'] == status['total']
+    download = admin.get(status['download_url'])
+    assert download.status_code == 200
+    assert download.headers['Content-Disposition'].startswith('attachment')
+    assert download.get_data(as_text=True).splitlines()[0].startswith('S.No,')
+    download.close()
+
+    # the same request reuses the finished job
+    again = admin.post('/admin/export/jobs?format=csv&year=2025').get_json()
+    assert again['id'] == job['id'] and again['status'] == 'done'
+    # a different one does not
+    assert admin.post('/admin/export/jobs?format=csv&year=2024').get_json()['id'] != job['id']
+
+
+def test_state_is_shared_through_disk(admin, app_module):
+    # a job submitted by another worker process is only on disk
+    job_id = 'a' * 40
+    path = os.path.join(app_module.EXPORT_JOB_DIR, job_id + '.csv')
+    with open(path, 'w') as fh:
+        fh.write('S.No\n')
+    state = {'id': job_id, 'format': 'csv', 'status': 'done', 'rows': 0, 'total': 0, 'error': None,
+             'created': time.time(), 'finished': time.time(), 'updated': time.time(),
+             'path': path, 'download_name': 'other.csv'}
+    with open(os.path.join(app_module.EXPORT_JOB_DIR, job_id + '.json'), 'w') as fh:
+        json.dump(state, fh)
+    assert admin.get(f'/admin/export/jobs/{job_id}').get_json()['status'] == 'done'
+    resp = admin.get(f'/admin/export/jobs/{job_id}/download')
+    assert resp.status_code == 200
+    resp.close()
+
+
+def test_status_expires_old_jobs(admin, app_module, monkeypatch):
+    job = admin.post('/admin/export/jobs?format=csv&year=2023').get_json()
+    wait_done(admin, job['status_url'])
+    monkeypatch.setattr(app_module, 'EXPORT_JOB_TTL', 0.0)
+    time.sleep(0.01)
+    assert admin.get(job['status_url']).status_code == 404
+    assert not os.path.exists(os.path.join(app_module.EXPORT_JOB_DIR, job['id'] + '.json'))
+    assert not os.path.exists(os.path.join(app_module.EXPORT_JOB_DIR, job['id'] + '.csv'))
+
+
+def test_unknown_job(admin):
+    assert admin.get('/admin/export/jobs/' + 'f' * 40).status_code == 404
+    assert admin.get('/admin/export/jobs/..%2Fsecrets').status_code == 404
+
+
+def test_xlsx_export_freezes_the_header_row(admin):
+    resp = admin.get('/admin/export?format=xlsx&year=2025')
+    assert resp.status_code == 200
+    book = zipfile.ZipFile(io.BytesIO(resp.get_data()))
+    sheet = book.read('xl/worksheets/sheet1.xml').decode('utf-8')
+    assert '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"' in sheet
+    assert '<t>S.No</t>' in sheet
+    resp.close()
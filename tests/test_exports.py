@@ -0,0 +1,83 @@
+"""CSV and .xlsx export contents."""
+import csv
+from datetime import datetime
+from io import BytesIO, StringIO
+
+import pytest
+from openpyxl import load_workbook
+
+HEADER = [
+    'S.No', 'Booking Date', 'Project', 'SPG/Praneeth', 'Token', 'Buyer Name', 'Sale Person Name', 'CRM Name', 'SOL',
+    'Type of Sale', 'Land (sq yards)', 'SBUA (sq feet)', 'Facing', 'Base sq ft price', 'Amenities and Premiums',
+    'Total Sale Price', 'Amount Received', 'Balance Amount', 'Balance to be received by plan approval', 'Notes',
+    'Balance to be received during execution'
+]
+COLUMNS = ("s_no, booking_date, project, spg_praneeth, token, buyer_name, sale_person_name, crm_name, sol, "
+           "type_of_sale, land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums, "
+           "total_sale_price, amount_received, balance_amount, balance_tobe_received_by_plan_approval, notes, "
+           "balance_tobe_received_during_exec")
+
+
+@pytest.fixture
+def export_rows(db):
+    db.execute("DELETE FROM sale_details WHERE s_no BETWEEN 9600 AND 9699")
+    for i, (date, price) in enumerate([('2025-04-01', 1234567.891), (None, None), ('2025-04-01', 0),
+                                       ('2024-01-31', 99.5), ('2025-05-09', '12,000')]):
+        db.execute("INSERT INTO sale_details(s_no, crm_name, booking_date, buyer_name, notes, total_sale_price, "
+                   "amount_received, balance_amount) VALUES (?, 'vasu', ?, ?, ?, ?, 1000, ?)",
+                   (9600 + i, date, f'Export, "buyer" {i}', 'line one\nline two' if i == 1 else None, price, -5))
+    yield
+    db.execute("DELETE FROM sale_details WHERE s_no BETWEEN 9600 AND 9699")
+
+
+def buffered_csv(db, crm_name):
+    """The export as it was built before streaming: whole result set, then one write."""
+    rows = db.execute(f"SELECT {COLUMNS} FROM sale_details WHERE crm_name = ? "
+                      "ORDER BY (booking_date IS NULL) ASC, booking_date DESC, s_no DESC", (crm_name,)).fetchall()
+    text = StringIO()
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    for r in rows:
+        r = list(r)
+        for idx in (13, 14, 15, 16, 17, 18, 20):
+            try:
+                x = float(r[idx] or 0)
+            except Exception:
+                x = 0.0
+            r[idx] = f"$ {x:,.2f}"
+        writer.writerow(r)
+    return text.getvalue()
+
+
+def test_streamed_csv_matches_the_buffered_export(app_module, crm, db, export_rows, monkeypatch):
+    # several batches, so batch boundaries are covered too
+    monkeypatch.setattr(app_module, 'EXPORT_BATCH_SIZE', 2)
+    resp = crm.get('/crm/export', headers={'Accept-Encoding': 'identity'})
+    assert resp.is_streamed and resp.mimetype == 'text/csv'
+    body = resp.get_data(as_text=True)
+    resp.close()
+    assert body == buffered_csv(db, 'vasu')
+    rows = list(csv.reader(StringIO(body)))
+    assert rows[0] == HEADER
+    first = next(r for r in rows if r[0] == '9600')
+    assert first[15] == '$ 1,234,567.89' and first[16] == '$ 1,000.00' and first[17] == '$ -5.00'
+    assert next(r for r in rows if r[0] == '9601')[15] == '$ 0.00'
+
+
+def test_xlsx_cells_are_typed(app_module, crm, export_rows):
+    resp = crm.get('/crm/export?format=xlsx')
+    ws = load_workbook(BytesIO(resp.get_data()))['Sales']
+    resp.close()
+    rows = {r[0].value: r for r in ws.iter_rows(min_row=2)}
+    assert [c.value for c in ws[1]] == HEADER and ws['A1'].font.b
+
+    first = rows[9600]
+    assert first[1].value == datetime(2025, 4, 1) and first[1].number_format == app_module.XLSX_DATE_FORMAT
+    assert first[5].value == 'Export, "buyer" 0'
+    for idx, value in ((15, 1234567.891), (16, 1000), (17, -5)):
+        assert first[idx].value == pytest.approx(value)
+        assert first[idx].number_format == app_module.XLSX_CURRENCY_FORMAT
+    # missing dates stay empty, missing amounts become 0 in currency format
+    assert rows[9601][1].value is None and rows[9601][15].value == 0
+    assert rows[9601][15].number_format == app_module.XLSX_CURRENCY_FORMAT
+    assert rows[9601][19].value == 'line one\nline two'
@@ -0,0 +1,24 @@
+"""Managed indexes survive a full reload and leave other indexes alone."""
+import os
+
+import create_sales_database as loader
+from conftest import ROOT
+
+
+def index_names(db):
+    return {r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+def test_unmanaged_index_is_kept(app_module, db):
+    db.execute("CREATE INDEX ix_sale_details_custom ON sale_details (facing)")
+    app_module.ensure_indexes()
+    assert 'ix_sale_details_custom' in index_names(db)
+    db.execute("DROP INDEX ix_sale_details_custom")
+
+
+def test_full_reload_restores_indexes(app_module, admin, db):
+    loader.create_sqlite_database(os.path.join(ROOT, 'Template.xlsx'), app_module.DB_PATH)
+    assert 'ix_sale_details_crm_booking' not in index_names(db)
+    # the next request notices the new import_version
+    assert admin.get('/admin/entries').status_code == 200
+    assert set(app_module.MANAGED_INDEXES) <= index_names(db)
@@ -0,0 +1,65 @@
+"""/metrics access control, exposition output and the cursor fast path."""
+import pytest
+
+
+@pytest.fixture
+def metrics(app_module):
+    return app_module.metrics
+
+
+def scrape(client):
+    resp = client.get('/metrics')
+    assert resp.status_code == 200
+    assert resp.content_type.startswith('text/plain; version=0.0.4')
+    return resp.get_data(as_text=True)
+
+
+def test_requires_admin_or_token(app_module, crm, monkeypatch):
+    assert app_module.app.test_client().get('/metrics').status_code == 403
+    assert crm.get('/metrics').status_code == 403
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'secret')
+    client = app_module.app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_records_requests_after_first_scrape(admin):
+    text = scrape(admin)
+    assert '# TYPE arcadia_http_request_duration_seconds histogram' in text
+    assert 'arcadia_db_pool_size' in text
+
+    resp = admin.get('/admin/export')
+    resp.get_data()
+    resp.close()
+    text = scrape(admin)
+    assert 'arcadia_http_requests_total{endpoint="admin_export",method="GET",status="200"} 1' in text
+    assert 'arcadia_http_request_sql_statements_count{endpoint="admin_export"} 1' in text
+    assert 'arcadia_sql_statement_duration_seconds_count{kind="SELECT"}' in text
+    # the export streams its rows with fetchmany
+    assert 'arcadia_sql_statement_duration_seconds_count{kind="FETCH"}' in text
+    for line in text.splitlines():
+        assert line.startswith('#') or ' ' in line
+
+
+def test_cursor_skips_timing_when_nothing_needs_it(app_module, metrics, monkeypatch):
+    slow_queries = app_module.slow_queries
+    calls = []
+    monkeypatch.setattr(metrics, '_last_scrape', [None])
+    monkeypatch.setattr(slow_queries, 'SLOW_QUERY_SECONDS', None)
+    monkeypatch.setattr(metrics, 'timed', lambda *args, **kw: calls.append(args))
+    conn = app_module.engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM sale_details")
+        cur.fetchall()
+    finally:
+        conn.close()
+    assert calls == []
+
+    monkeypatch.setattr(slow_queries, 'SLOW_QUERY_SECONDS', 10.0)
+    conn = app_module.engine.raw_connection()
+    try:
+        conn.cursor().execute("SELECT 1")
+    finally:
+        conn.close()
+    assert len(calls) == 1
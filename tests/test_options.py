@@ -0,0 +1,37 @@
+"""Cached option lists and the admin options page."""
+import pytest
+
+
+def options(app_module, table='spg_options'):
+    with app_module.app.test_request_context('/'):
+        return app_module.get_options(table), app_module.is_valid_option(table, 'Cache test SPG')
+
+
+@pytest.fixture
+def clean_option(db):
+    db.execute("DELETE FROM spg_options WHERE value = 'Cache test SPG'")
+    yield 'Cache test SPG'
+    db.execute("DELETE FROM spg_options WHERE value = 'Cache test SPG'")
+
+
+def test_admin_changes_apply_immediately(app_module, admin, clean_option):
+    assert not options(app_module)[1]
+
+    admin.post('/admin/options', data={'kind': 'spg', 'action': 'add', 'value': clean_option})
+    listed, valid = options(app_module)
+    assert clean_option in listed and valid
+    assert clean_option in admin.get('/admin/options').get_data(as_text=True)
+
+    admin.post('/admin/options', data={'kind': 'spg', 'action': 'delete', 'value': clean_option})
+    listed, valid = options(app_module)
+    assert clean_option not in listed and not valid
+
+
+def test_cache_follows_the_version_not_the_table(app_module, db, clean_option):
+    before = options(app_module)[0]
+    # a write that doesn't bump the version is not seen until the TTL passes...
+    db.execute("INSERT INTO spg_options(value) VALUES (?)", (clean_option,))
+    assert options(app_module)[0] == before
+    # ...while another worker's bump is seen on the next request
+    db.execute("UPDATE data_versions SET version = version + 1 WHERE scope = 'options'")
+    assert clean_option in options(app_module)[0]
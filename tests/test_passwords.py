@@ -0,0 +1,58 @@
+"""Password hashing: rehash on login and the bounded hashing pool."""
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+
+@pytest.fixture
+def legacy_user(app_module, db):
+    db.execute("DELETE FROM users WHERE username = 'legacy'")
+    db.execute("INSERT INTO users(username, password_hash, role) VALUES ('legacy', ?, 'CRM')",
+               (generate_password_hash('old-secret', 'pbkdf2:sha256:1000'),))
+    yield 'legacy'
+    db.execute("DELETE FROM users WHERE username = 'legacy'")
+
+
+@pytest.fixture
+def saturated_pool(app_module, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(app_module, '_hash_slots', slots)
+
+
+def stored_hash(db, username):
+    return db.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+def test_login_rehashes_an_old_method(app_module, db, legacy_user):
+    client = app_module.app.test_client()
+    resp = client.post('/login', data={'username': legacy_user, 'password': 'old-secret'})
+    assert resp.status_code == 302
+    new_hash = stored_hash(db, legacy_user)
+    assert new_hash.startswith(app_module.PASSWORD_HASH_METHOD + ':')
+    assert not app_module.needs_rehash(new_hash)
+    client.get('/logout')
+    assert client.post('/login', data={'username': legacy_user, 'password': 'old-secret'}).status_code == 302
+
+
+def test_saturated_pool_turns_logins_away(app_module, saturated_pool):
+    resp = app_module.app.test_client().post('/login', data={'username': 'vasu', 'password': 'kaka'})
+    assert resp.status_code == 503
+
+
+def test_slow_hash_times_out(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'PASSWORD_HASH_TIMEOUT', 0.01)
+    monkeypatch.setattr(app_module, 'check_password_hash', lambda stored, password: time.sleep(0.2) or True)
+    resp = app_module.app.test_client().post('/login', data={'username': 'vasu', 'password': 'kaka'})
+    assert resp.status_code == 503
+
+
+def test_user_forms_hash_on_the_pool(app_module, admin, db, saturated_pool):
+    admin.post('/admin/crms/new', data={'username': 'poolcheck', 'password': 'pw', 'role': 'CRM'})
+    assert db.execute("SELECT COUNT(*) FROM users WHERE username = 'poolcheck'").fetchone()[0] == 0
+
+    uid, before = db.execute("SELECT id, password_hash FROM users WHERE username = 'vasu'").fetchone()
+    admin.post(f'/admin/crms/{uid}/edit', data={'password': 'changed', 'role': 'CRM'})
+    assert stored_hash(db, 'vasu') == before
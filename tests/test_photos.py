@@ -0,0 +1,54 @@
+"""Sales-person photos: thumbnail, original while pending, placeholder on failure."""
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def uploads(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'THUMB_DIR', str(tmp_path / 'thumbs'))
+    return tmp_path
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new('RGB', (400, 300), 'red').save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def add_person(crm, db, full_name, data, filename):
+    crm.post('/crm/sales_people/new', data={'full_name': full_name, 'photo': (io.BytesIO(data), filename)},
+             content_type='multipart/form-data')
+    pid, path = db.execute("SELECT id, photo_path FROM sales_people WHERE full_name = ?", (full_name,)).fetchone()
+    return f'/crm/sales_people/{pid}/photo/{path}'
+
+
+def test_thumbnail(uploads, crm, db):
+    resp = crm.get(add_person(crm, db, 'Photo Thumb', png_bytes(), 'me.png'))
+    assert resp.status_code == 200 and resp.mimetype == 'image/jpeg'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert max(Image.open(io.BytesIO(resp.get_data())).size) <= 160
+
+
+def test_original_while_pending(uploads, app_module, crm, db, monkeypatch):
+    monkeypatch.setattr(app_module, 'queue_thumbnail', lambda name: None)
+    data = png_bytes()
+    resp = crm.get(add_person(crm, db, 'Photo Pending', data, 'me.png'))
+    assert resp.status_code == 200 and resp.mimetype == 'image/png'
+    assert resp.headers['Cache-Control'] == 'no-store'
+    assert resp.get_data() == data
+
+
+def test_failure_is_recorded_not_retried(uploads, app_module, crm, db, monkeypatch):
+    url = add_person(crm, db, 'Photo Broken', b'not an image', 'notes.txt')
+    resp = crm.get(url)
+    assert resp.status_code == 200 and resp.mimetype == 'image/svg+xml'
+    assert list((uploads / 'thumbs').glob('*.failed'))
+
+    submitted = []
+    monkeypatch.setattr(app_module._thumb_pool, 'submit', lambda *a: submitted.append(a))
+    assert crm.get(url).mimetype == 'image/svg+xml'
+    assert submitted == []
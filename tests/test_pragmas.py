@@ -0,0 +1,55 @@
+"""SQLite connection settings from the environment."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import WEBAPP
+
+
+@pytest.mark.parametrize('name,value', [
+    ('SQLITE_JOURNAL_MODE', 'WAL; DROP TABLE users'),
+    ('SQLITE_SYNCHRONOUS', '7'),
+    ('SQLITE_TEMP_STORE', 'disk'),
+    ('SQLITE_CACHE_SIZE', '-2000 -- x'),
+])
+def test_bad_pragma_values_stop_startup(tmp_path, name, value):
+    env = dict(os.environ, ARCADIA_DB_PATH=str(tmp_path / 'any.db'), SLOW_QUERY_LOG=str(tmp_path / 'slow.log'))
+    env[name] = value
+    result = subprocess.run([sys.executable, '-c', 'import app'], cwd=WEBAPP, env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert f'ValueError: {name}=' in result.stderr
+
+
+def test_diagnostics_report_effective_settings(admin):
+    body = admin.get('/admin/diagnostics').get_json()
+    assert body['effective']['journal_mode'] == 'wal'
+    assert body['configured']['synchronous'] == 'NORMAL'
+    assert 'database' not in body
+
+
+def effective(app_module):
+    conn = app_module.engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        return {name: cur.execute(f"PRAGMA {name}").fetchone()[0] for name in app_module.SQLITE_PRAGMAS}
+    finally:
+        conn.close()
+
+
+def test_defaults_apply_to_pooled_connections(app_module):
+    assert effective(app_module) == {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000,
+                                     'cache_size': -20000, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 2}
+
+
+def test_environment_overrides(tmp_path):
+    env = dict(os.environ, ARCADIA_DB_PATH=str(tmp_path / 'any.db'), SLOW_QUERY_LOG=str(tmp_path / 'slow.log'),
+               SQLITE_SYNCHRONOUS='full', SQLITE_CACHE_SIZE='-1234', SQLITE_TEMP_STORE='1', SQLITE_BUSY_TIMEOUT_MS='750',
+               SQLITE_MMAP_SIZE='')
+    script = ("import app\nconn = app.engine.raw_connection()\n"
+              "print([conn.execute(f'PRAGMA {n}').fetchone()[0] for n in ('synchronous', 'cache_size', 'temp_store', 'busy_timeout', 'mmap_size')])")
+    result = subprocess.run([sys.executable, '-c', script], cwd=WEBAPP, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    # an empty value leaves SQLite's default (no memory mapping) in place
+    assert result.stdout.strip().splitlines()[-1] == '[2, -1234, 1, 750, 0]'
@@ -0,0 +1,59 @@
+"""Dashboard KPI rollups stay equal to a fresh GROUP BY through every kind of write."""
+import os
+
+import create_sales_database as loader
+from conftest import ROOT
+from test_sequences import NEW_SALE
+
+
+def assert_rollups_match(app_module, db):
+    keys = ', '.join(app_module.ROLLUP_KEYS)
+    measures = "COUNT(*), ROUND(SUM(total_sale_price), 2), ROUND(SUM(amount_received), 2), ROUND(SUM(balance_amount), 2)"
+    expected = db.execute(
+        f"SELECT {keys}, {measures} FROM ({app_module.ROLLUP_SELECT}) GROUP BY {keys} ORDER BY {keys}").fetchall()
+    rolled = db.execute(
+        f"SELECT {keys}, sale_count, ROUND(total_sale_price, 2), ROUND(amount_received, 2), ROUND(balance_amount, 2) "
+        f"FROM sale_rollups ORDER BY {keys}").fetchall()
+    assert rolled == expected
+
+
+def test_rollups_follow_app_writes(app_module, crm, db):
+    assert_rollups_match(app_module, db)
+    s_no = crm.post('/crm/new', data=NEW_SALE).get_json()['s_no']
+    rowid = db.execute("SELECT rowid FROM sale_details WHERE s_no = ?", (s_no,)).fetchone()[0]
+    assert_rollups_match(app_module, db)
+
+    # moves the sale to another month and type
+    crm.post(f'/crm/edit/{rowid}', data=dict(NEW_SALE, booking_date='2025-08-20', type_of_sale='R',
+                                             amount_received='300'))
+    assert db.execute("SELECT type_of_sale FROM sale_details WHERE rowid = ?", (rowid,)).fetchone()[0] == 'R'
+    assert_rollups_match(app_module, db)
+
+    crm.post(f'/crm/edit/{rowid}/add_payment', data={'amount': '125.5', 'paid_date': '2025-11-01'})
+    crm.post(f'/crm/edit/{rowid}/add_payment', data={'amount': '74.5', 'paid_date': '2025-11-02'})
+    assert db.execute("SELECT total FROM payment_totals WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 200
+    assert_rollups_match(app_module, db)
+
+    crm.post(f'/crm/delete/{rowid}')
+    assert_rollups_match(app_module, db)
+
+
+def test_rollups_follow_an_import(app_module, admin, db):
+    loader.create_sqlite_database(os.path.join(ROOT, 'Template.xlsx'), app_module.DB_PATH)
+    # the next request notices the new import_version and rebuilds
+    assert admin.get('/admin/dashboard').status_code == 200
+    assert db.execute("SELECT COALESCE(SUM(sale_count), 0) FROM sale_rollups").fetchone()[0] == \
+        db.execute("SELECT COUNT(*) FROM sale_details").fetchone()[0]
+    assert_rollups_match(app_module, db)
+
+
+def test_kpis_follow_the_search(app_module, db):
+    db.execute("INSERT INTO sale_details(s_no, crm_name, buyer_name, booking_date, total_sale_price) "
+               "VALUES (9500, 'vasu', 'Kestrel Umber', '2025-03-03', 1234)")
+    try:
+        with app_module.app.test_request_context('/'):
+            kpis, breakdowns = app_module.rollup_summary(None, None, None, None, None, None, 'kestrel')
+        assert kpis['count'] == 1 and kpis['total_sale_price'] == 1234
+        assert [row[:2] for row in breakdowns['month']] == [('2025-03', 1)]
+    finally:
+        db.execute("DELETE FROM sale_details WHERE s_no = 9500")
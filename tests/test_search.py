@@ -0,0 +1,70 @@
+"""Full-text search: the trigger-maintained index, query building and the search forms."""
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def searchable(db):
+    db.execute("DELETE FROM sale_details WHERE s_no = 9400")
+    db.execute("INSERT INTO sale_details(s_no, crm_name, buyer_name, notes) "
+               "VALUES (9400, 'vasu', 'Zanzibar Quill', 'near the lake')")
+    yield 9400
+    db.execute("DELETE FROM sale_details WHERE s_no = 9400")
+
+
+def found(client, q):
+    resp = client.get('/crm/list', query_string={'q': q})
+    assert resp.status_code == 200
+    return b'Quill' in resp.data
+
+
+def test_insert_is_searchable(crm, searchable):
+    assert found(crm, 'zanzi')
+    assert found(crm, 'quill zanzibar')
+    assert not found(crm, 'zanzibar lagoon')
+
+
+def test_update_replaces_the_indexed_text(crm, db, searchable):
+    db.execute("UPDATE sale_details SET buyer_name = 'Orinoco Quill' WHERE s_no = 9400")
+    assert not found(crm, 'zanzi')
+    assert found(crm, 'orinoco')
+    # a column the search doesn't cover leaves the index alone
+    db.execute("UPDATE sale_details SET facing = 'East' WHERE s_no = 9400")
+    assert found(crm, 'orinoco')
+
+
+def test_delete_removes_the_row_from_the_index(crm, db, searchable):
+    db.execute("DELETE FROM sale_details WHERE s_no = 9400")
+    assert not found(crm, 'zanzi')
+    assert db.execute("SELECT COUNT(*) FROM sale_search WHERE sale_search MATCH '\"zanzibar\"*'").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize('q', ['"', '""zanzibar', 'zanzibar*', '*', 'NEAR(zanzibar quill)', 'zanzibar NEAR quill',
+                               '-zanzibar', 'zanzibar -quill', 'zanzibar OR nothing', 'NOT quill', 'buyer_name:zanzibar',
+                               '^zanzibar', '(zanzibar', 'zanzibar AND'])
+def test_query_syntax_is_treated_as_text(app_module, crm, searchable, q):
+    match = app_module.search_match(q)
+    # only quoted prefix terms ever reach MATCH
+    assert all(term.startswith('"') and term.endswith('"*') for term in match.split())
+    resp = crm.get('/crm/list', query_string={'q': q})
+    assert resp.status_code == 200
+
+
+def test_operators_are_plain_words(crm, searchable):
+    # "near" is in the notes, so NEAR must not act as an operator
+    assert found(crm, 'zanzibar near')
+    # and a leading - doesn't exclude
+    assert found(crm, 'zanzibar -quill')
+    assert not found(crm, 'zanzibar OR nothing')
+
+
+@pytest.mark.parametrize('path', ['/crm/list', '/admin/entries'])
+def test_search_form_keeps_sort_and_limit(app_module, path):
+    client = login(app_module.app.test_client(), *(('admin', 'admin') if 'admin' in path else ('vasu', 'kaka')))
+    page = client.get(path, query_string={'sort_by': 's_no', 'sort_dir': 'asc', 'limit': 25}).get_data(as_text=True)
+    form = page[page.index('class="inline search"'):]
+    form = form[:form.index('</form>')]
+    assert '<input type="hidden" name="sort_by" value="s_no">' in form
+    assert '<input type="hidden" name="sort_dir" value="asc">' in form
+    assert '<input type="hidden" name="limit" value="25">' in form
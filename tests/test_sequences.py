@@ -0,0 +1,29 @@
+"""s_no allocation, and starting the app on a database nothing was imported into."""
+import os
+import subprocess
+import sys
+
+from conftest import WEBAPP
+
+NEW_SALE = {'booking_date': '2025-10-01', 'project': 'P', 'spg_praneeth': 'SPG', 'type_of_sale': 'OTP',
+            'buyer_name': 'Sequence test', 'land_sqyards': '100', 'base_sqft_price': '10'}
+
+
+def test_new_sales_get_consecutive_numbers(crm, db):
+    first = crm.post('/crm/new', data=NEW_SALE).get_json()['s_no']
+    second = crm.post('/crm/new', data=NEW_SALE).get_json()['s_no']
+    assert second == first + 1
+    assert db.execute("SELECT MAX(s_no) FROM sale_details").fetchone()[0] == second
+
+
+def test_counter_catches_up_with_rows_written_elsewhere(crm, db):
+    # e.g. an import that has not been noticed yet
+    top = db.execute("SELECT MAX(s_no) FROM sale_details").fetchone()[0] + 1000
+    db.execute("INSERT INTO sale_details(s_no, crm_name) VALUES (?, 'vasu')", (top,))
+    assert crm.post('/crm/new', data=NEW_SALE).get_json()['s_no'] == top + 1
+
+
+def test_starts_on_empty_database(tmp_path):
+    env = dict(os.environ, ARCADIA_DB_PATH=str(tmp_path / 'empty.db'), SLOW_QUERY_LOG=str(tmp_path / 'slow.log'))
+    result = subprocess.run([sys.executable, '-c', 'import app'], cwd=WEBAPP, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
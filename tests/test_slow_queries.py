@@ -0,0 +1,35 @@
+"""Slow statements are charged to the endpoint that caused them, streamed or not."""
+import pytest
+
+from test_export_jobs import wait_done
+
+
+@pytest.fixture
+def slow_queries(app_module, monkeypatch):
+    module = app_module.slow_queries
+    monkeypatch.setattr(module, 'SLOW_QUERY_SECONDS', 0.0)
+    module.reset()
+    yield module
+    module.reset()
+
+
+def export_endpoints(app_module, slow_queries):
+    """Endpoints recorded for the export SELECT itself."""
+    prefix = slow_queries.normalize(f"SELECT {app_module.EXPORT_COLUMNS} FROM sale_details")
+    return {e for shape in slow_queries.worst_shapes(limit=1000) if shape['sql'].startswith(prefix)
+            for e in shape['endpoints']}
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'xlsx'])
+def test_streamed_exports_keep_their_endpoint(app_module, admin, slow_queries, fmt):
+    resp = admin.get(f'/admin/export?format={fmt}')
+    resp.get_data()
+    resp.close()
+    assert export_endpoints(app_module, slow_queries) == {'admin_export'}
+
+
+def test_background_jobs_keep_the_submitting_endpoint(app_module, admin, slow_queries):
+    job = admin.post('/admin/export/jobs?format=csv&q=slowquerytest').get_json()
+    assert wait_done(admin, job['status_url'])['status'] == 'done'
+    assert export_endpoints(app_module, slow_queries) == {'admin_export_jobs'}
+    assert slow_queries.current_endpoint() is None
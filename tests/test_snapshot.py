@@ -0,0 +1,56 @@
+"""Parquet snapshots: triggers from startup, streamed partitions, reloads."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import create_sales_database as loader
+from conftest import ROOT, WEBAPP
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def snapshot(app_module, out, **kw):
+    conn = app_module.engine.raw_connection()
+    try:
+        return app_module.write_snapshot(conn, str(out), **kw)
+    finally:
+        conn.close()
+
+
+def test_app_imports_from_any_directory(tmp_path):
+    env = dict(os.environ, ARCADIA_DB_PATH=str(tmp_path / 'any.db'), SLOW_QUERY_LOG=str(tmp_path / 'slow.log'))
+    code = f"import runpy; runpy.run_path({os.path.join(WEBAPP, 'app.py')!r}, run_name='arcadia')"
+    result = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_triggers_installed_at_startup(app_module, db):
+    names = {r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_snapshot_%'")}
+    assert 'trg_snapshot_sale_insert' in names and 'trg_snapshot_payment_insert' in names
+
+
+def test_incremental_and_streamed(app_module, db, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys.modules[app_module.write_snapshot.__module__], 'BATCH_ROWS', 2)
+    db.execute("INSERT INTO sale_details(s_no, booking_date, crm_name) VALUES (8001, '2019-03-01', 'vasu'), "
+               "(8002, '2019-04-01', 'vasu'), (8003, '2019-05-01', 'vasu')")
+    first = snapshot(app_module, tmp_path)
+    assert '2019' in first['written']
+    part = tmp_path / 'sale_details' / 'booking_year=2019' / 'part-0.parquet'
+    meta = pq.ParquetFile(part).metadata
+    assert meta.num_rows == 3 and meta.num_row_groups == 2
+
+    assert snapshot(app_module, tmp_path)['written'] == []
+    db.execute("UPDATE sale_details SET notes = 'changed' WHERE s_no = 8002")
+    assert snapshot(app_module, tmp_path)['written'] == ['2019']
+
+
+def test_full_reload_rewrites_everything(app_module, admin, db, tmp_path):
+    snapshot(app_module, tmp_path)
+    loader.create_sqlite_database(os.path.join(ROOT, 'Template.xlsx'), app_module.DB_PATH)
+    # the next request reinstalls the triggers the reload dropped
+    admin.get('/admin/entries')
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'trg_snapshot_sale_insert'").fetchone()[0] == 1
+    result = snapshot(app_module, tmp_path)
+    assert result['unchanged'] == 0 and result['written']
@@ -0,0 +1,67 @@
+"""Fingerprinted static assets and their encoding variants."""
+import gzip
+import os
+import re
+
+import pytest
+
+from conftest import WEBAPP
+
+
+def app_js():
+    with open(os.path.join(WEBAPP, 'static', 'app.js'), 'rb') as fh:
+        return fh.read()
+
+
+@pytest.fixture
+def app_js_url(app_module):
+    with app_module.app.test_request_context('/'):
+        return app_module.url_for('static', filename='app.js')
+
+
+def test_url_for_gives_the_fingerprinted_name(app_js_url):
+    assert re.fullmatch(r'/static/app\.[0-9a-f]{12}\.js', app_js_url)
+
+
+def test_identity(app_module, app_js_url):
+    resp = app_module.app.test_client().get(app_js_url, headers={'Accept-Encoding': 'identity'})
+    assert resp.status_code == 200 and resp.get_data() == app_js()
+    assert 'Content-Encoding' not in resp.headers
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+
+def test_gzip(app_module, app_js_url):
+    resp = app_module.app.test_client().get(app_js_url, headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(resp.get_data()) == app_js()
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert 'Accept-Encoding' in resp.headers['Vary']
+
+
+def test_brotli(app_module, app_js_url):
+    client = app_module.app.test_client()
+    if app_module.brotli is None:
+        # no br variant was built: br-only clients get identity, others gzip
+        assert 'Content-Encoding' not in client.get(app_js_url, headers={'Accept-Encoding': 'br'}).headers
+        assert client.get(app_js_url, headers={'Accept-Encoding': 'br, gzip'}).headers['Content-Encoding'] == 'gzip'
+        return
+    resp = client.get(app_js_url, headers={'Accept-Encoding': 'br, gzip'})
+    assert resp.headers['Content-Encoding'] == 'br'
+    assert app_module.brotli.decompress(resp.get_data()) == app_js()
+
+
+def test_variants_revalidate_separately(app_module, app_js_url):
+    client = app_module.app.test_client()
+    etag = client.get(app_js_url, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    assert client.get(app_js_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}).status_code == 304
+    assert client.get(app_js_url, headers={'Accept-Encoding': 'identity', 'If-None-Match': etag}).status_code == 200
+
+
+def test_unfingerprinted_name_falls_back_to_flask(app_module):
+    client = app_module.app.test_client()
+    resp = client.get('/static/app.js')
+    assert resp.status_code == 200 and resp.get_data() == app_js()
+    assert 'immutable' not in resp.headers.get('Cache-Control', '')
+    resp.close()
+    assert client.get('/static/missing.js').status_code == 404
@@ -0,0 +1,141 @@
+"""create_sales_database.py: full load, then --sync against app-side writes."""
+import sqlite3
+
+import pytest
+from openpyxl import Workbook
+
+import create_sales_database as loader
+
+HEADER = ['s_no', 'booking_date', 'project', 'spg_praneeth', 'buyer_name', 'crm_name', 'type_of_sale',
+          'land_sqyards', 'base_sqft_price', 'amount_received', 'notes']
+
+
+def sale(s_no, price=1000, received=100000, notes=None, buyer=None):
+    return [s_no, '2025-01-15', 'P', 'SPG', buyer or f'Buyer {s_no}', 'vasu', 'OTP', 200, price, received, notes]
+
+
+def write_workbook(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'sale_details'
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'sales.db')
+    loader.create_sqlite_database(write_workbook(tmp_path / 'load.xlsx', [sale(1), sale(2), sale(3)]), path)
+    conn = sqlite3.connect(path)
+    # the web app's payment tables (see ensure_payments_table in webapp/app.py)
+    conn.executescript("""
+        CREATE TABLE payments (id INTEGER PRIMARY KEY AUTOINCREMENT, sale_rowid INTEGER NOT NULL,
+                               paid_date DATE NOT NULL, amount REAL NOT NULL, note TEXT);
+        CREATE TABLE payment_totals (sale_rowid INTEGER PRIMARY KEY, total REAL NOT NULL DEFAULT 0,
+                                     payment_count INTEGER NOT NULL DEFAULT 0);
+    """)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def sync(tmp_path, db, rows):
+    loader.sync_sqlite_database(write_workbook(tmp_path / 'sync.xlsx', rows), db)
+    conn = sqlite3.connect(db)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def add_payment(db, s_no, amount):
+    conn = sqlite3.connect(db)
+    rowid, total, received = conn.execute(
+        "SELECT rowid, total_sale_price, amount_received FROM sale_details WHERE s_no = ?", (s_no,)).fetchone()
+    conn.execute("INSERT INTO payments(sale_rowid, paid_date, amount) VALUES (?, '2025-02-01', ?)", (rowid, amount))
+    conn.execute("INSERT INTO payment_totals(sale_rowid, total, payment_count) VALUES (?, ?, 1)", (rowid, amount))
+    conn.execute("UPDATE sale_details SET balance_amount = ? WHERE rowid = ?", (total - received - amount, rowid))
+    conn.commit()
+    conn.close()
+    return rowid
+
+
+def test_full_load_owns_its_rows(db):
+    conn = sqlite3.connect(db)
+    state = conn.execute("SELECT s_no, sale_rowid FROM sale_import_state ORDER BY s_no").fetchall()
+    rows = conn.execute("SELECT s_no, rowid FROM sale_details ORDER BY s_no").fetchall()
+    assert state == rows == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_unchanged_workbook_writes_nothing(tmp_path, db):
+    watcher = sqlite3.connect(db)
+    # the web app's change counters (see ensure_data_versions and ensure_sequences in webapp/app.py)
+    watcher.execute("CREATE TABLE data_versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL, changed_at REAL)")
+    watcher.execute("INSERT INTO data_versions VALUES ('sales', 7, 0)")
+    watcher.execute("CREATE TABLE sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    watcher.execute("INSERT INTO sequences VALUES ('import_version', 3)")
+    watcher.commit()
+
+    def snapshot():
+        return (watcher.execute("PRAGMA data_version").fetchone()[0],
+                watcher.execute("SELECT s_no, sale_rowid, row_hash FROM sale_import_state ORDER BY s_no").fetchall(),
+                watcher.execute("SELECT name, value FROM sequences ORDER BY name").fetchall(),
+                watcher.execute("SELECT version FROM data_versions").fetchall())
+    before = snapshot()
+    sync(tmp_path, db, [sale(1), sale(2), sale(3)]).close()
+    assert snapshot() == before
+
+    # while a real change does register on the same connection
+    sync(tmp_path, db, [sale(1), sale(2, notes='changed'), sale(3)]).close()
+    after = snapshot()
+    assert after[0] != before[0] and after[1] != before[1]
+    assert after[2] == [('import_version', 4)] and after[3] == [(8,)]
+    watcher.close()
+
+
+def test_sync_keeps_web_app_rows(tmp_path, db):
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO sale_details(s_no, buyer_name, crm_name) VALUES (4, 'Entered in app', 'vasu')")
+    conn.commit()
+    conn.close()
+
+    conn = sync(tmp_path, db, [sale(1), sale(2), sale(3), sale(4, buyer='From workbook')])
+    assert [r['buyer_name'] for r in conn.execute("SELECT buyer_name FROM sale_details WHERE s_no = 4")] == ['Entered in app']
+    assert conn.execute("SELECT COUNT(*) FROM sale_import_state WHERE s_no = 4").fetchone()[0] == 0
+
+    # and a row the workbook never had is not deleted either
+    conn = sync(tmp_path, db, [sale(1), sale(2), sale(3)])
+    assert conn.execute("SELECT COUNT(*) FROM sale_details WHERE s_no = 4").fetchone()[0] == 1
+
+
+def test_update_preserves_payment_balance(tmp_path, db):
+    rowid = add_payment(db, 2, 50000)
+
+    conn = sync(tmp_path, db, [sale(1), sale(2, notes='called back'), sale(3)])
+    row = conn.execute("SELECT rowid, notes, total_sale_price, balance_amount FROM sale_details WHERE s_no = 2").fetchone()
+    assert row['rowid'] == rowid and row['notes'] == 'called back'
+    assert row['balance_amount'] == 200 * 1000 - 100000 - 50000
+
+    # a price change is applied on top of the payments already made
+    conn = sync(tmp_path, db, [sale(1), sale(2, price=1500, notes='called back'), sale(3)])
+    row = conn.execute("SELECT balance_amount, balance_tobe_received_by_plan_approval FROM sale_details "
+                       "WHERE s_no = 2").fetchone()
+    assert row[0] == row[1] == 200 * 1500 - 100000 - 50000
+
+
+def test_delete_removes_payments(tmp_path, db):
+    rowid = add_payment(db, 3, 25000)
+    conn = sync(tmp_path, db, [sale(1), sale(2)])
+    assert conn.execute("SELECT COUNT(*) FROM sale_details WHERE s_no = 3").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM payments WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM payment_totals WHERE sale_rowid = ?", (rowid,)).fetchone()[0] == 0
+
+
+def test_blank_s_no_is_reported(tmp_path, db, capsys):
+    conn = sync(tmp_path, db, [sale(1), sale(2), sale(3), sale(None, buyer='No number')])
+    assert 'have no s_no: 5' in capsys.readouterr().out
+    assert conn.execute("SELECT COUNT(*) FROM sale_details WHERE buyer_name = 'No number'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM sale_details WHERE s_no = 0").fetchone()[0] == 0
+    # nothing was deleted because of it
+    assert conn.execute("SELECT COUNT(*) FROM sale_details").fetchone()[0] == 3
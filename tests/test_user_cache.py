@@ -0,0 +1,40 @@
+"""The per-process user cache never serves a role, password or account that changed."""
+import pytest
+
+from conftest import login
+
+
+@pytest.fixture
+def member(app_module, admin, db):
+    db.execute("DELETE FROM users WHERE username = 'cached'")
+    admin.post('/admin/crms/new', data={'username': 'cached', 'password': 'first', 'role': 'CRM'})
+    uid = db.execute("SELECT id FROM users WHERE username = 'cached'").fetchone()[0]
+    yield uid
+    db.execute("DELETE FROM users WHERE username = 'cached'")
+
+
+def test_role_change_applies_on_the_next_request(app_module, admin, member):
+    client = login(app_module.app.test_client(), 'cached', 'first')
+    assert client.get('/admin/dashboard').status_code == 302
+    assert member in app_module._user_cache
+
+    admin.post(f'/admin/crms/{member}/edit', data={'role': 'ADMIN'})
+    assert client.get('/admin/dashboard').status_code == 200
+    admin.post(f'/admin/crms/{member}/edit', data={'role': 'CRM'})
+    assert client.get('/admin/dashboard').status_code == 302
+
+
+def test_password_change_applies_on_the_next_login(app_module, admin, member):
+    client = login(app_module.app.test_client(), 'cached', 'first')
+    admin.post(f'/admin/crms/{member}/edit', data={'password': 'second', 'role': 'CRM'})
+    client.get('/logout')
+    assert client.post('/login', data={'username': 'cached', 'password': 'first'}).status_code == 200
+    assert client.post('/login', data={'username': 'cached', 'password': 'second'}).status_code == 302
+
+
+def test_deleted_user_is_signed_out(app_module, admin, member):
+    client = login(app_module.app.test_client(), 'cached', 'first')
+    assert client.get('/crm/list').status_code == 200
+    admin.post(f'/admin/crms/{member}/delete')
+    resp = client.get('/crm/list')
+    assert resp.status_code == 302 and '/login' in resp.headers['Location']
@@ -1,21 +1,128 @@
 import os
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from datetime import datetime, timezone
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, g, make_response, send_file, has_request_context, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy import create_engine, event, Column, Integer, String
 from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
-from io import StringIO, BytesIO
+from io import StringIO
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 import re
 import csv
+import json
+import gzip
+import mimetypes
+import zlib
+import tempfile
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+import sys
+from itsdangerous import URLSafeSerializer, BadSignature
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.normpath(os.path.join(BASE_DIR, '..', 'arcadia_sales.db'))
+# The helper modules sit next to this file; make them importable whatever
+# the working directory (flask run, gunicorn --chdir, tests, benchmarks).
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+from snapshot import write_snapshot, ensure_change_tracking, install_change_tracking, SnapshotUnavailable
+import metrics
+import slow_queries
+try:
+    import brotli
+except ImportError:  # optional: gzip-only static assets without it
+    brotli = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: no photo thumbnails without Pillow
+    Image = None
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+DB_PATH = os.environ.get('ARCADIA_DB_PATH') or os.path.normpath(os.path.join(BASE_DIR, '..', 'arcadia_sales.db'))
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.normpath(os.path.join(BASE_DIR, '..', 'snapshots')))
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('APP_SECRET', 'dev-secret-key')
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Password hashing policy. Any werkzeug method string works, e.g. 'scrypt',
+# 'scrypt:16384:8:1' or 'pbkdf2:sha256:600000'; stored hashes made under a
+# different policy are re-hashed on the user's next successful login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+# Password hashing (login checks and the admin user forms) runs on its own
+# small pool so a burst of sign-ins can't take every CPU; past
+# PASSWORD_HASH_MAX_PENDING queued hashes new ones are turned away
+# immediately instead of piling up.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='pwhash')
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+# "method:params" prefix that hashes made under the current policy carry
+_hash_policy = generate_password_hash('', PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+class HashPoolBusy(Exception):
+    pass
+
+def run_hash(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HashPoolBusy()
+    future = _hash_pool.submit(fn, *args)
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+
+def hash_password(password):
+    return generate_password_hash(password, PASSWORD_HASH_METHOD)
+
+def verify_password(stored_hash, password):
+    return run_hash(check_password_hash, stored_hash, password)
+
+def needs_rehash(stored_hash):
+    return stored_hash.split('$', 1)[0] != _hash_policy
+
+# SQLite connection settings, applied by the engine's connect hook to every
+# pooled connection (ORM sessions and raw_connection() alike). PRAGMA values
+# can't be bound as parameters, so each one is checked here: an integer, or
+# one of the keywords SQLite accepts for that pragma. Empty skips the pragma.
+def pragma_setting(env_name, default, keywords=None):
+    value = os.environ.get(env_name, default).strip()
+    if value == '':
+        return None
+    if keywords is not None and value.upper() in keywords:
+        return value.upper()
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or (keywords is not None and str(number) not in keywords):
+        allowed = ', '.join(keywords) if keywords is not None else 'an integer'
+        raise ValueError(f"{env_name}={value!r}: expected {allowed}")
+    return number
+
+SQLITE_PRAGMAS = {
+    'journal_mode': pragma_setting('SQLITE_JOURNAL_MODE', 'WAL', ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')),
+    'synchronous': pragma_setting('SQLITE_SYNCHRONOUS', 'NORMAL', ('OFF', 'NORMAL', 'FULL', 'EXTRA', '0', '1', '2', '3')),
+    'busy_timeout': pragma_setting('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    'cache_size': pragma_setting('SQLITE_CACHE_SIZE', '-20000'),
+    'mmap_size': pragma_setting('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    'temp_store': pragma_setting('SQLITE_TEMP_STORE', 'MEMORY', ('DEFAULT', 'FILE', 'MEMORY', '0', '1', '2')),
+}
+
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "factory": metrics.TimedConnection})
+metrics.instrument_engine(engine)
+
+@event.listens_for(engine, 'connect')
+def apply_sqlite_pragmas(dbapi_conn, connection_record):
+    cur = dbapi_conn.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if value is not None:
+                cur.execute(f"PRAGMA {name}={value}")
+    finally:
+        cur.close()
 SessionLocal = scoped_session(sessionmaker(bind=engine))
 Base = declarative_base()
 
@@ -38,7 +145,7 @@ def seed_users():
         def ensure_user(username, password, role):
             u = db.query(User).filter_by(username=username).first()
             if not u:
-                u = User(username=username, password_hash=generate_password_hash(password), role=role)
+                u = User(username=username, password_hash=hash_password(password), role=role)
                 db.add(u)
         ensure_user('vasu', 'kaka', 'CRM')
         ensure_user('admin', 'admin', 'ADMIN')
@@ -85,14 +192,46 @@ ensure_option_tables()
 
 # Helpers
 
+# Authenticated user cache: resolved once per request (flask.g) and kept in a
+# small LRU across requests. Entries expire after USER_CACHE_TTL seconds so
+# other worker processes pick up role/password changes eventually; this
+# process drops them immediately through invalidate_user().
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '256'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '300'))
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+def load_user(uid):
+    now = time.monotonic()
+    with _user_cache_lock:
+        hit = _user_cache.get(uid)
+        if hit and hit[1] > now:
+            _user_cache.move_to_end(uid)
+            return hit[0]
+    db = SessionLocal()
+    try:
+        user = db.get(User, uid)
+    finally:
+        db.close()
+    if user is not None:
+        with _user_cache_lock:
+            _user_cache[uid] = (user, now + USER_CACHE_TTL)
+            _user_cache.move_to_end(uid)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+    return user
+
+def invalidate_user(uid):
+    with _user_cache_lock:
+        _user_cache.pop(uid, None)
+    g.pop('current_user', None)
+
 def current_user():
-    if 'user_id' in session:
-        db = SessionLocal()
-        try:
-            return db.query(User).get(session['user_id'])
-        finally:
-            db.close()
-    return None
+    if 'user_id' not in session:
+        return None
+    if 'current_user' not in g:
+        g.current_user = load_user(session['user_id'])
+    return g.current_user
 
 def login_required(role=None):
     def decorator(fn):
@@ -108,32 +247,132 @@ def login_required(role=None):
         return wrapper
     return decorator
 
-def get_options(table):
+# Conditional GET for pages rendered from sale data. The validators are
+# derived from the data versions below plus the user and the full query
+# string, so an unchanged view is answered 304 after a single primary-key
+# read of data_versions, before any other SQL or Jinja runs. The versions
+# live in the database, so every worker computes the same ETag.
+PAGE_SCOPES = ('sales', 'options', 'sales_people')
+
+def page_validators(scopes):
+    key = repr((
+        request.endpoint, sorted((request.view_args or {}).items()),
+        sorted(request.args.items(multi=True)), session.get('user_id'), session.get('role'),
+        [(data_version(scope), data_changed_at(scope)) for scope in scopes],
+    ))
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    # a fresh login must not revalidate a page cached for the previous user
+    modified = max([data_changed_at(scope) for scope in scopes] + [session.get('login_at', 0)])
+    return etag, datetime.fromtimestamp(int(modified), timezone.utc)
+
+def conditional_get(*scopes):
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            # pending flash messages must reach the page, so always render then
+            if request.method != 'GET' or session.get('_flashes'):
+                return fn(*args, **kwargs)
+            etag, modified = page_validators(scopes or PAGE_SCOPES)
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                fresh = request.if_modified_since is not None and modified <= request.if_modified_since
+            if fresh:
+                resp = Response(status=304)
+            else:
+                resp = make_response(fn(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            resp.last_modified = modified
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            resp.vary.add('Cookie')
+            return resp
+        wrapper.__name__ = fn.__name__
+        return wrapper
+    return decorator
+
+# Data versions, one row per scope ('sales', 'options', 'sales_people') in
+# the data_versions table. Write routes bump the scopes they touch with one
+# UPDATE inside their own transaction (the importers bump 'sales'), so the
+# versions change exactly when the data does, for every worker at once.
+# They are read once per request, on first use.
+#
+# Option tables and dropdown sources are cached per process; a cached value
+# is reused only while its scope version is unchanged and it is younger than
+# OPTIONS_CACHE_TTL seconds.
+OPTIONS_CACHE_TTL = float(os.environ.get('OPTIONS_CACHE_TTL', '60'))
+_options_cache = {}
+_options_lock = threading.Lock()
+
+def read_data_versions():
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        cur.execute(f"SELECT value FROM {table} ORDER BY value")
-        return [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT scope, version, changed_at FROM data_versions")
+        return {scope: (version, changed_at) for scope, version, changed_at in cur.fetchall()}
     finally:
         conn.close()
 
-def get_sales_people_names():
+def data_versions():
+    if not has_request_context():
+        return read_data_versions()
+    if 'data_versions' not in g:
+        g.data_versions = read_data_versions()
+    return g.data_versions
+
+def data_version(scope):
+    return data_versions().get(scope, (0, 0))[0]
+
+def data_changed_at(scope):
+    """Wall-clock time of the last bump of scope."""
+    return data_versions().get(scope, (0, 0))[1]
+
+def bump_data_version(cur, *scopes):
+    """Bump scopes inside the caller's write transaction, before it commits."""
+    cur.execute(
+        f"UPDATE data_versions SET version = version + 1, changed_at = ? WHERE scope IN ({', '.join('?' * len(scopes))})",
+        (time.time(),) + scopes
+    )
+    if has_request_context():
+        g.pop('data_versions', None)
+
+def cached(scope, key, loader):
+    now = time.monotonic()
+    version = data_version(scope)
+    hit = _options_cache.get(key)
+    if hit and hit[0] == version and hit[1] > now:
+        return hit[2]
+    value = loader()
+    with _options_lock:
+        _options_cache[key] = (version, now + OPTIONS_CACHE_TTL, value)
+    return value
+
+def column_values(sql):
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        cur.execute("SELECT DISTINCT full_name FROM sales_people ORDER BY full_name")
-        return [r[0] for r in cur.fetchall()]
+        cur.execute(sql)
+        return tuple(r[0] for r in cur.fetchall())
     finally:
         conn.close()
 
+def get_options(table):
+    return cached('options', table, lambda: column_values(f"SELECT value FROM {table} ORDER BY value"))
+
+def get_sales_people_names():
+    return cached('sales_people', 'sales_people_names',
+                  lambda: column_values("SELECT DISTINCT full_name FROM sales_people ORDER BY full_name"))
+
 def is_valid_option(table, value):
-    conn = engine.raw_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(f"SELECT 1 FROM {table} WHERE value = ?", (value,))
-        return cur.fetchone() is not None
-    finally:
-        conn.close()
+    return value in cached('options', (table, 'set'), lambda: frozenset(get_options(table)))
+
+def get_crm_names():
+    return cached('sales', 'crm_names',
+                  lambda: column_values("SELECT DISTINCT crm_name FROM sale_details WHERE crm_name IS NOT NULL ORDER BY crm_name"))
+
+def get_sale_person_names():
+    return cached('sales', 'sale_person_names',
+                  lambda: column_values("SELECT DISTINCT sale_person_name FROM sale_details WHERE sale_person_name IS NOT NULL ORDER BY sale_person_name"))
 
 def clean_number(val):
     return float(re.sub(r"[^0-9.-]", "", (val or '0'))) if re.sub(r"[^0-9.-]", "", (val or '')) != '' else 0.0
@@ -146,12 +385,370 @@ def format_currency_csv(n):
     # Use ASCII dollar to avoid encoding issues across viewers
     return f"$ {x:,.2f}"
 
+# CSV export: same column set and order as the dashboard table
+EXPORT_COLUMNS = (
+    "s_no, booking_date, project, spg_praneeth, token, buyer_name, sale_person_name, crm_name, sol, "
+    "type_of_sale, land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums, "
+    "total_sale_price, amount_received, balance_amount, balance_tobe_received_by_plan_approval, notes, "
+    "balance_tobe_received_during_exec"
+)
+EXPORT_HEADER = [
+    'S.No','Booking Date','Project','SPG/Praneeth','Token','Buyer Name','Sale Person Name','CRM Name','SOL',
+    'Type of Sale','Land (sq yards)','SBUA (sq feet)','Facing','Base sq ft price','Amenities and Premiums',
+    'Total Sale Price','Amount Received','Balance Amount','Balance to be received by plan approval','Notes',
+    'Balance to be received during execution'
+]
+# currency fields by index in EXPORT_COLUMNS
+EXPORT_CURRENCY_IDX = (13,14,15,16,17,18,20)
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+
+def iter_csv(query, params, progress=None):
+    """Yield CSV text chunks for query, fetching EXPORT_BATCH_SIZE rows at a time.
+
+    The connection is opened lazily and closed when the generator is exhausted
+    or closed by the server, so memory stays bounded by one batch. progress,
+    if given, is called with the size of each batch written.
+    """
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_HEADER)
+    yield buf.getvalue()
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            buf.seek(0)
+            buf.truncate(0)
+            for r in rows:
+                r = list(r)
+                for idx in EXPORT_CURRENCY_IDX:
+                    r[idx] = format_currency_csv(r[idx])
+                writer.writerow(r)
+            if progress:
+                progress(len(rows))
+            yield buf.getvalue()
+    finally:
+        conn.close()
+
+def csv_response(query, params, download_name):
+    # the request context stays up while the body streams, so its queries
+    # are still attributed to this endpoint (see slow_queries.py)
+    return Response(stream_with_context(iter_csv(query, tuple(params))), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
+# .xlsx export: typed cells instead of format_currency_csv strings
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+XLSX_CURRENCY_FORMAT = '"$ "#,##0.00'
+XLSX_DATE_FORMAT = 'yyyy-mm-dd'
+XLSX_CHUNK_SIZE = 64 * 1024
+EXPORT_DATE_IDX = (1,)
+EXPORT_NUMBER_IDX = (0, 4, 10, 11)
+
+def xlsx_number(v):
+    if v is None or isinstance(v, (int, float)):
+        return v
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return v
+
+def xlsx_date(v):
+    try:
+        return datetime.strptime(str(v)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return v
+
+def xlsx_row(ws, r):
+    r = list(r)
+    for idx in EXPORT_NUMBER_IDX:
+        r[idx] = xlsx_number(r[idx])
+    for idx in EXPORT_DATE_IDX:
+        if r[idx]:
+            cell = WriteOnlyCell(ws, value=xlsx_date(r[idx]))
+            cell.number_format = XLSX_DATE_FORMAT
+            r[idx] = cell
+    for idx in EXPORT_CURRENCY_IDX:
+        cell = WriteOnlyCell(ws, value=xlsx_number(r[idx]) or 0)
+        cell.number_format = XLSX_CURRENCY_FORMAT
+        r[idx] = cell
+    return r
+
+def write_xlsx(fh, query, params, progress=None):
+    """Write an .xlsx workbook for query to the binary file fh.
+
+    The write-only worksheet serializes appended rows to a temp file, so
+    memory stays bounded by one fetch batch.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sales')
+    # write-only sheets take the pane only before the first append
+    ws.freeze_panes = 'A2'
+    header = []
+    for title in EXPORT_HEADER:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for r in rows:
+                ws.append(xlsx_row(ws, r))
+            if progress:
+                progress(len(rows))
+    finally:
+        conn.close()
+    wb.save(fh)
+
+def iter_xlsx(query, params):
+    """Yield an .xlsx workbook for query in XLSX_CHUNK_SIZE byte chunks.
+
+    Buffered, not streamed: a zip can only be finished once every row is
+    written, so the whole workbook is built in a temp file (on disk, not in
+    memory) before the first byte goes out. Large exports should use the
+    background export jobs instead.
+    """
+    with tempfile.TemporaryFile() as fh:
+        write_xlsx(fh, query, params)
+        fh.seek(0)
+        while True:
+            chunk = fh.read(XLSX_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def xlsx_response(query, params, download_name):
+    return Response(stream_with_context(iter_xlsx(query, tuple(params))), mimetype=XLSX_MIMETYPE,
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
+def export_response(query, params, basename):
+    """CSV by default, .xlsx for ?format=xlsx."""
+    ts = datetime.today().strftime('%Y%m%d-%H%M%S')
+    if request.args.get('format') == 'xlsx':
+        return xlsx_response(query, params, f'{basename}_{ts}.xlsx')
+    return csv_response(query, params, f'{basename}_{ts}.csv')
+
+# Dashboard/export filters
+def month_start(year, month):
+    return f"{year:04d}-{month:02d}-01"
+
+def date_range(year, month=None):
+    """Half-open [start, end) booking_date bounds for a year or a single month."""
+    if month:
+        end = month_start(year + 1, 1) if month == 12 else month_start(year, month + 1)
+        return month_start(year, month), end
+    return month_start(year, 1), month_start(year + 1, 1)
+
+def booking_years():
+    """First and last booking year on file, read from the booking_date index."""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(booking_date), MAX(booking_date) FROM sale_details")
+        lo, hi = cur.fetchone()
+    finally:
+        conn.close()
+    if not lo or not hi:
+        return None
+    return int(str(lo)[:4]), int(str(hi)[:4])
+
+def sale_filters(year, month, crm, sp, spg, tos):
+    """Build the WHERE clause shared by the dashboard and the exports.
+
+    Year/month filters are expressed as booking_date ranges so SQLite can
+    use the booking_date indexes instead of evaluating strftime() per row.
+    """
+    where = "1=1"
+    params = []
+    try:
+        y = int(year) if year else None
+        m = int(month) if month else None
+        if m is not None and not 1 <= m <= 12:
+            raise ValueError(month)
+    except ValueError:
+        return "0", []
+    if y is not None:
+        where += " AND booking_date >= ? AND booking_date < ?"; params += list(date_range(y, m))
+    elif m is not None:
+        # month without a year: one range per year on file
+        span = booking_years()
+        if not span:
+            return "0", []
+        ranges = [date_range(yy, m) for yy in range(span[0], span[1] + 1)]
+        where += " AND (" + " OR ".join(["(booking_date >= ? AND booking_date < ?)"] * len(ranges)) + ")"
+        for r in ranges:
+            params += list(r)
+    if crm:
+        where += " AND crm_name = ?"; params.append(crm)
+    if sp:
+        where += " AND sale_person_name = ?"; params.append(sp)
+    if spg:
+        where += " AND spg_praneeth = ?"; params.append(spg)
+    if tos:
+        where += " AND type_of_sale = ?"; params.append(tos)
+    return where, params
+
+# Keyset pagination for sale_details listings
+page_tokens = URLSafeSerializer(app.secret_key, salt='sale-page')
+
+def parse_limit(default, allowed):
+    try:
+        limit = int(request.args.get('limit') or default)
+    except ValueError:
+        limit = default
+    return limit if limit in allowed else default
+
+def order_parts(col, dir_sql):
+    """ORDER BY terms as (expression, direction), ending in a unique rowid tiebreak."""
+    # keep NULL dates last when sorting by date desc
+    if col == 'booking_date' and dir_sql == 'DESC':
+        return [('(booking_date IS NULL)', 'ASC'), ('booking_date', 'DESC'), ('s_no', 'DESC'), ('rowid', 'DESC')]
+    return [(col, dir_sql), ('rowid', dir_sql)]
+
+def reverse_parts(parts):
+    return [(expr, 'DESC' if direction == 'ASC' else 'ASC') for expr, direction in parts]
+
+def keyset_clause(parts, values):
+    """WHERE clause selecting rows strictly after `values` in `parts` order.
+
+    Follows SQLite's NULL ordering (NULL sorts lowest), so nullable sort
+    columns page correctly in both directions. The OR chain can't drive an
+    index range, so keyset_ranges() only uses it inside one tie group.
+    """
+    ors, params = [], []
+    for i, ((expr, direction), val) in enumerate(zip(parts, values)):
+        ands, ps = [], []
+        for (prev_expr, _), prev_val in zip(parts[:i], values[:i]):
+            ands.append(f"{prev_expr} IS ?"); ps.append(prev_val)
+        if direction == 'ASC':
+            if val is None:
+                ands.append(f"{expr} IS NOT NULL")
+            else:
+                ands.append(f"{expr} > ?"); ps.append(val)
+        else:
+            if val is None:
+                continue
+            ands.append(f"({expr} < ? OR {expr} IS NULL)"); ps.append(val)
+        ors.append('(' + ' AND '.join(ands) + ')')
+        params += ps
+    return ' OR '.join(ors) or '0', params
+
+def keyset_ranges(parts, values):
+    """(clause, params) pairs that, queried in turn, list the rows after `values` in `parts` order.
+
+    With values None they list every row. Each clause stays within the NULL
+    or the non-NULL rows of the leading sort column, so it is one index
+    range: the rest of the boundary row's tie group, the rest of its
+    segment, then the other segment if that sorts later (NULL sorts lowest).
+    """
+    flag = parts[0][0] if parts[0][0].endswith(' IS NULL)') else None  # the NULLs-last term
+    (expr, direction), rest = parts[1 if flag else 0], parts[2 if flag else 1:]
+    is_null = f"{flag} = 1" if flag else f"{expr} IS NULL"
+    not_null = f"{flag} = 0 AND {expr} IS NOT NULL" if flag else f"{expr} IS NOT NULL"
+    if values is None:
+        segments = [(is_null, []), (not_null, [])]
+        return segments if direction == 'ASC' else segments[::-1]
+    val = values[1 if flag else 0]
+    tie, tie_params = keyset_clause(rest, values[-len(rest):])
+    if val is None:
+        ranges = [(f"{is_null} AND ({tie})", tie_params)]
+        if direction == 'ASC':
+            ranges.append((not_null, []))
+    else:
+        ranges = [(f"{not_null} AND {expr} = ? AND ({tie})", [val] + tie_params),
+                  (f"{not_null} AND {expr} {'>' if direction == 'ASC' else '<'} ?", [val])]
+        if direction == 'DESC':
+            ranges.append((is_null, []))
+    return ranges
+
+def fetch_rows(cur, select, params, parts, after, limit):
+    """Up to limit rows of select in parts order, starting after key `after` (None: from the start)."""
+    # every range pins the leading column's NULL-ness, so the NULLs-last term can go
+    order = [p for p in parts if not p[0].endswith(' IS NULL)')]
+    order = " ORDER BY " + ', '.join(f"{expr} {direction}" for expr, direction in order) + " LIMIT ?"
+    rows = []
+    for clause, kparams in keyset_ranges(parts, after):
+        cur.execute(f"{select} AND {clause}{order}", tuple(params) + tuple(kparams) + (limit - len(rows),))
+        cols = [d[0] for d in cur.description]
+        rows += [dict(zip(cols, r)) for r in cur.fetchall()]
+        if len(rows) >= limit:
+            break
+    return rows
+
+def fetch_page(cur, columns, where, params, col, dir_sql, limit):
+    """Fetch one page of sale_details using the opaque `page` token from the query string.
+
+    Returns (rows, total, page_number, next_token, prev_token). Each page is
+    a few bounded index range scans, so page N costs the same as page 1.
+    Tokens carry the boundary row's sort key, the page number and the row
+    count, which is only recounted on the first page or once the data
+    changed; a Prev token pages backwards from the first row shown.
+    """
+    parts = order_parts(col, dir_sql)
+    scope = hashlib.sha1(repr((col, dir_sql, where, list(params))).encode('utf-8')).hexdigest()[:12]
+    state = None
+    token = request.args.get('page')
+    if token:
+        try:
+            state = page_tokens.loads(token)
+        except BadSignature:
+            state = None
+        if not state or state.get('s') != scope or len(state.get('k') or []) != len(parts):
+            state = None
+    version = data_version('sales')
+    if state and state.get('v') == version and isinstance(state.get('t'), int):
+        total = state['t']
+    else:
+        cur.execute(f"SELECT COUNT(*) FROM sale_details WHERE {where}", tuple(params))
+        total = cur.fetchone()[0]
+    keys = ', '.join(f"{expr} AS _k{i}" for i, (expr, _) in enumerate(parts))
+    select = f"SELECT {columns}, {keys} FROM sale_details WHERE ({where})"
+    page, rows, more = 1, None, False
+    if state and state.get('b'):
+        # Prev: the page ending just before key k, read backwards
+        back = fetch_rows(cur, select, params, reverse_parts(parts), state['k'], limit + 1)
+        if len(back) > limit:
+            rows, more, page = back[:limit][::-1], True, max(2, int(state.get('p') or 2))
+    elif state:
+        rows = fetch_rows(cur, select, params, parts, state['k'], limit + 1)
+        page = int(state.get('p') or 1)
+    if rows is None:
+        rows = fetch_rows(cur, select, params, parts, None, limit + 1)
+    if len(rows) > limit:
+        rows, more = rows[:limit], True
+
+    def token_for(row, page, back=False):
+        data = {'s': scope, 'k': [row[f'_k{i}'] for i in range(len(parts))], 'p': page, 't': total, 'v': version}
+        if back:
+            data['b'] = 1
+        return page_tokens.dumps(data)
+    next_token = token_for(rows[-1], page + 1) if more else None
+    prev_token = token_for(rows[0], page - 1, back=True) if page > 1 and rows else None
+    return rows, total, page, next_token, prev_token
+
+def page_args():
+    """Current query args minus the page token, for building pager links."""
+    return {k: v for k, v in request.args.items() if k != 'page' and v not in (None, '')}
+
 def compute_totals(base, prem, sbua, received, tos):
     total = (base + prem) * sbua
     balance = total - received
     by_plan = balance if tos == 'OTP' else (total * 0.20) - balance
     return total, balance, by_plan
 
+def table_exists(cur, name):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cur.fetchone() is not None
+
 # Payments table
 def ensure_payments_table():
     conn = engine.raw_connection()
@@ -168,12 +765,415 @@ def ensure_payments_table():
             )
             """
         )
+        # Running payment total per sale, maintained by record_payment()
+        if not table_exists(cur, 'payment_totals'):
+            cur.execute(
+                """
+                CREATE TABLE payment_totals (
+                    sale_rowid INTEGER PRIMARY KEY,
+                    total REAL NOT NULL DEFAULT 0,
+                    payment_count INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            cur.execute(
+                "INSERT INTO payment_totals(sale_rowid, total, payment_count) "
+                "SELECT sale_rowid, SUM(amount), COUNT(*) FROM payments GROUP BY sale_rowid"
+            )
         conn.commit()
     finally:
         conn.close()
 
 ensure_payments_table()
 
+def payments_total(cur, rowid):
+    cur.execute("SELECT total FROM payment_totals WHERE sale_rowid = ?", (rowid,))
+    row = cur.fetchone()
+    return (row[0] or 0) if row else 0
+
+def record_payment(cur, rowid, paid_date, amount, note, total_sale_price, amount_received, tos):
+    """Insert a payment, bump the sale's running total and rewrite its balances.
+
+    Must run inside a BEGIN IMMEDIATE transaction that also read the sale row,
+    so concurrent payments on the same sale serialize instead of losing updates.
+    """
+    rollup_apply(cur, rowid, -1)
+    cur.execute("INSERT INTO payments(sale_rowid, paid_date, amount, note) VALUES(?,?,?,?)", (rowid, paid_date, amount, note))
+    cur.execute(
+        "INSERT INTO payment_totals(sale_rowid, total, payment_count) VALUES(?,?,1) "
+        "ON CONFLICT(sale_rowid) DO UPDATE SET total = total + excluded.total, payment_count = payment_count + 1",
+        (rowid, amount)
+    )
+    # recompute balances using amount_received + sum(payments)
+    pay_sum = payments_total(cur, rowid)
+    effective_received = (amount_received or 0) + pay_sum
+    balance = (total_sale_price or 0) - effective_received
+    by_plan = balance if tos == 'OTP' else (total_sale_price * 0.20) - balance
+    cur.execute("UPDATE sale_details SET balance_amount = ?, balance_tobe_received_by_plan_approval = ? WHERE rowid = ?", (balance, by_plan, rowid))
+    rollup_apply(cur, rowid, 1)
+
+def delete_sale(cur, rowid, crm_name):
+    """Delete one of crm_name's sales together with its payments.
+
+    Must run inside a BEGIN IMMEDIATE transaction. sale_details rowids are
+    reused once freed, so no payment may outlive the sale it belonged to.
+    """
+    rollup_apply(cur, rowid, -1, crm_name)
+    cur.execute("DELETE FROM sale_details WHERE rowid = ? AND crm_name = ?", (rowid, crm_name))
+    if cur.rowcount:
+        cur.execute("DELETE FROM payments WHERE sale_rowid = ?", (rowid,))
+        cur.execute("DELETE FROM payment_totals WHERE sale_rowid = ?", (rowid,))
+
+# KPI rollups: one row per (year, month, crm_name, sale_person_name,
+# spg_praneeth, type_of_sale) with counts and money totals. Sale and payment
+# writes call rollup_apply() with -1 before and +1 after touching a row, in
+# the same transaction, so the dashboard KPIs never need to scan sale_details.
+ROLLUP_KEYS = ('year', 'month', 'crm_name', 'sale_person_name', 'spg_praneeth', 'type_of_sale')
+ROLLUP_SELECT = (
+    "SELECT COALESCE(CAST(substr(s.booking_date, 1, 4) AS INTEGER), 0) AS year, "
+    "COALESCE(CAST(substr(s.booking_date, 6, 2) AS INTEGER), 0) AS month, "
+    "COALESCE(s.crm_name, '') AS crm_name, COALESCE(s.sale_person_name, '') AS sale_person_name, "
+    "COALESCE(s.spg_praneeth, '') AS spg_praneeth, COALESCE(s.type_of_sale, '') AS type_of_sale, "
+    "CAST(COALESCE(s.total_sale_price, 0) AS REAL) AS total_sale_price, "
+    "CAST(COALESCE(s.amount_received, 0) AS REAL) + COALESCE(p.total, 0) AS amount_received, "
+    "CAST(COALESCE(s.balance_amount, 0) AS REAL) AS balance_amount "
+    "FROM sale_details s LEFT JOIN payment_totals p ON p.sale_rowid = s.rowid"
+)
+
+def rebuild_rollups(cur):
+    keys = ', '.join(ROLLUP_KEYS)
+    cur.execute("DELETE FROM sale_rollups")
+    cur.execute(
+        f"INSERT INTO sale_rollups({keys}, sale_count, total_sale_price, amount_received, balance_amount) "
+        f"SELECT {keys}, COUNT(*), SUM(total_sale_price), SUM(amount_received), SUM(balance_amount) "
+        f"FROM ({ROLLUP_SELECT}) GROUP BY {keys}"
+    )
+
+def ensure_rollups():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sale_rollups (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                crm_name TEXT NOT NULL,
+                sale_person_name TEXT NOT NULL,
+                spg_praneeth TEXT NOT NULL,
+                type_of_sale TEXT NOT NULL,
+                sale_count INTEGER NOT NULL DEFAULT 0,
+                total_sale_price REAL NOT NULL DEFAULT 0,
+                amount_received REAL NOT NULL DEFAULT 0,
+                balance_amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, month, crm_name, sale_person_name, spg_praneeth, type_of_sale)
+            ) WITHOUT ROWID
+            """
+        )
+        # rebuild when rows were loaded or removed outside the app (a new
+        # database has no sale_details until the first import)
+        if table_exists(cur, 'sale_details'):
+            cur.execute("SELECT COALESCE(SUM(sale_count), 0) FROM sale_rollups")
+            rolled = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM sale_details")
+            if cur.fetchone()[0] != rolled:
+                rebuild_rollups(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    apply_external_changes()
+
+# The Excel importers bump the 'import_version' counter whenever they change
+# sale_details. Each worker polls it at most every IMPORT_CHECK_INTERVAL
+# seconds; the first to notice a new version restores the indexes and the
+# snapshot triggers and rebuilds the rollups and the search index.
+IMPORT_CHECK_INTERVAL = float(os.environ.get('IMPORT_CHECK_INTERVAL', '5'))
+_import_check = {'at': 0.0}
+
+def sequence_value(cur, name):
+    cur.execute("SELECT value FROM sequences WHERE name = ?", (name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def apply_external_changes():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        version = sequence_value(cur, 'import_version')
+        if version != sequence_value(cur, 'rollup_version'):
+            cur.execute("BEGIN IMMEDIATE")
+            version = sequence_value(cur, 'import_version')
+            if version != sequence_value(cur, 'rollup_version'):
+                ensure_managed_indexes(cur)
+                rebuild_rollups(cur)
+                ensure_search_index(cur)
+                install_change_tracking(cur)
+                cur.execute("INSERT OR REPLACE INTO sequences(name, value) VALUES ('rollup_version', ?)", (version,))
+                # pages rendered from the old rollups must not stay fresh
+                bump_data_version(cur, 'sales')
+            conn.commit()
+    finally:
+        conn.close()
+
+@app.before_request
+def check_external_changes():
+    now = time.monotonic()
+    if now - _import_check['at'] < IMPORT_CHECK_INTERVAL:
+        return
+    _import_check['at'] = now
+    apply_external_changes()
+
+def rollup_apply(cur, rowid, sign, crm_name=None):
+    """Add (sign=1) or remove (sign=-1) one sale's contribution to sale_rollups."""
+    sql = ROLLUP_SELECT + " WHERE s.rowid = ?"
+    params = [rowid]
+    if crm_name is not None:
+        sql += " AND s.crm_name = ?"
+        params.append(crm_name)
+    cur.execute(sql, tuple(params))
+    row = cur.fetchone()
+    if not row:
+        return
+    key, (total, received, balance) = row[:6], row[6:]
+    cur.execute(
+        "INSERT INTO sale_rollups(year, month, crm_name, sale_person_name, spg_praneeth, type_of_sale, "
+        "sale_count, total_sale_price, amount_received, balance_amount) VALUES (?,?,?,?,?,?,?,?,?,?) "
+        "ON CONFLICT(year, month, crm_name, sale_person_name, spg_praneeth, type_of_sale) DO UPDATE SET "
+        "sale_count = sale_count + excluded.sale_count, "
+        "total_sale_price = total_sale_price + excluded.total_sale_price, "
+        "amount_received = amount_received + excluded.amount_received, "
+        "balance_amount = balance_amount + excluded.balance_amount",
+        tuple(key) + (sign, sign * total, sign * received, sign * balance)
+    )
+    if sign < 0:
+        cur.execute(
+            "DELETE FROM sale_rollups WHERE year = ? AND month = ? AND crm_name = ? AND sale_person_name = ? "
+            "AND spg_praneeth = ? AND type_of_sale = ? AND sale_count <= 0",
+            tuple(key)
+        )
+
+def rollup_summary(year, month, crm, sp, spg, tos, q=None):
+    """KPI totals plus per-CRM, per-sales-person, per-type and per-month breakdowns.
+
+    Read from sale_rollups. A search can't be rolled up, so with one the
+    same figures are summed over the sale_details rows the table shows.
+    """
+    source, where, params = "sale_rollups", "1=1", []
+    if search_match(q):
+        sale_where, params = search_filter(*sale_filters(year, month, crm, sp, spg, tos), q)
+        source = (f"(SELECT *, 1 AS sale_count FROM ({ROLLUP_SELECT} "
+                  f"WHERE s.rowid IN (SELECT rowid FROM sale_details WHERE {sale_where})))")
+    else:
+        try:
+            if year:
+                where += " AND year = ?"; params.append(int(year))
+            if month:
+                where += " AND month = ?"; params.append(int(month))
+        except ValueError:
+            where = "0"
+        for col, val in (('crm_name', crm), ('sale_person_name', sp), ('spg_praneeth', spg), ('type_of_sale', tos)):
+            if val:
+                where += f" AND {col} = ?"; params.append(val)
+    measures = "SUM(sale_count), SUM(total_sale_price), SUM(amount_received), SUM(balance_amount)"
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {measures} FROM {source} WHERE {where}", tuple(params))
+        count, total, received, balance = cur.fetchone()
+        summary = {'count': count or 0, 'total_sale_price': total or 0,
+                   'amount_received': received or 0, 'balance_amount': balance or 0}
+        breakdowns = {}
+        for name, col in (('crm', 'crm_name'), ('sale_person', 'sale_person_name'),
+                          ('type_of_sale', 'type_of_sale'), ('month', "printf('%04d-%02d', year, month)")):
+            cur.execute(f"SELECT {col} AS k, {measures} FROM {source} WHERE {where} GROUP BY k ORDER BY k", tuple(params))
+            breakdowns[name] = cur.fetchall()
+        return summary, breakdowns
+    finally:
+        conn.close()
+
+# Counters (currently just s_no). A row per counter holds the last value
+# handed out; next_sequence_value() increments it inside the caller's write
+# transaction, so two concurrent inserts can never observe the same number.
+# Rows written outside the app (Excel imports) can carry higher numbers, so
+# each allocation first catches up with the column's current maximum (an
+# index lookup, see ix_sale_details_s_no) in that same transaction.
+SEQUENCE_FLOORS = {
+    's_no': "SELECT COALESCE(MAX(s_no), 0) FROM sale_details",
+}
+
+def ensure_sequences():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        cur.execute("INSERT OR IGNORE INTO sequences(name, value) VALUES ('s_no', 0)")
+        ensure_data_versions(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+def ensure_data_versions(cur):
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS data_versions "
+        "(scope TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0, changed_at REAL NOT NULL)"
+    )
+    cur.executemany("INSERT OR IGNORE INTO data_versions(scope, version, changed_at) VALUES (?, 0, ?)",
+                    [(scope, time.time()) for scope in PAGE_SCOPES])
+    # per-row change counter triggers from earlier versions, replaced by
+    # the per-transaction bumps above
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg\\_change\\_%' ESCAPE '\\'")
+    for (name,) in cur.fetchall():
+        cur.execute(f"DROP TRIGGER {name}")
+    cur.execute("DELETE FROM sequences WHERE name = 'change_version'")
+
+def sequence_next_sql(name):
+    floor = SEQUENCE_FLOORS.get(name)
+    return f"MAX(value, ({floor})) + 1" if floor else "value + 1"
+
+def next_sequence_value(cur, name):
+    """Allocate the next value of counter `name`; call inside a write transaction."""
+    cur.execute(f"UPDATE sequences SET value = {sequence_next_sql(name)} WHERE name = ?", (name,))
+    cur.execute("SELECT value FROM sequences WHERE name = ?", (name,))
+    return cur.fetchone()[0]
+
+def peek_sequence_value(name):
+    """Value the next allocation will most likely get (form preview only)."""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {sequence_next_sql(name)} FROM sequences WHERE name = ?", (name,))
+        row = cur.fetchone()
+        return row[0] if row else 1
+    finally:
+        conn.close()
+
+# Managed index set. Indexes listed here are created at startup and again
+# after every import (a full reload drops them with the table); one whose
+# definition changed is rebuilt. Indexes the app no longer wants go in
+# RETIRED_INDEXES to be dropped; any other index is left alone.
+MANAGED_INDEXES = {
+    # crm_list / crm_export / payments ownership checks, ordered like the default listing
+    'ix_sale_details_crm_booking': "sale_details (crm_name, (booking_date IS NULL), booking_date DESC, s_no DESC)",
+    # dashboard and export year/month ranges, optionally narrowed to one CRM
+    'ix_sale_details_crm_date': "sale_details (crm_name, booking_date)",
+    'ix_sale_details_booking_date': "sale_details (booking_date, s_no)",
+    # sale person filter and the dashboard dropdown (covering)
+    'ix_sale_details_sale_person': "sale_details (sale_person_name, booking_date)",
+    # spg/type filters inside a date range (covering for the filter columns)
+    'ix_sale_details_spg_tos_date': "sale_details (spg_praneeth, type_of_sale, booking_date)",
+    'ix_sale_details_s_no': "sale_details (s_no)",
+    # payment history and payment totals per sale
+    'ix_payments_sale_rowid': "payments (sale_rowid, paid_date)",
+    'ix_sales_people_owner': "sales_people (owner_username, full_name)",
+}
+RETIRED_INDEXES = ()
+
+def ensure_managed_indexes(cur):
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'")
+    existing = dict(cur.fetchall())
+    for name in RETIRED_INDEXES:
+        if name in existing:
+            cur.execute(f"DROP INDEX {name}")
+    created = False
+    for name, spec in MANAGED_INDEXES.items():
+        sql = existing.get(name)
+        if sql is not None and sql != f"CREATE INDEX {name} ON {spec}":
+            cur.execute(f"DROP INDEX {name}")
+            sql = None
+        if sql is None and spec.split(' ', 1)[0] in tables:
+            cur.execute(f"CREATE INDEX {name} ON {spec}")
+            created = True
+    if created:
+        cur.execute("ANALYZE")
+
+def ensure_indexes():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        ensure_managed_indexes(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+# Full-text search: an external-content FTS5 index over sale_details, kept
+# in sync by triggers (so importer writes are covered too).
+SEARCH_COLUMNS = ('buyer_name', 'project', 'sol', 'notes', 'sale_person_name')
+SEARCH_MAX_TERMS = 8
+
+def search_triggers():
+    cols = ', '.join(SEARCH_COLUMNS)
+    new = ', '.join(f"new.{c}" for c in SEARCH_COLUMNS)
+    old = ', '.join(f"old.{c}" for c in SEARCH_COLUMNS)
+    delete = f"INSERT INTO sale_search(sale_search, rowid, {cols}) VALUES ('delete', old.rowid, {old});"
+    insert = f"INSERT INTO sale_search(rowid, {cols}) VALUES (new.rowid, {new});"
+    return {
+        'sale_search_ai': f"AFTER INSERT ON sale_details BEGIN {insert} END",
+        'sale_search_ad': f"AFTER DELETE ON sale_details BEGIN {delete} END",
+        'sale_search_au': f"AFTER UPDATE OF {cols} ON sale_details BEGIN {delete} {insert} END",
+    }
+
+def ensure_search_index(cur):
+    """Create the search index and its triggers, rebuilding the index if either was missing.
+
+    A full reload of sale_details drops the triggers, which is how a stale
+    index is detected. Does nothing until sale_details exists.
+    """
+    if not table_exists(cur, 'sale_details'):
+        return
+    cur.execute("SELECT name FROM sqlite_master WHERE name = 'sale_search' OR (type = 'trigger' AND name LIKE 'sale\\_search\\_%' ESCAPE '\\')")
+    existing = {r[0] for r in cur.fetchall()}
+    rebuild = False
+    if 'sale_search' not in existing:
+        cur.execute(
+            f"CREATE VIRTUAL TABLE sale_search USING fts5({', '.join(SEARCH_COLUMNS)}, "
+            "content='sale_details', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        rebuild = True
+    for name, body in search_triggers().items():
+        if name not in existing:
+            cur.execute(f"CREATE TRIGGER {name} {body}")
+            rebuild = True
+    if rebuild:
+        cur.execute("INSERT INTO sale_search(sale_search) VALUES ('rebuild')")
+
+def ensure_search():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        ensure_search_index(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+def search_match(q):
+    """FTS5 query for free text: every word must match, each as a prefix."""
+    words = re.findall(r'\w+', q or '')[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{w}"*' for w in words)
+
+def search_filter(where, params, q):
+    """Narrow a sale_details WHERE clause to rows matching the search box."""
+    match = search_match(q)
+    if not match:
+        return where, params
+    return where + " AND rowid IN (SELECT rowid FROM sale_search WHERE sale_search MATCH ?)", list(params) + [match]
+
+# Snapshot change tracking (see snapshot.py) from the first write on
+def ensure_snapshot_tracking():
+    conn = engine.raw_connection()
+    try:
+        ensure_change_tracking(conn)
+    finally:
+        conn.close()
+
+ensure_indexes()
+ensure_sequences()
+ensure_search()
+ensure_snapshot_tracking()
+ensure_rollups()
+
 @app.route('/')
 def index():
     user = current_user()
@@ -191,9 +1191,22 @@ def login():
         db = SessionLocal()
         try:
             user = db.query(User).filter_by(username=username).first()
-            if user and check_password_hash(user.password_hash, password):
+            try:
+                ok = bool(user) and verify_password(user.password_hash, password)
+            except (HashPoolBusy, FutureTimeout):
+                flash('Too many sign-ins right now, please try again in a moment', 'error')
+                return render_template('login.html'), 503
+            if ok:
+                if needs_rehash(user.password_hash):
+                    try:
+                        user.password_hash = run_hash(hash_password, password)
+                        db.commit()
+                        invalidate_user(user.id)
+                    except (HashPoolBusy, FutureTimeout):
+                        pass  # tried again on the next login
                 session['user_id'] = user.id
                 session['role'] = user.role
+                session['login_at'] = time.time()
                 if user.role == 'ADMIN':
                     return redirect(url_for('admin_dashboard'))
                 return redirect(url_for('crm_new'))
@@ -233,8 +1246,8 @@ def crm_new():
         conn = engine.raw_connection()
         try:
             cur = conn.cursor()
-            cur.execute("SELECT COALESCE(MAX(s_no), 0) + 1 FROM sale_details")
-            next_sno = cur.fetchone()[0]
+            cur.execute("BEGIN IMMEDIATE")
+            next_sno = next_sequence_value(cur, 's_no')
             cur.execute(
                 """
                 INSERT INTO sale_details (
@@ -269,26 +1282,23 @@ def crm_new():
                     user.username
                 )
             )
+            rollup_apply(cur, cur.lastrowid, 1)
+            bump_data_version(cur, 'sales')
             conn.commit()
         finally:
             conn.close()
         return jsonify({"ok": True, "s_no": int(next_sno)})
     # GET: load options and next s_no
-    conn = engine.raw_connection()
-    spg_opts, tos_opts, next_sno = [], [], 1
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM spg_options ORDER BY value"); spg_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT value FROM sale_type_options ORDER BY value"); tos_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT COALESCE(MAX(s_no), 0) + 1 FROM sale_details"); next_sno = cur.fetchone()[0]
-    finally:
-        conn.close()
+    spg_opts = get_options('spg_options')
+    tos_opts = get_options('sale_type_options')
+    next_sno = peek_sequence_value('s_no')
     today = datetime.today().strftime('%Y-%m-%d')
     sale_people = get_sales_people_names()
     return render_template('crm_new.html', user=user, spg_opts=spg_opts, tos_opts=tos_opts, next_sno=next_sno, today=today, sale_people=sale_people)
 
 @app.route('/crm/list')
 @login_required(role='CRM')
+@conditional_get()
 def crm_list():
     user = current_user()
     sort_by = request.args.get('sort_by','booking_date')
@@ -300,66 +1310,37 @@ def crm_list():
     }
     col = allowed.get(sort_by, 'booking_date')
     dir_sql = 'DESC' if sort_dir == 'desc' else 'ASC'
-    # keep NULL dates last when sorting by date desc
-    if col == 'booking_date' and dir_sql == 'DESC':
-        order_clause = "(booking_date IS NULL) ASC, booking_date DESC, s_no DESC"
-    else:
-        order_clause = f"{col} {dir_sql}"
+    limit = parse_limit(50, (25,50,100))
+    q = request.args.get('q', '').strip()
+    where, params = search_filter('crm_name = ?', [user.username], q)
     conn = engine.raw_connection()
-    rows = []
     try:
         cur = conn.cursor()
-        cur.execute(f"SELECT rowid, * FROM sale_details WHERE crm_name = ? ORDER BY {order_clause}", (user.username,))
-        cols = [d[0] for d in cur.description]
-        for r in cur.fetchall():
-            rows.append(dict(zip(cols, r)))
+        rows, total, page, next_page, prev_page = fetch_page(cur, 'rowid, *', where, params, col, dir_sql, limit)
     finally:
         conn.close()
-    return render_template('crm_list.html', rows=rows, user=user, sort_by=col, sort_dir=dir_sql.lower())
+    return render_template('crm_list.html', rows=rows, user=user, sort_by=col, sort_dir=dir_sql.lower(), q=q,
+                           total=total, page=page, next_page=next_page, prev_page=prev_page, limit=limit, page_args=page_args())
 
 @app.route('/crm/export')
 @login_required(role='CRM')
 def crm_export():
     user = current_user()
-    conn = engine.raw_connection()
-    try:
-        cur = conn.cursor()
-        # Same columns/order as Admin dashboard export but filtered to current CRM
-        query = (
-            "SELECT "
-            "s_no, booking_date, project, spg_praneeth, token, buyer_name, sale_person_name, crm_name, sol, "
-            "type_of_sale, land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums, "
-            "total_sale_price, amount_received, balance_amount, balance_tobe_received_by_plan_approval, notes, "
-            "balance_tobe_received_during_exec "
-            "FROM sale_details WHERE crm_name = ? ORDER BY (booking_date IS NULL) ASC, booking_date DESC, s_no DESC"
-        )
-        cur.execute(query, (user.username,))
-        rows = cur.fetchall()
-        text = StringIO()
-        writer = csv.writer(text)
-        writer.writerow([
-            'S.No','Booking Date','Project','SPG/Praneeth','Token','Buyer Name','Sale Person Name','CRM Name','SOL',
-            'Type of Sale','Land (sq yards)','SBUA (sq feet)','Facing','Base sq ft price','Amenities and Premiums',
-            'Total Sale Price','Amount Received','Balance Amount','Balance to be received by plan approval','Notes',
-            'Balance to be received during execution'
-        ])
-        for r in rows:
-            r = list(r)
-            # currency fields by index in SELECT: 13,14,15,16,17,18,20
-            for idx in (13,14,15,16,17,18,20):
-                r[idx] = format_currency_csv(r[idx])
-            writer.writerow(r)
-        data = text.getvalue().encode('utf-8')
-        bio = BytesIO(data)
-        bio.seek(0)
-        uname = (user.username if user else 'user')
-        ts = datetime.today().strftime('%Y%m%d-%H%M%S')
-        return send_file(bio, mimetype='text/csv', as_attachment=True, download_name=f'{uname}_my_sales_{ts}.csv')
-    finally:
-        conn.close()
+    # Same columns/filters as Admin dashboard export but always limited to current CRM
+    where, params = sale_filters(request.args.get('year'), request.args.get('month'), user.username,
+                                 request.args.get('sale_person_name'), request.args.get('spg_praneeth'),
+                                 request.args.get('type_of_sale'))
+    where, params = search_filter(where, params, request.args.get('q'))
+    query = (
+        f"SELECT {EXPORT_COLUMNS} "
+        f"FROM sale_details WHERE {where} ORDER BY (booking_date IS NULL) ASC, booking_date DESC, s_no DESC"
+    )
+    uname = (user.username if user else 'user')
+    return export_response(query, params, f'{uname}_my_sales')
 
 @app.route('/crm/edit/<int:rowid>', methods=['GET','POST'])
 @login_required(role='CRM')
+@conditional_get()
 def crm_edit(rowid):
     user = current_user()
     conn = engine.raw_connection()
@@ -391,7 +1372,11 @@ def crm_edit(rowid):
             vals.append(user.username)
             vals.append(rowid)
             sql = f"UPDATE sale_details SET {', '.join(sets)} WHERE crm_name = ? AND rowid = ?"
+            cur.execute("BEGIN IMMEDIATE")
+            rollup_apply(cur, rowid, -1, user.username)
             cur.execute(sql, tuple(vals))
+            rollup_apply(cur, rowid, 1, user.username)
+            bump_data_version(cur, 'sales')
             conn.commit()
             return redirect(url_for('crm_list'))
         else:
@@ -405,8 +1390,7 @@ def crm_edit(rowid):
             # payments
             cur.execute("SELECT paid_date, amount, note FROM payments WHERE sale_rowid = ? ORDER BY paid_date DESC, id DESC", (rowid,))
             payments = cur.fetchall()
-            cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE sale_rowid = ?", (rowid,))
-            pay_total = cur.fetchone()[0] or 0
+            pay_total = payments_total(cur, rowid)
             sale_people = get_sales_people_names()
             return render_template('crm_edit.html', row=rec, user=user, payments=payments, payments_total=pay_total, sale_people=sale_people)
     finally:
@@ -419,7 +1403,9 @@ def crm_delete(rowid):
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        cur.execute("DELETE FROM sale_details WHERE rowid = ? AND crm_name = ?", (rowid, user.username))
+        cur.execute("BEGIN IMMEDIATE")
+        delete_sale(cur, rowid, user.username)
+        bump_data_version(cur, 'sales')
         conn.commit()
         flash('Entry deleted', 'success')
     finally:
@@ -429,6 +1415,7 @@ def crm_delete(rowid):
 # Admin routes
 @app.route('/admin/dashboard')
 @login_required(role='ADMIN')
+@conditional_get()
 def admin_dashboard():
     # Filters
     month = request.args.get('month')
@@ -437,41 +1424,19 @@ def admin_dashboard():
     sp = request.args.get('sale_person_name')
     spg = request.args.get('spg_praneeth')
     tos = request.args.get('type_of_sale')
+    q = request.args.get('q', '').strip()
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
         # Options for dropdowns
-        cur.execute("SELECT DISTINCT crm_name FROM sale_details WHERE crm_name IS NOT NULL ORDER BY crm_name")
-        crm_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT DISTINCT sale_person_name FROM sale_details WHERE sale_person_name IS NOT NULL ORDER BY sale_person_name")
-        sp_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT value FROM spg_options ORDER BY value")
-        spg_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT value FROM sale_type_options ORDER BY value")
-        tos_opts = [r[0] for r in cur.fetchall()]
+        crm_opts = get_crm_names()
+        sp_opts = get_sale_person_names()
+        spg_opts = get_options('spg_options')
+        tos_opts = get_options('sale_type_options')
 
         # Detailed rows with all required columns for dashboard order
-        query = (
-            "SELECT rowid, "
-            "s_no, booking_date, project, spg_praneeth, token, buyer_name, sale_person_name, crm_name, sol, "
-            "type_of_sale, land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums, "
-            "total_sale_price, amount_received, balance_amount, balance_tobe_received_by_plan_approval, notes, "
-            "balance_tobe_received_during_exec "
-            "FROM sale_details WHERE 1=1"
-        )
-        params = []
-        if year:
-            query += " AND strftime('%Y', booking_date) = ?"; params.append(year)
-        if month:
-            query += " AND strftime('%m', booking_date) = ?"; params.append(month.zfill(2))
-        if crm:
-            query += " AND crm_name = ?"; params.append(crm)
-        if sp:
-            query += " AND sale_person_name = ?"; params.append(sp)
-        if spg:
-            query += " AND spg_praneeth = ?"; params.append(spg)
-        if tos:
-            query += " AND type_of_sale = ?"; params.append(tos)
+        columns = "rowid, " + EXPORT_COLUMNS
+        where, params = search_filter(*sale_filters(year, month, crm, sp, spg, tos), q)
         # Sorting
         sort_by = request.args.get('sort_by','booking_date')
         sort_dir = request.args.get('sort_dir','desc').lower()
@@ -485,92 +1450,212 @@ def admin_dashboard():
         }
         col = allowed.get(sort_by, 'booking_date')
         dir_sql = 'DESC' if sort_dir == 'desc' else 'ASC'
-        if col == 'booking_date' and dir_sql == 'DESC':
-            query += " ORDER BY (booking_date IS NULL) ASC, booking_date DESC, s_no DESC"
-        else:
-            query += f" ORDER BY {col} {dir_sql}"
         # limit rows: default 10, allow 25 or 50
-        try:
-            limit = int(request.args.get('limit') or 10)
-        except:
-            limit = 10
-        if limit not in (10,25,50):
-            limit = 10
-        query += " LIMIT ?"
-        params.append(limit)
-        cur.execute(query, tuple(params))
-        rows = cur.fetchall()
-        cols = [d[0] for d in cur.description]
-        data = [dict(zip(cols, r)) for r in rows]
+        limit = parse_limit(10, (10,25,50))
+        data, total, page, next_page, prev_page = fetch_page(cur, columns, where, params, col, dir_sql, limit)
+        kpis, kpi_breakdowns = rollup_summary(year, month, crm, sp, spg, tos, q)
         # Year options: current, current-1, current-2
         cur_year = int(datetime.today().strftime('%Y'))
         years = [str(cur_year - i) for i in range(0,3)]
-        return render_template('admin_dashboard.html', data=data, filters={'year':year,'month':month,'crm':crm,'sp':sp,'spg':spg,'tos':tos},
+        return render_template('admin_dashboard.html', data=data, filters={'year':year,'month':month,'crm':crm,'sp':sp,'spg':spg,'tos':tos,'q':q},
                                crm_opts=crm_opts, sp_opts=sp_opts, spg_opts=spg_opts, tos_opts=tos_opts, years=years, limit=limit,
-                               sort_by=col, sort_dir=dir_sql.lower())
+                               sort_by=col, sort_dir=dir_sql.lower(),
+                               total=total, page=page, next_page=next_page, prev_page=prev_page, page_args=page_args(),
+                               kpis=kpis, kpi_breakdowns=kpi_breakdowns)
     finally:
         conn.close()
 
+def dashboard_export_query(args):
+    """SELECT for the dashboard filters in args (request.args or request.values)."""
+    where, params = search_filter(*sale_filters(args.get('year'), args.get('month'), args.get('crm_name'),
+                                                args.get('sale_person_name'), args.get('spg_praneeth'),
+                                                args.get('type_of_sale')), args.get('q'))
+    return f"SELECT {EXPORT_COLUMNS} FROM sale_details WHERE {where}", where, params
+
 @app.route('/admin/export')
 @login_required(role='ADMIN')
 def admin_export():
-    # Export current filtered dashboard data as CSV
-    month = request.args.get('month')
-    year = request.args.get('year')
-    crm = request.args.get('crm_name')
-    sp = request.args.get('sale_person_name')
-    spg = request.args.get('spg_praneeth')
-    tos = request.args.get('type_of_sale')
-    conn = engine.raw_connection()
+    # Export current filtered dashboard data as CSV (or .xlsx with format=xlsx)
+    query, _, params = dashboard_export_query(request.args)
+    user = current_user()
+    uname = (user.username if user else 'admin')
+    return export_response(query, params, f'{uname}_dashboard')
+
+# Background export jobs: the dashboard submits its filters, a bounded pool
+# writes the file under EXPORT_JOB_DIR, and the browser polls the status
+# endpoint and downloads the result. Identical requests (same format,
+# filters and data version) share one job while it runs and for
+# EXPORT_JOB_TTL seconds after.
+#
+# Job state is a JSON file next to the export (<id>.json), so whichever
+# worker process gets the status or download request can answer it. The
+# job id is the hash of the request, and the state file is created
+# exclusively, so two workers given the same request at once share a job.
+# A job whose state stops changing for EXPORT_JOB_TTL seconds (finished,
+# or its worker died) is expired on the next submit, status or download.
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', os.path.join(tempfile.gettempdir(), 'arcadia_exports'))
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', '2'))
+EXPORT_JOB_TTL = float(os.environ.get('EXPORT_JOB_TTL', '900'))
+EXPORT_JOB_SAVE_EVERY = 1.0
+EXPORT_JOB_ID = re.compile(r'[0-9a-f]{40}')
+_export_pool = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix='exports')
+_export_lock = threading.Lock()
+
+def export_job_state_path(job_id):
+    return os.path.join(EXPORT_JOB_DIR, f"{job_id}.json")
+
+def load_export_job(job_id):
+    if not EXPORT_JOB_ID.fullmatch(job_id or ''):
+        return None
     try:
-        cur = conn.cursor()
-        # Use same column set and order as the dashboard table
-        query = (
-            "SELECT "
-            "s_no, booking_date, project, spg_praneeth, token, buyer_name, sale_person_name, crm_name, sol, "
-            "type_of_sale, land_sqyards, sbua_sqft, facing, base_sqft_price, amenties_and_premiums, "
-            "total_sale_price, amount_received, balance_amount, balance_tobe_received_by_plan_approval, notes, "
-            "balance_tobe_received_during_exec "
-            "FROM sale_details WHERE 1=1"
-        )
-        params = []
-        if year:
-            query += " AND strftime('%Y', booking_date) = ?"; params.append(year)
-        if month:
-            query += " AND strftime('%m', booking_date) = ?"; params.append(month.zfill(2))
-        if crm:
-            query += " AND crm_name = ?"; params.append(crm)
-        if sp:
-            query += " AND sale_person_name = ?"; params.append(sp)
-        if spg:
-            query += " AND spg_praneeth = ?"; params.append(spg)
-        if tos:
-            query += " AND type_of_sale = ?"; params.append(tos)
-        cur.execute(query, tuple(params))
-        rows = cur.fetchall()
-        text = StringIO()
-        writer = csv.writer(text)
-        writer.writerow([
-            'S.No','Booking Date','Project','SPG/Praneeth','Token','Buyer Name','Sale Person Name','CRM Name','SOL',
-            'Type of Sale','Land (sq yards)','SBUA (sq feet)','Facing','Base sq ft price','Amenities and Premiums',
-            'Total Sale Price','Amount Received','Balance Amount','Balance to be received by plan approval','Notes',
-            'Balance to be received during execution'
-        ])
-        for r in rows:
-            r = list(r)
-            # currency fields by index in SELECT: 13,14,15,16,17,18,20
-            for idx in (13,14,15,16,17,18,20):
-                r[idx] = format_currency_csv(r[idx])
-            writer.writerow(r)
-        data = text.getvalue().encode('utf-8')
-        bio = BytesIO(data)
-        bio.seek(0)
-        user = current_user()
-        uname = (user.username if user else 'admin')
-        ts = datetime.today().strftime('%Y%m%d-%H%M%S')
-        return send_file(bio, mimetype='text/csv', as_attachment=True, download_name=f'{uname}_dashboard_{ts}.csv')
+        with open(export_job_state_path(job_id)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def save_export_job(job, create=False):
+    """Write job's state file; with create=True fail (FileExistsError) if it exists."""
+    job['updated'] = time.time()
+    data = json.dumps(job)
+    path = export_job_state_path(job['id'])
+    if create:
+        with open(path, 'x') as fh:
+            fh.write(data)
+        return
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+def remove_export_job(job):
+    for path in (job['path'], export_job_state_path(job['id'])):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def export_job_expired(job, now):
+    return now - (job.get('finished') or job.get('updated') or 0) > EXPORT_JOB_TTL
+
+def run_export_job(job, query, where, params):
+    if load_export_job(job['id']) is None:
+        return  # expired while it was queued
+    job['status'] = 'running'
+    save_export_job(job)
+    tmp = job['path'] + '.part'
+    saved = [time.monotonic()]
+    def progress(n):
+        job['rows'] += n
+        if time.monotonic() - saved[0] >= EXPORT_JOB_SAVE_EVERY:
+            save_export_job(job)
+            saved[0] = time.monotonic()
+    try:
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM sale_details WHERE {where}", params)
+            job['total'] = cur.fetchone()[0]
+        finally:
+            conn.close()
+        with open(tmp, 'wb') as fh:
+            if job['format'] == 'xlsx':
+                write_xlsx(fh, query, params, progress)
+            else:
+                for chunk in iter_csv(query, params, progress):
+                    fh.write(chunk.encode('utf-8'))
+        os.replace(tmp, job['path'])
+        job['status'] = 'done'
+    except Exception as e:
+        app.logger.exception("export job %s failed", job['id'])
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        if os.path.exists(tmp):
+            os.remove(tmp)
     finally:
-        conn.close()
+        job['finished'] = time.time()
+        save_export_job(job)
+
+def expire_export_jobs(now):
+    try:
+        names = os.listdir(EXPORT_JOB_DIR)
+    except OSError:
+        return
+    for name in names:
+        job_id, ext = os.path.splitext(name)
+        if ext == '.json':
+            job = load_export_job(job_id)
+            if job is not None and export_job_expired(job, now):
+                remove_export_job(job)
+
+def submit_export_job(fmt, query, where, params, basename):
+    version = (data_version('sales'), data_changed_at('sales'))
+    job_id = hashlib.sha1(repr((fmt, query, list(params), version)).encode('utf-8')).hexdigest()
+    with _export_lock:
+        now = time.time()
+        expire_export_jobs(now)
+        job = load_export_job(job_id)
+        if job is not None and job['status'] != 'failed':
+            return job
+        if job is not None:
+            remove_export_job(job)
+        os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+        ts = datetime.today().strftime('%Y%m%d-%H%M%S')
+        job = {
+            'id': job_id, 'format': fmt, 'status': 'queued', 'rows': 0, 'total': None,
+            'error': None, 'created': now, 'finished': None,
+            'path': os.path.join(EXPORT_JOB_DIR, f"{job_id}.{fmt}"), 'download_name': f"{basename}_{ts}.{fmt}",
+        }
+        try:
+            save_export_job(job, create=True)
+        except FileExistsError:
+            # another worker took the same request a moment ago
+            return load_export_job(job_id) or job
+        _export_pool.submit(slow_queries.attributed, request.endpoint, run_export_job, job, query, where, tuple(params))
+    return job
+
+def find_export_job(job_id):
+    """The job's current state, or None if it is unknown or has expired."""
+    expire_export_jobs(time.time())
+    return load_export_job(job_id)
+
+def export_job_status(job):
+    total = job['total']
+    status = {
+        'id': job['id'], 'status': job['status'], 'format': job['format'], 'rows': job['rows'], 'total': total,
+        'progress': (min(1.0, job['rows'] / total) if total else (1.0 if job['status'] == 'done' else 0.0)),
+        'error': job['error'], 'status_url': url_for('admin_export_job', job_id=job['id']),
+    }
+    if job['status'] == 'done':
+        status['download_url'] = url_for('admin_export_job_download', job_id=job['id'])
+    return status
+
+@app.route('/admin/export/jobs', methods=['POST'])
+@login_required(role='ADMIN')
+def admin_export_jobs():
+    query, where, params = dashboard_export_query(request.values)
+    fmt = 'xlsx' if request.values.get('format') == 'xlsx' else 'csv'
+    user = current_user()
+    uname = (user.username if user else 'admin')
+    job = submit_export_job(fmt, query, where, params, f'{uname}_dashboard')
+    return jsonify(export_job_status(job)), 202
+
+@app.route('/admin/export/jobs/<job_id>')
+@login_required(role='ADMIN')
+def admin_export_job(job_id):
+    job = find_export_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown or expired export job'}), 404
+    return jsonify(export_job_status(job))
+
+@app.route('/admin/export/jobs/<job_id>/download')
+@login_required(role='ADMIN')
+def admin_export_job_download(job_id):
+    job = find_export_job(job_id)
+    if not job or job['status'] != 'done' or not os.path.exists(job['path']):
+        flash('Export not available', 'error')
+        return redirect(url_for('admin_dashboard'))
+    return send_file(job['path'], mimetype=XLSX_MIMETYPE if job['format'] == 'xlsx' else 'text/csv',
+                     as_attachment=True, download_name=job['download_name'])
 
 @app.route('/admin/crms')
 @login_required(role='ADMIN')
@@ -596,7 +1681,12 @@ def admin_crms_new():
         if db.query(User).filter_by(username=username).first():
             flash('Username already exists', 'error')
         else:
-            db.add(User(username=username, password_hash=generate_password_hash(password), role=role))
+            try:
+                password_hash = run_hash(hash_password, password)
+            except (HashPoolBusy, FutureTimeout):
+                flash('Server busy, user not created; please try again in a moment', 'error')
+                return redirect(url_for('admin_crms'))
+            db.add(User(username=username, password_hash=password_hash, role=role))
             db.commit()
             flash('User created', 'success')
     finally:
@@ -615,9 +1705,14 @@ def admin_crms_edit(uid):
             flash('User not found', 'error')
         else:
             if password:
-                u.password_hash = generate_password_hash(password)
+                try:
+                    u.password_hash = run_hash(hash_password, password)
+                except (HashPoolBusy, FutureTimeout):
+                    flash('Server busy, user not updated; please try again in a moment', 'error')
+                    return redirect(url_for('admin_crms'))
             u.role = role if role in ('CRM','ADMIN') else u.role
             db.commit()
+            invalidate_user(uid)
             flash('User updated', 'success')
     finally:
         db.close()
@@ -634,6 +1729,7 @@ def admin_crms_delete(uid):
         else:
             db.delete(u)
             db.commit()
+            invalidate_user(uid)
             flash('User deleted', 'success')
     finally:
         db.close()
@@ -665,9 +1761,9 @@ def admin_new():
         conn = engine.raw_connection()
         try:
             cur = conn.cursor()
-            # next s_no
-            cur.execute("SELECT COALESCE(MAX(s_no), 0) + 1 FROM sale_details")
-            next_sno = cur.fetchone()[0]
+            # next s_no, allocated inside the insert transaction
+            cur.execute("BEGIN IMMEDIATE")
+            next_sno = next_sequence_value(cur, 's_no')
             cur.execute(
                 """
                 INSERT INTO sale_details (
@@ -702,6 +1798,8 @@ def admin_new():
                     user.username
                 )
             )
+            rollup_apply(cur, cur.lastrowid, 1)
+            bump_data_version(cur, 'sales')
             conn.commit()
         finally:
             conn.close()
@@ -711,15 +1809,9 @@ def admin_new():
         flash('Sale created', 'success')
         return redirect(url_for('admin_new', saved=1, s_no=int(next_sno)))
     # GET: provide options, next s_no, and today
-    conn = engine.raw_connection()
-    spg_opts, tos_opts, next_sno = [], [], 1
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM spg_options ORDER BY value"); spg_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT value FROM sale_type_options ORDER BY value"); tos_opts = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT COALESCE(MAX(s_no), 0) + 1 FROM sale_details"); next_sno = cur.fetchone()[0]
-    finally:
-        conn.close()
+    spg_opts = get_options('spg_options')
+    tos_opts = get_options('sale_type_options')
+    next_sno = peek_sequence_value('s_no')
     today = datetime.today().strftime('%Y-%m-%d')
     sale_people = get_sales_people_names()
     return render_template('admin_new.html', spg_opts=spg_opts, tos_opts=tos_opts, next_sno=next_sno, today=today, sale_people=sale_people)
@@ -727,6 +1819,7 @@ def admin_new():
 # Admin: My Entries list (only entries created by this admin)
 @app.route('/admin/entries')
 @login_required(role='ADMIN')
+@conditional_get()
 def admin_entries():
     user = current_user()
     sort_by = request.args.get('sort_by','booking_date')
@@ -738,25 +1831,22 @@ def admin_entries():
     }
     col = allowed.get(sort_by, 'booking_date')
     dir_sql = 'DESC' if sort_dir == 'desc' else 'ASC'
-    if col == 'booking_date' and dir_sql == 'DESC':
-        order_clause = "(booking_date IS NULL) ASC, booking_date DESC, s_no DESC"
-    else:
-        order_clause = f"{col} {dir_sql}"
+    limit = parse_limit(50, (25,50,100))
+    q = request.args.get('q', '').strip()
+    where, params = search_filter('crm_name = ?', [user.username], q)
     conn = engine.raw_connection()
-    rows = []
     try:
         cur = conn.cursor()
-        cur.execute(f"SELECT rowid, * FROM sale_details WHERE crm_name = ? ORDER BY {order_clause}", (user.username,))
-        cols = [d[0] for d in cur.description]
-        for r in cur.fetchall():
-            rows.append(dict(zip(cols, r)))
+        rows, total, page, next_page, prev_page = fetch_page(cur, 'rowid, *', where, params, col, dir_sql, limit)
     finally:
         conn.close()
-    return render_template('admin_list.html', rows=rows, user=user, sort_by=col, sort_dir=dir_sql.lower())
+    return render_template('admin_list.html', rows=rows, user=user, sort_by=col, sort_dir=dir_sql.lower(), q=q,
+                           total=total, page=page, next_page=next_page, prev_page=prev_page, limit=limit, page_args=page_args())
 
 # Admin: Sale detail view
 @app.route('/admin/sales/<int:rowid>')
 @login_required(role='ADMIN')
+@conditional_get()
 def admin_sale_detail(rowid):
     user = current_user()
     conn = engine.raw_connection()
@@ -783,12 +1873,143 @@ def crm_sales_people():
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        cur.execute("SELECT id, full_name, phone, email, address, title FROM sales_people WHERE owner_username = ? ORDER BY full_name", (user.username,))
-        people = cur.fetchall()
+        cur.execute("SELECT id, full_name, phone, email, address, title, photo_path FROM sales_people WHERE owner_username = ? ORDER BY full_name", (user.username,))
+        people = [r[:6] + (photo_name(r[6]),) for r in cur.fetchall()]
         return render_template('crm_sales_people.html', people=people)
     finally:
         conn.close()
 
+# Sales-people photos are stored once per content (sha256 name) and shown
+# through small thumbnails rendered by a background worker pool. Until a
+# thumbnail exists the original image is served; an upload that can't be
+# thumbnailed gets a <thumb>.failed marker, is never queued again, and is
+# shown as a placeholder.
+UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+THUMB_DIR = os.path.join(UPLOAD_DIR, 'thumbs')
+THUMB_SIZE = int(os.environ.get('THUMB_SIZE', '160'))
+THUMB_WORKERS = int(os.environ.get('THUMB_WORKERS', '2'))
+THUMB_WAIT = float(os.environ.get('THUMB_WAIT', '2'))
+_thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS, thread_name_prefix='thumbs')
+_thumb_jobs = {}
+_thumb_lock = threading.Lock()
+PHOTO_PLACEHOLDER = (
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 40 40"><rect width="40" height="40" fill="#e5e7eb"/>'
+    '<circle cx="20" cy="15" r="7" fill="#9ca3af"/><path d="M6 38c2-9 8-13 14-13s12 4 14 13z" fill="#9ca3af"/></svg>'
+)
+
+def store_upload(photo):
+    """Save an uploaded file under its content hash; returns the stored name.
+
+    Identical uploads map to the same file, so a photo is only stored once.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    ext = os.path.splitext(photo.filename or '')[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,5}', ext):
+        ext = ''
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            while True:
+                chunk = photo.stream.read(64 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                fh.write(chunk)
+        name = digest.hexdigest() + ext
+        if os.path.exists(os.path.join(UPLOAD_DIR, name)):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, os.path.join(UPLOAD_DIR, name))
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    queue_thumbnail(name)
+    return name
+
+def photo_name(photo_path):
+    """Stored file name for a photo_path (older rows hold absolute, possibly Windows, paths)."""
+    return photo_path.replace('\\', '/').rsplit('/', 1)[-1] if photo_path else None
+
+def thumbnail_path(name):
+    return os.path.join(THUMB_DIR, f"{os.path.splitext(name)[0]}_{THUMB_SIZE}.jpg")
+
+def thumbnail_failed(name):
+    return os.path.exists(thumbnail_path(name) + '.failed')
+
+def make_thumbnail(name):
+    target = thumbnail_path(name)
+    if os.path.exists(target):
+        return target
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    tmp = target + '.part'
+    try:
+        with Image.open(os.path.join(UPLOAD_DIR, name)) as img:
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+            img.save(tmp, 'JPEG', quality=85, optimize=True)
+    except Exception as e:
+        app.logger.warning("no thumbnail for %s: %s", name, e)
+        with open(target + '.failed', 'w') as fh:
+            fh.write(f"{type(e).__name__}: {e}\n")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, target)
+    return target
+
+def queue_thumbnail(name):
+    """Schedule a thumbnail for name (once); returns the Future, or None without
+    Pillow or when an earlier attempt failed."""
+    if Image is None or thumbnail_failed(name):
+        return None
+    with _thumb_lock:
+        job = _thumb_jobs.get(name)
+        if job is None:
+            job = _thumb_jobs[name] = _thumb_pool.submit(make_thumbnail, name)
+            job.add_done_callback(lambda _, name=name: _thumb_jobs.pop(name, None))
+        return job
+
+@app.route('/crm/sales_people/<int:pid>/photo/<name>')
+@login_required(role='CRM')
+def crm_sales_people_photo(pid, name):
+    user = current_user()
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT photo_path FROM sales_people WHERE owner_username = ? AND id = ?", (user.username, pid))
+        row = cur.fetchone()
+    finally:
+        conn.close()
+    if not row or photo_name(row[0]) != name or not os.path.exists(os.path.join(UPLOAD_DIR, name)):
+        return Response(status=404)
+    path = thumbnail_path(name)
+    if not os.path.exists(path):
+        job = queue_thumbnail(name)
+        try:
+            if job is None:
+                raise FutureTimeout()
+            path = job.result(timeout=THUMB_WAIT)
+        except Exception:
+            return photo_fallback(name)
+    resp = send_file(path, mimetype='image/jpeg', max_age=365 * 24 * 3600)
+    # the URL carries the content hash, so the bytes behind it never change
+    resp.headers['Cache-Control'] = f'private, max-age={365 * 24 * 3600}, immutable'
+    return resp
+
+def photo_fallback(name):
+    """The original upload while its thumbnail isn't ready, or a placeholder if it can't be shown."""
+    mimetype = mimetypes.guess_type(name)[0] or ''
+    if mimetype.startswith('image/') and not thumbnail_failed(name):
+        resp = send_file(os.path.join(UPLOAD_DIR, name), mimetype=mimetype)
+        # not cached: the next visit should get the thumbnail
+        resp.headers['Cache-Control'] = 'no-store'
+    else:
+        resp = Response(PHOTO_PLACEHOLDER, mimetype='image/svg+xml')
+        resp.headers['Cache-Control'] = 'private, max-age=3600'
+    return resp
+
 @app.route('/crm/sales_people/new', methods=['GET','POST'])
 @login_required(role='CRM')
 def crm_sales_people_new():
@@ -802,17 +2023,13 @@ def crm_sales_people_new():
         photo = request.files.get('photo')
         photo_path = None
         if photo and photo.filename:
-            uploads = os.path.join(BASE_DIR, 'uploads')
-            os.makedirs(uploads, exist_ok=True)
-            fname = f"{int(datetime.now().timestamp())}_{photo.filename}"
-            fpath = os.path.join(uploads, fname)
-            photo.save(fpath)
-            photo_path = fpath
+            photo_path = store_upload(photo)
         conn = engine.raw_connection()
         try:
             cur = conn.cursor()
             cur.execute("INSERT INTO sales_people(full_name, phone, email, address, title, photo_path, owner_username) VALUES(?,?,?,?,?,?,?)",
                         (full_name, phone, email, address, title, photo_path, user.username))
+            bump_data_version(cur, 'sales_people')
             conn.commit()
             flash('Sales person added','success')
         finally:
@@ -836,12 +2053,7 @@ def crm_sales_people_edit(pid):
             photo = request.files.get('photo')
             photo_path = None
             if photo and photo.filename:
-                uploads = os.path.join(BASE_DIR, 'uploads')
-                os.makedirs(uploads, exist_ok=True)
-                fname = f"{int(datetime.now().timestamp())}_{photo.filename}"
-                fpath = os.path.join(uploads, fname)
-                photo.save(fpath)
-                photo_path = fpath
+                photo_path = store_upload(photo)
             sets = ["full_name=?","phone=?","email=?","address=?","title=?"]
             vals = [full_name, phone, email, address, title]
             if photo_path:
@@ -849,6 +2061,7 @@ def crm_sales_people_edit(pid):
                 vals.append(photo_path)
             vals += [user.username, pid]
             cur.execute(f"UPDATE sales_people SET {', '.join(sets)} WHERE owner_username = ? AND id = ?", tuple(vals))
+            bump_data_version(cur, 'sales_people')
             conn.commit()
             flash('Sales person updated','success')
             return redirect(url_for('crm_sales_people'))
@@ -860,6 +2073,7 @@ def crm_sales_people_edit(pid):
                 return redirect(url_for('crm_sales_people'))
             cols = [d[0] for d in cur.description]
             person = dict(zip(cols, row))
+            person['photo_name'] = photo_name(person['photo_path'])
             return render_template('crm_sales_people_form.html', person=person)
     finally:
         conn.close()
@@ -872,6 +2086,7 @@ def crm_sales_people_delete(pid):
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM sales_people WHERE owner_username = ? AND id = ?", (user.username, pid))
+        bump_data_version(cur, 'sales_people')
         conn.commit()
         flash('Sales person deleted','success')
     finally:
@@ -913,7 +2128,11 @@ def admin_edit(rowid):
             vals.append(user.username)
             vals.append(rowid)
             sql = f"UPDATE sale_details SET {', '.join(sets)} WHERE crm_name = ? AND rowid = ?"
+            cur.execute("BEGIN IMMEDIATE")
+            rollup_apply(cur, rowid, -1, user.username)
             cur.execute(sql, tuple(vals))
+            rollup_apply(cur, rowid, 1, user.username)
+            bump_data_version(cur, 'sales')
             conn.commit()
             return redirect(url_for('admin_entries'))
         else:
@@ -927,8 +2146,7 @@ def admin_edit(rowid):
             # payments
             cur.execute("SELECT paid_date, amount, note FROM payments WHERE sale_rowid = ? ORDER BY paid_date DESC, id DESC", (rowid,))
             payments = cur.fetchall()
-            cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE sale_rowid = ?", (rowid,))
-            pay_total = cur.fetchone()[0] or 0
+            pay_total = payments_total(cur, rowid)
             return render_template('crm_edit.html', row=rec, user=user, payments=payments, payments_total=pay_total)
     finally:
         conn.close()
@@ -941,7 +2159,9 @@ def crm_add_payment(rowid):
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        # Ownership check
+        # Ownership check; the write lock is taken first so the sale row and
+        # its payment total cannot change underneath us
+        cur.execute("BEGIN IMMEDIATE")
         cur.execute("SELECT total_sale_price, amount_received, type_of_sale FROM sale_details WHERE rowid = ? AND crm_name = ?", (rowid, user.username))
         row = cur.fetchone()
         if not row:
@@ -958,14 +2178,8 @@ def crm_add_payment(rowid):
         if amt <= 0:
             flash('Amount must be positive', 'error')
             return redirect(url_for('crm_edit', rowid=rowid))
-        cur.execute("INSERT INTO payments(sale_rowid, paid_date, amount, note) VALUES(?,?,?,?)", (rowid, paid_date, amt, note))
-        # recompute balances using amount_received + sum(payments)
-        cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE sale_rowid = ?", (rowid,))
-        pay_sum = cur.fetchone()[0] or 0
-        effective_received = (amount_received or 0) + pay_sum
-        balance = (total_sale_price or 0) - effective_received
-        by_plan = balance if tos == 'OTP' else (total_sale_price * 0.20) - balance
-        cur.execute("UPDATE sale_details SET balance_amount = ?, balance_tobe_received_by_plan_approval = ? WHERE rowid = ?", (balance, by_plan, rowid))
+        record_payment(cur, rowid, paid_date, amt, note, total_sale_price, amount_received, tos)
+        bump_data_version(cur, 'sales')
         conn.commit()
         flash('Payment added', 'success')
         return redirect(url_for('crm_edit', rowid=rowid))
@@ -980,6 +2194,7 @@ def admin_add_payment(rowid):
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
         cur.execute("SELECT total_sale_price, amount_received, type_of_sale FROM sale_details WHERE rowid = ? AND crm_name = ?", (rowid, user.username))
         row = cur.fetchone()
         if not row:
@@ -996,13 +2211,8 @@ def admin_add_payment(rowid):
         if amt <= 0:
             flash('Amount must be positive', 'error')
             return redirect(url_for('admin_edit', rowid=rowid))
-        cur.execute("INSERT INTO payments(sale_rowid, paid_date, amount, note) VALUES(?,?,?,?)", (rowid, paid_date, amt, note))
-        cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE sale_rowid = ?", (rowid,))
-        pay_sum = cur.fetchone()[0] or 0
-        effective_received = (amount_received or 0) + pay_sum
-        balance = (total_sale_price or 0) - effective_received
-        by_plan = balance if tos == 'OTP' else (total_sale_price * 0.20) - balance
-        cur.execute("UPDATE sale_details SET balance_amount = ?, balance_tobe_received_by_plan_approval = ? WHERE rowid = ?", (balance, by_plan, rowid))
+        record_payment(cur, rowid, paid_date, amt, note, total_sale_price, amount_received, tos)
+        bump_data_version(cur, 'sales')
         conn.commit()
         flash('Payment added', 'success')
         return redirect(url_for('admin_edit', rowid=rowid))
@@ -1017,7 +2227,9 @@ def admin_delete(rowid):
     conn = engine.raw_connection()
     try:
         cur = conn.cursor()
-        cur.execute("DELETE FROM sale_details WHERE rowid = ? AND crm_name = ?", (rowid, user.username))
+        cur.execute("BEGIN IMMEDIATE")
+        delete_sale(cur, rowid, user.username)
+        bump_data_version(cur, 'sales')
         conn.commit()
         flash('Entry deleted', 'success')
     finally:
@@ -1038,20 +2250,207 @@ def admin_options():
             if action == 'add' and val:
                 try:
                     cur.execute(f"INSERT INTO {table}(value) VALUES (?)", (val,))
+                    bump_data_version(cur, 'options')
                     conn.commit()
                     flash('Option added', 'success')
                 except Exception:
                     flash('Option exists or invalid', 'error')
             elif action == 'delete' and val:
                 cur.execute(f"DELETE FROM {table} WHERE value = ?", (val,))
+                bump_data_version(cur, 'options')
                 conn.commit()
                 flash('Option deleted', 'success')
-        cur.execute("SELECT value FROM spg_options ORDER BY value"); spg = [r[0] for r in cur.fetchall()]
-        cur.execute("SELECT value FROM sale_type_options ORDER BY value"); tos = [r[0] for r in cur.fetchall()]
+        spg = get_options('spg_options')
+        tos = get_options('sale_type_options')
         return render_template('admin_options.html', spg=spg, tos=tos)
     finally:
         conn.close()
 
+# Admin: database/connection diagnostics
+@app.route('/admin/diagnostics')
+@login_required(role='ADMIN')
+def admin_diagnostics():
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        effective = {}
+        for name in SQLITE_PRAGMAS:
+            cur.execute(f"PRAGMA {name}")
+            row = cur.fetchone()
+            effective[name] = row[0] if row else None
+        cur.execute("SELECT sqlite_version()")
+        version = cur.fetchone()[0]
+    finally:
+        conn.close()
+    return jsonify({
+        'sqlite_version': version,
+        'configured': SQLITE_PRAGMAS,
+        'effective': effective,
+        'pool': engine.pool.status(),
+    })
+
+# Admin: columnar snapshot for analytics jobs (see snapshot.py)
+@app.route('/admin/snapshot', methods=['POST'])
+@login_required(role='ADMIN')
+def admin_snapshot():
+    conn = engine.raw_connection()
+    try:
+        result = write_snapshot(conn, SNAPSHOT_DIR, full=request.args.get('full') == '1')
+    except SnapshotUnavailable as e:
+        return jsonify({'error': str(e)}), 501
+    finally:
+        conn.close()
+    return jsonify(result)
+
+# Admin: slowest query shapes since startup (see slow_queries.py)
+@app.route('/admin/slow-queries')
+@login_required(role='ADMIN')
+def admin_slow_queries():
+    return render_template('admin_slow_queries.html', user=current_user(), shapes=slow_queries.worst_shapes(),
+                           threshold_ms=None if slow_queries.SLOW_QUERY_SECONDS is None else slow_queries.SLOW_QUERY_SECONDS * 1000,
+                           log_path=slow_queries.SLOW_QUERY_LOG, started_at=slow_queries.started_at)
+
+@app.route('/admin/slow-queries/reset', methods=['POST'])
+@login_required(role='ADMIN')
+def admin_slow_queries_reset():
+    slow_queries.reset()
+    flash('Slow query statistics cleared', 'success')
+    return redirect(url_for('admin_slow_queries'))
+
+# Negotiated gzip for text responses. Buffered responses are compressed
+# when they reach COMPRESS_MIN_SIZE bytes; streamed ones (the CSV exports)
+# are compressed chunk by chunk, each chunk (an export batch) sync-flushed
+# so it reaches the client right away instead of once zlib's buffer fills.
+# Anything that already carries a Content-Encoding, or isn't text, is left
+# alone.
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_MIMETYPES = {'text/html', 'text/csv', 'text/plain', 'text/css', 'text/javascript',
+                      'application/json', 'application/javascript', 'image/svg+xml'}
+
+def gzip_stream(source, chunks):
+    z = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            yield z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+    finally:
+        # the original iterable (e.g. iter_csv) holds a DB connection
+        if hasattr(source, 'close'):
+            source.close()
+
+@app.after_request
+def compress_response(response):
+    if (COMPRESS_LEVEL <= 0 or request.method == 'HEAD' or request.endpoint == 'static'
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    if response.is_streamed:
+        response.response = gzip_stream(response.response, response.iter_encoded())
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    # same entity, different bytes: a strong validator would be wrong now
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Static assets are fingerprinted at startup: url_for('static', filename='app.js')
+# yields /static/app.<hash>.js, served from memory with gzip/brotli variants
+# compressed once and cached by browsers as immutable. Unknown names fall
+# back to Flask's normal static file handling.
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', str(365 * 24 * 3600)))
+STATIC_COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+_static_assets = {}
+_static_names = {}
+
+def build_static_assets():
+    root = app.static_folder
+    for dirpath, _, files in os.walk(root):
+        for fname in files:
+            path = os.path.join(dirpath, fname)
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            digest = hashlib.sha1(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(rel)
+            variants = {'identity': data}
+            if ext.lower() in STATIC_COMPRESSIBLE:
+                variants['gzip'] = gzip.compress(data, 9, mtime=0)
+                if brotli is not None:
+                    variants['br'] = brotli.compress(data, quality=11)
+            hashed = f"{stem}.{digest}{ext}"
+            _static_assets[hashed] = {
+                'digest': digest,
+                'mimetype': mimetypes.guess_type(rel)[0] or 'application/octet-stream',
+                'variants': {k: v for k, v in variants.items() if k == 'identity' or len(v) < len(data)},
+            }
+            _static_names[rel] = hashed
+
+@app.url_defaults
+def static_fingerprint(endpoint, values):
+    if endpoint == 'static':
+        hashed = _static_names.get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+def serve_static(filename):
+    asset = _static_assets.get(filename)
+    if asset is None:
+        return app.send_static_file(filename)
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['variants'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    resp = Response(asset['variants'][encoding], mimetype=asset['mimetype'])
+    if encoding != 'identity':
+        resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(f"{asset['digest']}-{encoding}")
+    resp.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+    resp.vary.add('Accept-Encoding')
+    return resp.make_conditional(request)
+
+app.view_functions['static'] = serve_static
+build_static_assets()
+
+# Prometheus scrape endpoint. Scrapers authenticate with
+# "Authorization: Bearer $METRICS_TOKEN"; signed-in admins may also look.
+# Recording only runs while someone is scraping (see metrics.py).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+@app.before_request
+def tag_endpoint():
+    request.environ[metrics.ENDPOINT_KEY] = request.endpoint or 'unmatched'
+
+@app.route('/metrics')
+def metrics_endpoint():
+    auth = request.headers.get('Authorization', '')
+    token_ok = bool(METRICS_TOKEN) and auth.startswith('Bearer ') and hmac.compare_digest(auth[7:], METRICS_TOKEN)
+    if not token_ok:
+        user = current_user()
+        if not user or user.role != 'ADMIN':
+            resp = Response('Forbidden\n', status=403, mimetype='text/plain')
+            if METRICS_TOKEN:
+                resp.headers['WWW-Authenticate'] = 'Bearer'
+                resp.status_code = 401
+            return resp
+    resp = Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+app.wsgi_app = metrics.instrument_wsgi(app.wsgi_app)
+
 # Static helper route for field rules (shown as tooltips/help)
 @app.route('/field-rules')
 def field_rules():
@@ -0,0 +1,332 @@
+"""Request and database metrics in the Prometheus text format.
+
+Recorded per endpoint: request latency (until the last body byte is sent,
+so streamed exports count in full), response size and the number of SQL
+statements each request ran. Recorded per statement kind: SQL duration.
+Recorded per pooled connection: how long it was checked out.
+
+SQL is timed on the DB-API cursor itself (a sqlite3 connection factory),
+not with SQLAlchemy's cursor events, because raw_connection() cursors
+never pass through those. Pool checkouts come from the engine's pool
+events.
+
+SQLite runs a SELECT lazily: execute() only steps to the first row and
+the rest of the work happens as rows are fetched. Statement durations
+(and the slow-query log) therefore cover execute() only. While recording,
+fetchone/fetchmany/fetchall calls are timed as well, reported as kind
+FETCH and counted into the request's SQL time, so batched streaming such
+as the exports is measured; rows read by iterating a cursor directly are
+not.
+
+Nothing is recorded until /metrics has been scraped, and recording stops
+again once nobody has scraped for METRICS_IDLE_AFTER seconds. Until the
+first scrape, with the slow-query log off (SLOW_QUERY_MS empty), cursors
+run statements without reading the clock at all; with it on, each
+execute() costs two clock reads.
+"""
+import bisect
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event
+
+import slow_queries
+
+METRICS_IDLE_AFTER = float(os.environ.get('METRICS_IDLE_AFTER', '600'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+SQL_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+SQL_KINDS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'CREATE', 'WITH'}
+
+_last_scrape = [None]
+_local = threading.local()
+
+
+def recording():
+    last = _last_scrape[0]
+    return last is not None and time.monotonic() - last < METRICS_IDLE_AFTER
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def label_text(names, values, extra=None):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(label_values)
+            if s is None:
+                s = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self.series.items())]
+        for values, counts, total, n in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % number(bound)
+                yield f'{self.name}_bucket{label_text(self.labels, values, le)} {cumulative}'
+            yield f'{self.name}_sum{label_text(self.labels, values)} {number(total)}'
+            yield f'{self.name}_count{label_text(self.labels, values)} {n}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            series = sorted(self.series.items())
+        for values, n in series:
+            yield f'{self.name}{label_text(self.labels, values)} {n}'
+
+
+class Gauge:
+    """A value read when scraped."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def render(self):
+        value = self.read()
+        if value is None:
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        yield f'{self.name} {number(value)}'
+
+
+REQUEST_SECONDS = Histogram('arcadia_http_request_duration_seconds',
+                            'Time from receiving a request to sending the last byte of its response.',
+                            LATENCY_BUCKETS, ('endpoint', 'method'))
+REQUESTS = Counter('arcadia_http_requests_total', 'Requests by endpoint, method and status code.',
+                   ('endpoint', 'method', 'status'))
+RESPONSE_BYTES = Histogram('arcadia_http_response_size_bytes', 'Response body size as sent (after compression).',
+                           SIZE_BUCKETS, ('endpoint',))
+REQUEST_SQL = Histogram('arcadia_http_request_sql_statements', 'SQL statements run while serving one request.',
+                        SQL_COUNT_BUCKETS, ('endpoint',))
+REQUEST_SQL_SECONDS = Histogram('arcadia_http_request_sql_duration_seconds',
+                                'Total SQL time spent while serving one request.', LATENCY_BUCKETS, ('endpoint',))
+SQL_SECONDS = Histogram('arcadia_sql_statement_duration_seconds',
+                        'Duration of single SQL statements by kind (execute only; kind FETCH times row fetches).',
+                        SQL_LATENCY_BUCKETS, ('kind',))
+CHECKOUT_SECONDS = Histogram('arcadia_db_connection_checkout_seconds',
+                             'How long a pooled connection stayed checked out.', LATENCY_BUCKETS)
+REGISTRY = [REQUEST_SECONDS, REQUESTS, RESPONSE_BYTES, REQUEST_SQL, REQUEST_SQL_SECONDS, SQL_SECONDS, CHECKOUT_SECONDS]
+
+
+def render():
+    """Return the exposition text and (re)start recording."""
+    _last_scrape[0] = time.monotonic()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- SQL ----------------------------------------------------------------------
+
+def sql_kind(sql):
+    word = sql.lstrip()[:8].split(None, 1)
+    word = word[0].upper() if word else ''
+    return word if word in SQL_KINDS else 'OTHER'
+
+
+def untimed():
+    """True while neither metrics nor the slow-query log need statement timings."""
+    return _last_scrape[0] is None and slow_queries.SLOW_QUERY_SECONDS is None
+
+
+def timed(cursor, sql, parameters, seconds, many=False):
+    if recording():
+        SQL_SECONDS.observe(seconds, sql_kind(sql))
+        totals = getattr(_local, 'sql', None)
+        if totals is not None:
+            totals[0] += 1
+            totals[1] += seconds
+    if slow_queries.SLOW_QUERY_SECONDS is not None and seconds >= slow_queries.SLOW_QUERY_SECONDS:
+        slow_queries.record(cursor.connection, sql, parameters, seconds, many)
+
+
+def fetched(seconds):
+    SQL_SECONDS.observe(seconds, 'FETCH')
+    totals = getattr(_local, 'sql', None)
+    if totals is not None:
+        totals[1] += seconds
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if untimed():
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            timed(self, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if untimed():
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            timed(self, sql, seq_of_parameters, time.perf_counter() - started, many=True)
+
+    def fetchone(self):
+        if not recording():
+            return super().fetchone()
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            fetched(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        if not recording():
+            return super().fetchmany(self.arraysize if size is None else size)
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            fetched(time.perf_counter() - started)
+
+    def fetchall(self):
+        if not recording():
+            return super().fetchall()
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            fetched(time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Pass as connect_args={'factory': TimedConnection} so every cursor is timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's shortcuts make their own plain cursors; route them through ours
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_conn, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.perf_counter() if recording() else None
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_conn, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        if started is not None:
+            CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+    pool = engine.pool
+    if hasattr(pool, 'checkedout'):
+        REGISTRY.append(Gauge('arcadia_db_connections_checked_out', 'Pooled connections in use.', pool.checkedout))
+        REGISTRY.append(Gauge('arcadia_db_connections_open', 'Connections held by the pool.',
+                              lambda: pool.checkedin() + pool.checkedout()))
+        REGISTRY.append(Gauge('arcadia_db_pool_size', 'Configured pool size (without overflow).', pool.size))
+
+
+# --- requests -----------------------------------------------------------------
+
+ENDPOINT_KEY = 'arcadia.endpoint'
+
+
+class MeteredBody:
+    """Wraps a WSGI response iterable; records the request when it is closed."""
+
+    def __init__(self, body, environ, status, started):
+        self.body = body
+        self.environ = environ
+        self.status = status
+        self.started = started
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            totals = getattr(_local, 'sql', None) or (0, 0.0)
+            _local.sql = None
+            endpoint = self.environ.get(ENDPOINT_KEY, 'unmatched')
+            method = self.environ.get('REQUEST_METHOD', '')
+            REQUEST_SECONDS.observe(time.perf_counter() - self.started, endpoint, method)
+            REQUESTS.inc(endpoint, method, self.status[0] if self.status else '')
+            RESPONSE_BYTES.observe(self.size, endpoint)
+            REQUEST_SQL.observe(totals[0], endpoint)
+            REQUEST_SQL_SECONDS.observe(totals[1], endpoint)
+
+
+def instrument_wsgi(wsgi_app):
+    def metered(environ, start_response):
+        if not recording():
+            return wsgi_app(environ, start_response)
+        started = time.perf_counter()
+        _local.sql = [0, 0.0]
+        status = []
+
+        def capture_status(status_line, headers, exc_info=None):
+            status[:] = [status_line.split(' ', 1)[0]]
+            return start_response(status_line, headers, exc_info)
+
+        return MeteredBody(wsgi_app(environ, capture_status), environ, status, started)
+    return metered
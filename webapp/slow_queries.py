@@ -0,0 +1,177 @@
+"""Slow-query recorder.
+
+Statements slower than SLOW_QUERY_MS (timed on the cursor in metrics.py)
+are normalized to a shape: literals become ?, IN lists collapse and
+whitespace is squeezed, so every sort column or filter combination the
+dashboard builds is one shape however often it runs. The first time a
+shape is slow its EXPLAIN QUERY PLAN is captured on the same connection
+and checked for full table scans and temporary sort b-trees.
+
+Each slow execution is appended as a JSON line to a rotating log
+(SLOW_QUERY_LOG); per-shape totals live in memory for /admin/slow-queries.
+Statements are attributed to the endpoint of the request running them;
+streamed response bodies keep their request context for this, and work
+handed to background threads runs through attributed().
+"""
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from flask import has_request_context, request
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# empty disables the recorder
+_threshold = os.environ.get('SLOW_QUERY_MS', '100')
+SLOW_QUERY_SECONDS = float(_threshold) / 1000.0 if _threshold.strip() else None
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', os.path.normpath(os.path.join(BASE_DIR, '..', 'logs', 'slow_queries.log')))
+SLOW_QUERY_LOG_BYTES = int(os.environ.get('SLOW_QUERY_LOG_BYTES', str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', '5'))
+SLOW_QUERY_MAX_SHAPES = 500
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW|\(subquery)(\S+)(.*)$")
+
+_shapes = {}
+_lock = threading.Lock()
+_local = threading.local()
+_logger = None
+started_at = datetime.now()
+
+
+def normalize(sql):
+    s = _STRING.sub('?', sql)
+    s = _NUMBER.sub('?', s)
+    s = _IN_LIST.sub('(?, ...)', s)
+    return _SPACE.sub(' ', s).strip()
+
+
+def param_shape(parameters, many=False):
+    if many:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f"{k}: {type(v).__name__}" for k, v in sorted(parameters.items())) + '}'
+    types = [type(v).__name__ if v is not None else 'None' for v in parameters or ()]
+    if len(types) > 12:
+        types = types[:12] + [f'+{len(types) - 12}']
+    return '(' + ', '.join(types) + ')'
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN on conn; returns (plan lines, full-scan tables, uses temp b-tree)."""
+    cur = sqlite3.Cursor(conn)  # a plain cursor, so this isn't timed and recorded itself
+    try:
+        cur.execute("EXPLAIN QUERY PLAN " + sql, parameters or ())
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    depth = {0: -1}
+    plan, scans, temp = [], [], False
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+        m = _SCAN.match(detail)
+        if m and 'VIRTUAL TABLE' not in m.group(2):
+            scans.append(m.group(1))
+        temp = temp or 'TEMP B-TREE' in detail
+    return plan, scans, temp
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint
+    return getattr(_local, 'endpoint', None)
+
+
+def attributed(endpoint, fn, *args):
+    """Call fn(*args) outside a request with its slow statements recorded under endpoint."""
+    previous = getattr(_local, 'endpoint', None)
+    _local.endpoint = endpoint
+    try:
+        return fn(*args)
+    finally:
+        _local.endpoint = previous
+
+
+def get_logger():
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger('arcadia.slow_queries')
+        logger.propagate = False
+        if not logger.handlers:
+            os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        _logger = logger
+    return _logger
+
+
+def record(conn, sql, parameters, seconds, many=False):
+    normalized = normalize(sql)
+    shape_id = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+    params = param_shape(parameters, many)
+    endpoint = current_endpoint()
+    with _lock:
+        entry = _shapes.get(shape_id)
+        new_shape = entry is None
+        if new_shape:
+            if len(_shapes) >= SLOW_QUERY_MAX_SHAPES:
+                del _shapes[min(_shapes, key=lambda k: _shapes[k]['total'])]
+            entry = _shapes[shape_id] = {
+                'id': shape_id, 'sql': normalized, 'count': 0, 'total': 0.0, 'max': 0.0,
+                'params': set(), 'endpoints': set(), 'plan': None, 'full_scans': [], 'temp_btree': False,
+                'first_seen': None, 'last_seen': None,
+            }
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        if len(entry['params']) < 8:
+            entry['params'].add(params)
+        if endpoint and len(entry['endpoints']) < 8:
+            entry['endpoints'].add(endpoint)
+        entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+        entry['first_seen'] = entry['first_seen'] or entry['last_seen']
+
+    line = {'at': entry['last_seen'], 'shape': shape_id, 'ms': round(seconds * 1000, 2),
+            'params': params, 'endpoint': endpoint}
+    if new_shape:
+        line['sql'] = normalized
+        if not many and normalized.split(' ', 1)[0].upper() in EXPLAINABLE:
+            try:
+                plan, scans, temp = explain(conn, sql, parameters)
+            except sqlite3.Error as exc:
+                plan, scans, temp = [f'EXPLAIN failed: {exc}'], [], False
+            with _lock:
+                entry.update(plan=plan, full_scans=scans, temp_btree=temp)
+            line.update(plan=plan, full_scans=scans, temp_btree=temp)
+    try:
+        get_logger().info(json.dumps(line))
+    except OSError:
+        pass
+
+
+def worst_shapes(limit=50):
+    """Recorded shapes, worst total time first, as plain dicts."""
+    with _lock:
+        shapes = [dict(e, params=sorted(e['params']), endpoints=sorted(e['endpoints'])) for e in _shapes.values()]
+    shapes.sort(key=lambda e: e['total'], reverse=True)
+    for e in shapes:
+        e['avg'] = e['total'] / e['count']
+    return shapes[:limit]
+
+
+def reset():
+    with _lock:
+        _shapes.clear()
@@ -0,0 +1,281 @@
+"""Columnar (Parquet) snapshots of sale_details and payments for analytics.
+
+Files are laid out by booking year, Hive style:
+
+    <out>/sale_details/booking_year=2025/part-0.parquet
+    <out>/payments/booking_year=2025/part-0.parquet
+
+Triggers keep a per-year change version in snapshot_versions; a snapshot
+only rewrites the years whose version moved since manifest.json was last
+written. The web app installs the triggers at startup and after every
+import (a full reload drops them with the table); whenever they had to be
+reinstalled the epoch row is bumped, because changes made meanwhile went
+unrecorded, and the next snapshot rewrites every year. Everything is read
+inside one read transaction, so the files are a consistent picture of the
+database at a single point in time. Partitions are streamed to Parquet in
+row groups of BATCH_ROWS, so memory does not grow with the size of a year.
+
+pyarrow is optional: the rest of the app works without it.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.environ.get('ARCADIA_DB_PATH') or os.path.normpath(os.path.join(BASE_DIR, '..', 'arcadia_sales.db'))
+DEFAULT_OUT = os.environ.get('SNAPSHOT_DIR', os.path.normpath(os.path.join(BASE_DIR, '..', 'snapshots')))
+MANIFEST = 'manifest.json'
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+BATCH_ROWS = 50000
+# snapshot_versions row counting trigger (re)installs; not a booking year
+EPOCH = '*'
+
+# Partition key; the triggers and the partition queries must agree on it
+YEAR_EXPR = "COALESCE(substr({}.booking_date, 1, 4), '')"
+
+SALE_FIELDS = [
+    ('sale_rowid', 'int'), ('s_no', 'int'), ('booking_date', 'date'), ('project', 'str'),
+    ('spg_praneeth', 'str'), ('token', 'int'), ('buyer_name', 'str'), ('sol', 'str'),
+    ('type_of_sale', 'str'), ('land_sqyards', 'int'), ('sbua_sqft', 'float'), ('facing', 'str'),
+    ('base_sqft_price', 'float'), ('amenties_and_premiums', 'float'), ('total_sale_price', 'float'),
+    ('amount_received', 'float'), ('balance_amount', 'float'),
+    ('balance_tobe_received_by_plan_approval', 'float'), ('notes', 'str'),
+    ('balance_tobe_received_during_exec', 'float'), ('sale_person_name', 'str'), ('crm_name', 'str'),
+]
+PAYMENT_FIELDS = [
+    ('id', 'int'), ('sale_rowid', 'int'), ('paid_date', 'date'), ('amount', 'float'), ('note', 'str'),
+]
+
+SALE_QUERY = (
+    "SELECT s.rowid, " + ", ".join(f"s.{name}" for name, _ in SALE_FIELDS[1:]) +
+    f" FROM sale_details s WHERE {YEAR_EXPR.format('s')} = ? ORDER BY s.rowid"
+)
+PAYMENT_QUERY = (
+    "SELECT " + ", ".join(f"p.{name}" for name, _ in PAYMENT_FIELDS) +
+    " FROM payments p JOIN sale_details s ON s.rowid = p.sale_rowid"
+    f" WHERE {YEAR_EXPR.format('s')} = ? ORDER BY p.id"
+)
+
+VERSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS snapshot_versions (
+    booking_year TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+)
+"""
+# A payment whose sale is already gone has no year; its sale's delete bumped it
+BUMP_SQL = ("INSERT INTO snapshot_versions(booking_year, version) SELECT y, 1 FROM (SELECT {} AS y) WHERE y IS NOT NULL "
+            "ON CONFLICT(booking_year) DO UPDATE SET version = version + 1;")
+SALE_YEAR = "(SELECT " + YEAR_EXPR.format('sale_details') + " FROM sale_details WHERE rowid = {}.sale_rowid)"
+TRIGGERS = {
+    'trg_snapshot_sale_insert': ("AFTER INSERT ON sale_details", [YEAR_EXPR.format('NEW')]),
+    'trg_snapshot_sale_update': ("AFTER UPDATE ON sale_details", [YEAR_EXPR.format('OLD'), YEAR_EXPR.format('NEW')]),
+    'trg_snapshot_sale_delete': ("AFTER DELETE ON sale_details", [YEAR_EXPR.format('OLD')]),
+    'trg_snapshot_payment_insert': ("AFTER INSERT ON payments", [SALE_YEAR.format('NEW')]),
+    'trg_snapshot_payment_update': ("AFTER UPDATE ON payments", [SALE_YEAR.format('OLD'), SALE_YEAR.format('NEW')]),
+    'trg_snapshot_payment_delete': ("AFTER DELETE ON payments", [SALE_YEAR.format('OLD')]),
+}
+
+_snapshot_lock = threading.Lock()
+
+
+class SnapshotUnavailable(RuntimeError):
+    pass
+
+
+def install_change_tracking(cur):
+    """Create snapshot_versions and its triggers; returns True if any trigger was missing.
+
+    Missing triggers mean changes may have gone unrecorded (a full reload of
+    sale_details drops them), so the epoch is bumped and the next snapshot
+    rewrites every partition. Runs in the caller's transaction.
+    """
+    cur.execute(VERSIONS_SQL)
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_snapshot_%'")
+    existing = {r[0] for r in cur.fetchall()}
+    missing = False
+    for name, (event, years) in TRIGGERS.items():
+        if event.rsplit(' ', 1)[1] not in tables or name in existing:
+            continue
+        body = " ".join(BUMP_SQL.format(y) for y in years)
+        cur.execute(f"CREATE TRIGGER {name} {event} BEGIN {body} END")
+        missing = True
+    if missing:
+        cur.execute(BUMP_SQL.format('?').rstrip(';'), (EPOCH,))
+    return missing
+
+
+def ensure_change_tracking(conn):
+    missing = install_change_tracking(conn.cursor())
+    conn.commit()
+    return missing
+
+
+def partition_dir(year):
+    if not year:
+        return f"booking_year={NULL_PARTITION}"
+    return "booking_year=" + re.sub(r'[^0-9A-Za-z_-]', '_', year)
+
+
+def to_int(v):
+    try:
+        return int(float(v)) if v is not None and v != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(v):
+    try:
+        return float(v) if v is not None and v != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_date(v):
+    try:
+        return datetime.strptime(str(v)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def to_str(v):
+    return None if v is None else str(v)
+
+
+CONVERTERS = {'int': to_int, 'float': to_float, 'date': to_date, 'str': to_str}
+
+
+def arrow_schema(pa, fields):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'date': pa.date32(), 'str': pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in fields])
+
+
+def write_table(pa, pq, path, fields, cur):
+    """Write the rows of cur's current query to path atomically; returns the row count.
+
+    Rows are fetched BATCH_ROWS at a time, converted from SQLite values to
+    typed columns and written as one row group each. cur=None writes an
+    empty file with the schema.
+    """
+    schema = arrow_schema(pa, fields)
+    converters = [CONVERTERS[kind] for _, kind in fields]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    count = 0
+    with pq.ParquetWriter(tmp, schema, compression='zstd') as writer:
+        while True:
+            rows = cur.fetchmany(BATCH_ROWS) if cur is not None else None
+            if not rows:
+                break
+            columns = [[convert(r[i]) for r in rows] for i, convert in enumerate(converters)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(rows)
+    os.replace(tmp, path)
+    return count
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_snapshot(conn, out_dir=DEFAULT_OUT, full=False):
+    """Bring the Parquet snapshot in out_dir up to date; returns a summary dict.
+
+    conn is a sqlite3 (or pooled DB-API) connection to the sales database.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SnapshotUnavailable("Parquet snapshots need pyarrow (pip install pyarrow)")
+
+    with _snapshot_lock:
+        started = time.perf_counter()
+        ensure_change_tracking(conn)
+        manifest = read_manifest(out_dir)
+        cur = conn.cursor()
+        written, partitions = [], {}
+        # One read transaction: every file reflects the same database state
+        cur.execute("BEGIN")
+        try:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payments'")
+            has_payments = cur.fetchone() is not None
+            cur.execute("SELECT booking_year, version FROM snapshot_versions")
+            versions = dict(cur.fetchall())
+            epoch = versions.get(EPOCH, 0)
+            full = full or manifest.get('epoch') != epoch
+            previous = {} if full else manifest.get('partitions', {})
+            cur.execute(f"SELECT DISTINCT {YEAR_EXPR.format('sale_details')} FROM sale_details")
+            years = sorted(r[0] for r in cur.fetchall())
+            for year in years:
+                version = versions.get(year, 0)
+                entry = previous.get(year)
+                if entry and entry.get('version') == version:
+                    partitions[year] = entry
+                    continue
+                part = partition_dir(year)
+                cur.execute(SALE_QUERY, (year,))
+                sales = write_table(pa, pq, os.path.join(out_dir, 'sale_details', part, 'part-0.parquet'), SALE_FIELDS, cur)
+                if has_payments:
+                    cur.execute(PAYMENT_QUERY, (year,))
+                payments = write_table(pa, pq, os.path.join(out_dir, 'payments', part, 'part-0.parquet'), PAYMENT_FIELDS,
+                                       cur if has_payments else None)
+                partitions[year] = {'version': version, 'sale_details': sales, 'payments': payments}
+                written.append(year)
+        finally:
+            conn.commit()
+
+        # Years that no longer have any sales
+        removed = [y for y in manifest.get('partitions', {}) if y not in partitions]
+        for year in removed:
+            for table in ('sale_details', 'payments'):
+                path = os.path.join(out_dir, table, partition_dir(year), 'part-0.parquet')
+                if os.path.exists(path):
+                    os.remove(path)
+                    try:
+                        os.rmdir(os.path.dirname(path))
+                    except OSError:
+                        pass
+
+        manifest = {'created_at': datetime.now().isoformat(timespec='seconds'), 'epoch': epoch, 'partitions': partitions}
+        tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+        os.makedirs(out_dir, exist_ok=True)
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        os.replace(tmp, os.path.join(out_dir, MANIFEST))
+        return {
+            'out_dir': out_dir,
+            'written': written,
+            'removed': removed,
+            'unchanged': len(partitions) - len(written),
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write a Parquet snapshot of sale_details and payments.")
+    parser.add_argument('--db', default=DEFAULT_DB, help="SQLite database path (default: %(default)s)")
+    parser.add_argument('--out', default=DEFAULT_OUT, help="snapshot directory (default: %(default)s)")
+    parser.add_argument('--full', action='store_true', help="rewrite every partition, not just changed ones")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = sqlite3.connect(args.db)
+    try:
+        result = write_snapshot(conn, args.out, args.full)
+    finally:
+        conn.close()
+    print(f"Snapshot at {result['out_dir']}: {len(result['written'])} partitions written, "
+          f"{result['unchanged']} unchanged, {len(result['removed'])} removed in {result['seconds']:.2f}s")
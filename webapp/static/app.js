@@ -214,6 +214,34 @@ function initCrmForm(){
   });
 }
 
+// Background exports: submit the job, poll its progress, then download
+function initExportJobs(){
+  const status = document.querySelector('.export-status');
+  document.querySelectorAll('[data-export-job]').forEach(btn=>{
+    btn.addEventListener('click', async ()=>{
+      btn.disabled = true;
+      try{
+        let res = await fetch(btn.getAttribute('data-export-job'), { method:'POST', headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+        let job = await res.json();
+        while(job.status === 'queued' || job.status === 'running'){
+          if (status) status.textContent = job.total ? `Exporting… ${formatNumber(job.rows)} of ${formatNumber(job.total)} rows` : 'Export queued…';
+          await new Promise(r=> setTimeout(r, 1000));
+          res = await fetch(job.status_url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+          job = await res.json();
+        }
+        if (job.status === 'done'){
+          if (status) status.textContent = `Export ready (${formatNumber(job.rows)} rows)`;
+          window.location.href = job.download_url;
+        } else if (status){
+          status.textContent = `Export failed: ${job.error || 'unknown error'}`;
+        }
+      } finally {
+        btn.disabled = false;
+      }
+    });
+  });
+}
+
 // Format any plain number currency placeholders in tables
 function formatCurrencyNodes(){
   const nodes = document.querySelectorAll('.currency[data-value]');